@@ -0,0 +1,357 @@
+"""
+Offline batch scoring - re-score a whole patient file without the HTTP service
+
+The input (CSV, NDJSON, Parquet or Excel) is read in chunks and sharded
+across a pool of worker processes; each worker loads the models once and
+runs the same validation -> prakriti inference -> model -> clinical rules
+pipeline as /api/model/predict/batch. Every chunk is written as its own
+part file (part-000000.parquet, ...) and recorded in _checkpoint.json, so a
+killed job picks up where it stopped when run again.
+
+Usage:
+    python batch_score.py patients.csv --output scores/ --workers 4
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+from pydantic import ValidationError
+
+try:
+    from .config import ALLOWED_KEYS, BATCH_SCORE_WORKERS, BATCH_SCORE_CHUNK_SIZE
+    from .schemas import PatientInput, format_validation_errors
+    from .model_loader import model_loader
+    from .registry import model_registry
+    from .clinical_safety import ClinicalSafetyChecker
+    from .streaming import csv_row
+except ImportError:
+    from config import ALLOWED_KEYS, BATCH_SCORE_WORKERS, BATCH_SCORE_CHUNK_SIZE
+    from schemas import PatientInput, format_validation_errors
+    from model_loader import model_loader
+    from registry import model_registry
+    from clinical_safety import ClinicalSafetyChecker
+    from streaming import csv_row
+
+logger = logging.getLogger("batch_score")
+
+CHECKPOINT_NAME = "_checkpoint.json"
+OUTPUT_FORMATS = {'parquet': 'parquet', 'csv': 'csv', 'ndjson': 'ndjson'}
+
+# Per-process safety checker, compiled in the worker initializer
+safety_checker = ClinicalSafetyChecker()
+
+
+class CheckpointMismatchError(RuntimeError):
+    """Raised when an output directory holds a checkpoint from a different job"""
+
+
+def parquet_available() -> bool:
+    return any(importlib.util.find_spec(engine) for engine in ('pyarrow', 'fastparquet'))
+
+
+def read_chunks(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Yield the input as DataFrames of chunk_size rows"""
+    suffix = path.suffix.lower()
+    if suffix in ('.csv', '.tsv'):
+        # Read as text and let the patient schema coerce, like the streaming endpoint
+        yield from pd.read_csv(
+            path, sep='\t' if suffix == '.tsv' else ',', dtype=str,
+            keep_default_na=False, chunksize=chunk_size
+        )
+    elif suffix in ('.ndjson', '.jsonl'):
+        yield from pd.read_json(path, lines=True, dtype=False, chunksize=chunk_size)
+    elif suffix in ('.parquet', '.pq'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif suffix in ('.xlsx', '.xls'):
+        # Excel cannot be read incrementally - load once, then slice
+        frame = pd.read_excel(path)
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start:start + chunk_size]
+    else:
+        raise ValueError(f"Unsupported input format: {path.suffix} (use .csv, .tsv, .ndjson, .jsonl, .parquet or .xlsx)")
+
+
+def frame_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Rows as patient dicts - missing cells dropped, dotted columns nested"""
+    columns = [str(column) for column in frame.columns]
+    return [csv_row(columns, values) for values in frame.itertuples(index=False, name=None)]
+
+
+def _init_worker(version: Optional[str], ayur_path: str, prakriti_path: str, threads: int):
+    """Pool initializer - load the resolved models and rules once per worker"""
+    logging.basicConfig(level=logging.WARNING)
+    model_loader.initialize(Path(ayur_path), Path(prakriti_path), version)
+    if threads > 0:
+        model_loader.limit_threads(threads)
+    safety_checker.load_rules()
+
+
+def score_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Validate and score patient dicts - one result per record, in order"""
+    results: List[Dict[str, Any]] = [None] * len(records)
+    valid_indices, rows = [], []
+    for i, record in enumerate(records):
+        try:
+            rows.append(PatientInput.model_validate(record).model_dump(exclude_none=True))
+            valid_indices.append(i)
+        except ValidationError as e:
+            results[i] = {"status": "error", "errors": json.dumps(format_validation_errors(e))}
+    
+    pending = [i for i, row in enumerate(rows) if 'prakriti_assessment' in row and not row.get('prakriti')]
+    if pending:
+        outputs = model_loader.predict_prakriti_batch([rows[i]['prakriti_assessment'] for i in pending])
+        for i, prakriti_output in zip(pending, outputs):
+            rows[i]['prakriti'] = prakriti_output['prakriti']
+    
+    rows = [{k: v for k, v in row.items() if k in ALLOWED_KEYS} for row in rows]
+    model_outputs = model_loader.predict_batch(rows)
+    batch_warnings = safety_checker.check_safety_batch(rows)
+    
+    for i, row, model_output, warnings in zip(valid_indices, rows, model_outputs, batch_warnings):
+        result = {
+            "status": "ok",
+            "prakriti": row.get('prakriti'),
+            "pred_label": model_output['pred_label'],
+            "pred_score": model_output['pred_score'],
+        }
+        for label, probability in (model_output['pred_proba'] or {}).items():
+            result[f"proba_{label}"] = probability
+        result["warnings"] = json.dumps(warnings)
+        results[i] = result
+    return results
+
+
+def write_part(frame: pd.DataFrame, path: Path, fmt: str):
+    """Write one part file atomically, so a kill never leaves a truncated part"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    if fmt == 'parquet':
+        frame.to_parquet(tmp_path, index=False)
+    elif fmt == 'csv':
+        frame.to_csv(tmp_path, index=False)
+    else:
+        frame.to_json(tmp_path, orient='records', lines=True)
+    os.replace(tmp_path, path)
+
+
+def result_frame(first_row: int, results: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Results as a part frame with the job-wide schema
+    
+    Columns and dtypes are fixed, so an all-error chunk or one without errors
+    writes a part that reads back together with every other part.
+    """
+    dtypes = {"row": "int64", "status": "string", "prakriti": "string", "pred_label": "string", "pred_score": "float64"}
+    dtypes.update({f"proba_{key}": "float64" for key in (model_loader.class_keys or [])})
+    dtypes.update({"warnings": "string", "errors": "string"})
+    frame = pd.DataFrame([{"row": first_row + i, **result} for i, result in enumerate(results)])
+    frame = frame.reindex(columns=list(dtypes) + [c for c in frame.columns if c not in dtypes])
+    return frame.astype(dtypes)
+
+
+def _score_chunk(chunk_id: int, first_row: int, records: List[Dict[str, Any]], path: str, fmt: str) -> Dict[str, int]:
+    """Worker task - score one chunk and write its part file"""
+    start = time.perf_counter()
+    results = score_records(records)
+    frame = result_frame(first_row, results)
+    write_part(frame, Path(path), fmt)
+    
+    succeeded = int((frame["status"] == "ok").sum())
+    return {
+        "rows": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+
+class BatchScoringJob:
+    """Shard an input file across scoring workers with a resumable checkpoint"""
+    
+    def __init__(
+        self,
+        input_path: Path,
+        output_dir: Path,
+        workers: int = BATCH_SCORE_WORKERS,
+        chunk_size: int = BATCH_SCORE_CHUNK_SIZE,
+        fmt: Optional[str] = None,
+        threads_per_worker: Optional[int] = None,
+        restart: bool = False
+    ):
+        self.input_path = Path(input_path)
+        self.output_dir = Path(output_dir)
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        if fmt is None:
+            fmt = 'parquet' if parquet_available() else 'csv'
+            if fmt != 'parquet':
+                logger.warning("pyarrow/fastparquet not installed - writing CSV parts instead of Parquet")
+        elif fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {fmt}")
+        elif fmt == 'parquet' and not parquet_available():
+            raise ValueError("Parquet output needs pyarrow or fastparquet - install one or pass --format csv")
+        self.fmt = fmt
+        # Workers share the CPUs, so each gets a slice of XGBoost's threads
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.restart = restart
+        self.checkpoint_path = self.output_dir / CHECKPOINT_NAME
+    
+    def part_path(self, chunk_id: int) -> Path:
+        return self.output_dir / f"part-{chunk_id:06d}.{OUTPUT_FORMATS[self.fmt]}"
+    
+    def _job_spec(self, model_token: str) -> Dict[str, Any]:
+        """Everything that must match for a checkpoint to be resumed"""
+        stat = self.input_path.stat()
+        return {
+            "input": str(self.input_path.resolve()),
+            "input_size": stat.st_size,
+            "input_mtime_ns": stat.st_mtime_ns,
+            "chunk_size": self.chunk_size,
+            "format": self.fmt,
+            "model_token": model_token
+        }
+    
+    def _load_checkpoint(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        """Completed chunks from a previous run of the same job"""
+        if self.restart:
+            for path in self.output_dir.glob("part-*"):
+                path.unlink()
+            self.checkpoint_path.unlink(missing_ok=True)
+        
+        if not self.checkpoint_path.exists():
+            return {**spec, "completed": {}}
+        
+        with open(self.checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        changed = [key for key, value in spec.items() if checkpoint.get(key) != value]
+        if changed:
+            raise CheckpointMismatchError(
+                f"{self.checkpoint_path} belongs to a different job ({', '.join(changed)} changed) - "
+                f"use --restart or another output directory"
+            )
+        # A part listed without its file is scored again
+        checkpoint["completed"] = {
+            chunk_id: counts for chunk_id, counts in checkpoint.get("completed", {}).items()
+            if self.part_path(int(chunk_id)).exists()
+        }
+        return checkpoint
+    
+    def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+        tmp_path = self.checkpoint_path.with_name(CHECKPOINT_NAME + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+    
+    def run(self) -> Dict[str, Any]:
+        """Score every chunk not already in the checkpoint; returns job totals"""
+        start = time.perf_counter()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Resolve once in the parent so every worker loads exactly the same model files,
+        # and check the checkpoint against the token the service's cache uses for them
+        version, ayur_path, prakriti_path = model_registry.resolve()
+        model_loader.initialize(ayur_path, prakriti_path, version)
+        checkpoint = self._load_checkpoint(self._job_spec(model_loader.model_token))
+        completed = checkpoint["completed"]
+        skipped = len(completed)
+        if skipped:
+            logger.info(f"Resuming - {skipped} chunks already scored in {self.output_dir}")
+        
+        # spawn, not fork: the parent may already have started XGBoost's OpenMP threads
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(version, str(ayur_path), str(prakriti_path), self.threads_per_worker)
+        )
+        in_flight = {}
+        
+        def collect():
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_id = in_flight.pop(future)
+                completed[str(chunk_id)] = future.result()
+                self._save_checkpoint(checkpoint)
+                logger.info(f"Chunk {chunk_id} done - {completed[str(chunk_id)]['rows']} rows, {len(completed)} chunks complete")
+        
+        try:
+            chunk_id = -1
+            for chunk_id, frame in enumerate(read_chunks(self.input_path, self.chunk_size)):
+                if str(chunk_id) in completed:
+                    continue
+                in_flight[pool.submit(
+                    _score_chunk, chunk_id, chunk_id * self.chunk_size, frame_records(frame),
+                    str(self.part_path(chunk_id)), self.fmt
+                )] = chunk_id
+                # Bound reads ahead of the workers so memory stays at a few chunks
+                while len(in_flight) >= 2 * self.workers:
+                    collect()
+            while in_flight:
+                collect()
+        finally:
+            for future in in_flight:
+                future.cancel()
+            pool.shutdown(wait=True, cancel_futures=True)
+        
+        checkpoint["total_chunks"] = chunk_id + 1
+        checkpoint["complete"] = True
+        self._save_checkpoint(checkpoint)
+        
+        summary = {
+            "output": str(self.output_dir),
+            "format": self.fmt,
+            "model_token": model_loader.model_token,
+            "chunks": chunk_id + 1,
+            "skipped_chunks": skipped,
+            "rows": sum(counts["rows"] for counts in completed.values()),
+            "succeeded": sum(counts["succeeded"] for counts in completed.values()),
+            "failed": sum(counts["failed"] for counts in completed.values()),
+            "elapsed_seconds": round(time.perf_counter() - start, 3)
+        }
+        logger.info(f"Batch scoring complete - {summary['rows']} rows ({summary['failed']} failed) in {summary['elapsed_seconds']}s")
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a patient file offline with the Ayutra models")
+    parser.add_argument('input', type=Path, help="CSV, TSV, NDJSON, Parquet or Excel file with one patient per row")
+    parser.add_argument('--output', '-o', type=Path, default=None, help="Output directory (default: <input>_scores/)")
+    parser.add_argument('--workers', type=int, default=BATCH_SCORE_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=BATCH_SCORE_CHUNK_SIZE, help="Rows per part file")
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), default=None,
+                        help="Part file format (default: parquet when pyarrow is installed, else csv)")
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--restart', action='store_true', help="Discard an existing checkpoint and score everything again")
+    args = parser.parse_args(argv)
+    
+    output_dir = args.output or args.input.with_name(f"{args.input.stem}_scores")
+    try:
+        job = BatchScoringJob(
+            args.input, output_dir, workers=args.workers, chunk_size=args.chunk_size,
+            fmt=args.format, threads_per_worker=args.threads_per_worker, restart=args.restart
+        )
+        summary = job.run()
+    except (CheckpointMismatchError, ValueError, FileNotFoundError) as e:
+        logger.error(str(e))
+        return 2
+    
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    sys.exit(main())
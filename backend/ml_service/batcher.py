@@ -0,0 +1,141 @@
+"""
+Micro-batching scheduler that coalesces concurrent single-patient predictions
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .config import MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS
+    from .executor import InferenceExecutor, inference_executor
+    from .metrics import Histogram
+except ImportError:
+    from config import MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS
+    from executor import InferenceExecutor, inference_executor
+    from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+WAIT_TIME_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+class MicroBatcher:
+    """
+    Collect concurrent predict() calls and run them as one predict_batch()
+    
+    `method` names the ModelLoader batch method to call (one row in, one
+    output out, in order). A batch is dispatched when it reaches max_batch_size rows or when the
+    oldest row has waited max_wait_ms, whichever comes first.
+    """
+    
+    def __init__(
+        self,
+        executor: InferenceExecutor,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        method: str = 'predict_batch',
+        metric_prefix: str = 'micro_batch'
+    ):
+        self.executor = executor
+        self.method = method
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batch_size = Histogram(
+            f"{metric_prefix}_size", f"Rows per dispatched {method} micro-batch", BATCH_SIZE_BUCKETS
+        )
+        self.wait_time = Histogram(
+            f"{metric_prefix}_wait_seconds", f"Time a row waited before its {method} batch was dispatched", WAIT_TIME_BUCKETS
+        )
+    
+    async def submit(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue one sanitized input and wait for its model output"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, future, time.perf_counter()))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """Dispatch everything queued so far as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        items, self._pending = self._pending, []
+        if not items:
+            return
+        
+        task = asyncio.ensure_future(self._run(items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, items: List[Tuple[Dict[str, Any], asyncio.Future, float]]):
+        dispatched_at = time.perf_counter()
+        self.batch_size.observe(len(items))
+        for _, _, enqueued_at in items:
+            self.wait_time.observe(dispatched_at - enqueued_at)
+        
+        try:
+            outputs = await self.executor.run(self.method, [data for data, _, _ in items])
+        except Exception as e:
+            # Every waiter sees the same failure (saturation, timeout, model error)
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future, _), output in zip(items, outputs):
+            # Callers that disconnected have cancelled their futures
+            if not future.done():
+                future.set_result(output)
+    
+    @property
+    def queued(self) -> int:
+        """Rows waiting for the next dispatch"""
+        return len(self._pending)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Batch size and wait-time histograms"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queued": self.queued,
+            "batch_size": self.batch_size.snapshot(),
+            "wait_seconds": self.wait_time.snapshot()
+        }
+
+
+# Global micro-batcher instance
+micro_batcher = MicroBatcher(
+    inference_executor,
+    max_batch_size=MICRO_BATCH_MAX_SIZE,
+    max_wait_ms=MICRO_BATCH_MAX_WAIT_MS
+)
+
+# Prakriti inference shares the executor but batches separately
+prakriti_batcher = MicroBatcher(
+    inference_executor,
+    max_batch_size=MICRO_BATCH_MAX_SIZE,
+    max_wait_ms=MICRO_BATCH_MAX_WAIT_MS,
+    method='predict_prakriti_batch',
+    metric_prefix='prakriti_micro_batch'
+)
+
+# Explanations batch among themselves, so they never join (and slow) a prediction batch
+explain_batcher = MicroBatcher(
+    inference_executor,
+    max_batch_size=MICRO_BATCH_MAX_SIZE,
+    max_wait_ms=MICRO_BATCH_MAX_WAIT_MS,
+    method='explain_batch',
+    metric_prefix='explain_micro_batch'
+)
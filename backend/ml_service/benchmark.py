@@ -0,0 +1,607 @@
+"""
+Reproducible load and latency benchmark for the ML service
+
+Synthetic patients are drawn with a fixed seed: categorical fields from the
+category vocabularies the Ayur model was trained on, ingredient exclusions
+from the ingredient frequencies of the food workbook (it holds foods, not
+patients), numeric fields from plausible clinical ranges. Every patient
+passes PatientInput validation.
+
+Each scenario drives one target either closed-loop at a fixed concurrency
+or open-loop at a fixed arrival rate (latency then counts from the
+scheduled send time, so a slow server cannot hide queueing), and reports
+throughput, p50/p95/p99 latency, CPU time per request and RSS. Results are
+written as JSON so runs can be diffed across commits.
+
+Targets:
+    inprocess  ModelLoader.predict, called from a thread pool
+    predict    POST /api/model/predict
+    dietplan   POST /api/model/dietplan
+
+HTTP targets run against the app in this process (httpx ASGI transport)
+unless --url points at a running server; only then are CPU and RSS the
+client's rather than the service's.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --targets predict dietplan --concurrency 1 8 --rate 50 100
+    python benchmark.py --profile bench.prof     # cProfile of all threads, view with snakeviz/pstats
+    py-spy record --threads -o flame.svg -- python benchmark.py --targets dietplan
+"""
+import argparse
+import asyncio
+import cProfile
+import importlib.util
+import json
+import logging
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from .config import (
+        ALLOWED_KEYS, PRAKRITI_FEATURES, PRAKRITI_DOSHAS, MICRO_BATCH_ENABLED,
+        INFERENCE_EXECUTOR, INFERENCE_WORKERS
+    )
+    from .schemas import PatientInput
+    from .model_loader import initialize_models, model_loader
+    from .feature_encoder import CompiledFeatureEncoder
+    from .dataset_cache import load_dataset_frame
+    from .diet_planner import GENERIC_INGREDIENTS
+    from .cache import prediction_cache
+    from .metrics import now, stage_latency
+except ImportError:
+    from config import (
+        ALLOWED_KEYS, PRAKRITI_FEATURES, PRAKRITI_DOSHAS, MICRO_BATCH_ENABLED,
+        INFERENCE_EXECUTOR, INFERENCE_WORKERS
+    )
+    from schemas import PatientInput
+    from model_loader import initialize_models, model_loader
+    from feature_encoder import CompiledFeatureEncoder
+    from dataset_cache import load_dataset_frame
+    from diet_planner import GENERIC_INGREDIENTS
+    from cache import prediction_cache
+    from metrics import now, stage_latency
+
+logger = logging.getLogger("benchmark")
+
+TARGETS = {
+    'inprocess': None,
+    'predict': '/api/model/predict',
+    'dietplan': '/api/model/dietplan'
+}
+
+# Used only when the model exposes no vocabulary for a required field
+DEFAULT_VOCABULARIES = {
+    'gender': ['female', 'male'],
+    'diet_type': ['veg', 'non-veg', 'vegan', 'eggetarian'],
+    'prakriti': ['vata', 'pitta', 'kapha', 'vata-pitta', 'pitta-kapha', 'vata-kapha', 'tridoshic']
+}
+
+# Share of patients with each condition (obesity follows from BMI, PCOD/PCOS is female-only)
+CONDITION_PREVALENCE = {
+    'has_diabetes': 0.12, 'has_hypertension': 0.20, 'has_dyslipidemia': 0.12,
+    'has_acidity_reflux': 0.15, 'has_ckd': 0.03, 'has_celiac': 0.02, 'has_ibs_ibd': 0.06,
+    'has_nafld': 0.08, 'has_thyroid': 0.10, 'has_pcod_pcos': 0.15
+}
+
+# Continent for each country the model knows - patient_region only applies to India
+COUNTRY_CONTINENTS = {
+    'Australia': 'Australia', 'India': 'Asia', 'Japan': 'Asia', 'UAE': 'Asia',
+    'UK': 'Europe', 'USA': 'North America'
+}
+
+# Share of patients answering the prakriti questionnaire instead of giving prakriti
+ASSESSMENT_SHARE = 0.15
+
+
+def model_vocabularies(loader) -> Dict[str, List[str]]:
+    """Category values per request key, as seen by the Ayur model in training"""
+    encoder = loader.feature_encoder
+    if encoder is None and loader.is_pipeline:
+        encoder = CompiledFeatureEncoder.from_column_transformer(loader.ayur_model.steps[0][1])
+    
+    vocabularies = {}
+    if encoder is not None:
+        pairs = [(key, list(positions)) for key, positions in encoder.onehot]
+        pairs += [(key, list(codes)) for key, _, codes in encoder.label]
+        for key, categories in pairs:
+            values = sorted(str(c) for c in categories if str(c) not in ('unknown', 'nan', ''))
+            if key in ALLOWED_KEYS and values:
+                vocabularies[key] = values
+    
+    for key, values in DEFAULT_VOCABULARIES.items():
+        vocabularies.setdefault(key, values)
+    return vocabularies
+
+
+def ingredient_frequencies(limit: int = 200) -> Dict[str, int]:
+    """Most common raw materials in the food workbook, with their food counts"""
+    try:
+        frame = load_dataset_frame()
+    except Exception as e:
+        logger.warning(f"Food workbook unavailable - patients get no ingredient exclusions: {e}")
+        return {}
+    
+    counts = Counter()
+    for text in frame['raw_materials'].dropna():
+        if str(text) not in GENERIC_INGREDIENTS:
+            counts.update({item.strip().lower() for item in str(text).split(',') if item.strip()})
+    return dict(counts.most_common(limit))
+
+
+class PatientGenerator:
+    """Seeded synthetic patients that pass PatientInput validation"""
+    
+    def __init__(self, vocabularies: Dict[str, List[str]], ingredients: Dict[str, int], seed: int = 0):
+        self.vocabularies = vocabularies
+        self.ingredients = list(ingredients)
+        counts = np.array(list(ingredients.values()), dtype=np.float64)
+        self.ingredient_weights = counts / counts.sum() if len(counts) else counts
+        self.rng = np.random.default_rng(seed)
+    
+    def choice(self, key: str) -> Optional[str]:
+        values = self.vocabularies.get(key)
+        return str(self.rng.choice(values)) if values else None
+    
+    def patient(self) -> Dict[str, Any]:
+        rng = self.rng
+        gender = self.choice('gender')
+        child = gender == 'child'
+        
+        age = int(rng.integers(6, 18)) if child else int(rng.integers(18, 81))
+        height = float(np.clip(rng.normal(135, 15) if child else rng.normal(165, 9), 100, 205))
+        bmi = float(np.clip(rng.normal(17, 2.5) if child else rng.normal(25, 4.5), 13, 45))
+        weight = bmi * (height / 100) ** 2
+        diet_type = self.choice('diet_type')
+        
+        patient = {
+            'gender': gender,
+            'age': age,
+            'height_cm': round(height, 1),
+            'weight_kg': round(weight, 1),
+            'bmi': round(bmi, 1),
+            'meal_frequency_per_day': str(rng.integers(2, 6)),
+            'water_intake_liters': round(float(rng.uniform(1.0, 4.0)), 1),
+            'diet_type': diet_type,
+            'outside_food_freq_per_week': str(rng.integers(0, 8)),
+            'bowel_movements_per_day': float(rng.choice([1, 1, 1, 2, 2, 3])),
+            'sleep_hours': round(float(np.clip(rng.normal(7, 1), 4, 10)), 1),
+            'stress_level': str(rng.integers(1, 11)),
+            'physical_activity_minutes': int(rng.integers(0, 121)),
+            'daily_calories': int(np.clip(round(rng.normal(1700 if child else 2100, 350), -1), 1000, 3600))
+        }
+        for key in ('patient_country', 'snacking_habit', 'sugar_intake_level', 'vata_state', 'pitta_state',
+                    'kapha_state', 'bowel_pattern', 'activity_level', 'season', 'therapeutic_goal'):
+            value = self.choice(key)
+            if value is not None:
+                patient[key] = value
+        country = patient.get('patient_country')
+        continent = COUNTRY_CONTINENTS.get(country) or self.choice('patient_continent')
+        if continent is not None:
+            patient['patient_continent'] = continent
+        if country == 'India' and 'patient_region' in self.vocabularies:
+            patient['patient_region'] = self.choice('patient_region')
+        
+        if rng.random() < ASSESSMENT_SHARE:
+            patient['prakriti_assessment'] = {key: str(rng.choice(PRAKRITI_DOSHAS)) for key in PRAKRITI_FEATURES}
+        else:
+            patient['prakriti'] = self.choice('prakriti')
+        
+        for key, share in CONDITION_PREVALENCE.items():
+            patient[key] = bool(rng.random() < share)
+        patient['has_obesity'] = bmi >= 30
+        patient['has_pcod_pcos'] &= gender == 'female'
+        
+        patient['fasting_blood_sugar_mg_dl'] = round(float(rng.normal(150, 30) if patient['has_diabetes'] else rng.normal(92, 10)))
+        systolic = rng.normal(142, 12) if patient['has_hypertension'] else rng.normal(118, 10)
+        patient['systolic_bp'] = round(float(systolic))
+        patient['diastolic_bp'] = round(float(systolic * 0.65 + rng.normal(0, 5)))
+        patient['waist_circumference_cm'] = round(float(height * (0.32 + bmi * 0.0075) + rng.normal(0, 4)), 1)
+        
+        # Preferences follow the diet and conditions, so the contradiction checks pass
+        patient['vegan'] = diet_type == 'vegan'
+        patient['vegetarian'] = diet_type in ('veg', 'vegan')
+        patient['gluten_free'] = patient['has_celiac'] or bool(rng.random() < 0.05)
+        patient['diabetic_friendly'] = patient['has_diabetes'] or bool(rng.random() < 0.03)
+        patient['low_sodium'] = patient['has_hypertension'] and bool(rng.random() < 0.5)
+        patient['nut_free'] = bool(rng.random() < 0.04)
+        patient['dairy_free'] = patient['vegan'] or bool(rng.random() < 0.05)
+        patient['ketogenic'] = bool(rng.random() < 0.02)
+        
+        excluded = 0 if rng.random() < 0.6 else int(rng.integers(1, 4))
+        if excluded and self.ingredients:
+            picks = rng.choice(len(self.ingredients), size=excluded, replace=False, p=self.ingredient_weights)
+            patient['exclude_ingredients'] = [self.ingredients[i] for i in picks]
+        
+        return patient
+    
+    def patients(self, n: int) -> List[Dict[str, Any]]:
+        return [self.patient() for _ in range(n)]
+
+
+def sanitize(patient: Dict[str, Any]) -> Dict[str, Any]:
+    """What the predict endpoint passes to the model for this request"""
+    data = PatientInput.model_validate(patient).model_dump(exclude_none=True)
+    return {k: v for k, v in data.items() if k in ALLOWED_KEYS}
+
+
+class ThreadProfiler:
+    """
+    cProfile across the calling thread and every thread started while it runs
+    
+    cProfile hooks a single thread, but inference runs on executor threads -
+    each new thread gets its own profiler and the stats are merged.
+    """
+    
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+    
+    def _hook(self, *args):
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        # Replaces this hook for the current thread
+        profile.enable()
+    
+    def start(self):
+        threading.setprofile(self._hook)
+        self._hook()
+    
+    def stop(self, path: Path) -> pstats.Stats:
+        threading.setprofile(None)
+        self.profiles[0].disable()
+        stats = pstats.Stats(*self.profiles)
+        stats.dump_stats(str(path))
+        return stats
+
+
+def rss_mb() -> Optional[float]:
+    """Current resident set size (Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+
+def stage_totals() -> Dict[str, list]:
+    """[seconds, count] per request stage, from the service's stage histogram"""
+    totals = {}
+    for suffix, labels, value in stage_latency.samples():
+        if suffix in ('_sum', '_count'):
+            totals.setdefault(labels['stage'], [0.0, 0])[suffix == '_count'] = value
+    return totals
+
+
+def git_revision() -> Dict[str, Any]:
+    cwd = Path(__file__).resolve().parent
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=cwd, capture_output=True, text=True, timeout=10)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=cwd,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit.stdout.strip() or None, "dirty": bool(status.stdout.strip())}
+
+
+async def drive(
+    call: Callable[[Any], Awaitable[bool]],
+    payloads: List[Any],
+    concurrency: int,
+    duration: float,
+    rate: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Send payloads for duration seconds and collect latencies
+    
+    Closed loop (rate None): concurrency workers each send the next request
+    as soon as their last one returns. Open loop: requests are scheduled
+    every 1/rate seconds with at most concurrency in flight, and latency
+    counts from the scheduled time.
+    """
+    latencies: List[float] = []
+    errors = 0
+    start = now()
+    deadline = start + duration
+    
+    def record(latency: float, ok: bool):
+        nonlocal errors
+        latencies.append(latency)
+        errors += not ok
+    
+    if rate is None:
+        async def worker(index: int):
+            while now() < deadline:
+                sent = now()
+                ok = await call(payloads[index % len(payloads)])
+                record(now() - sent, ok)
+                index += concurrency
+        
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    else:
+        slots = asyncio.Semaphore(concurrency)
+        
+        async def send(payload: Any, scheduled: float):
+            async with slots:
+                ok = await call(payload)
+            record(now() - scheduled, ok)
+        
+        tasks = []
+        while True:
+            scheduled = start + len(tasks) / rate
+            if scheduled >= deadline:
+                break
+            delay = scheduled - now()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(payloads[len(tasks) % len(payloads)], scheduled)))
+        await asyncio.gather(*tasks)
+    
+    return {"latencies": latencies, "errors": errors, "elapsed": now() - start}
+
+
+def summarize(run: Dict[str, Any]) -> Dict[str, Any]:
+    latencies = np.asarray(run["latencies"]) * 1000
+    requests = len(latencies)
+    latency = None
+    if requests:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        latency = {
+            "mean": round(float(latencies.mean()), 3),
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(latencies.max()), 3)
+        }
+    return {
+        "requests": requests,
+        "errors": run["errors"],
+        "elapsed_s": round(run["elapsed"], 3),
+        "throughput_rps": round(requests / run["elapsed"], 2) if run["elapsed"] > 0 else 0.0,
+        "latency_ms": latency
+    }
+
+
+class BenchmarkRunner:
+    """Runs the scenario grid against in-process or remote targets"""
+    
+    def __init__(
+        self,
+        targets: List[str],
+        concurrency: List[int],
+        rates: List[float],
+        duration: float,
+        warmup: float,
+        patients: List[Dict[str, Any]],
+        url: Optional[str] = None
+    ):
+        self.targets = targets
+        self.concurrency = concurrency
+        self.rates = rates
+        self.duration = duration
+        self.warmup = warmup
+        self.patients = patients
+        self.url = url
+        # The in-process target takes sanitized inputs, so it skips questionnaire patients
+        self.model_inputs = [sanitize(p) for p in patients if 'prakriti_assessment' not in p]
+    
+    def scenarios(self):
+        for target in self.targets:
+            for concurrency in self.concurrency:
+                yield target, concurrency, None
+            for rate in self.rates:
+                yield target, max(self.concurrency), rate
+    
+    @property
+    def needs_http(self) -> bool:
+        return any(TARGETS[t] for t in self.targets)
+    
+    async def run(self) -> List[Dict[str, Any]]:
+        if not self.needs_http:
+            return [await self.scenario(None, target, concurrency, rate, service_local=True)
+                    for target, concurrency, rate in self.scenarios()]
+        
+        import httpx
+        app_local = self.url is None
+        if app_local:
+            try:
+                from . import main as service
+            except ImportError:
+                import main as service
+            await service.startup_event()
+            transport = httpx.ASGITransport(app=service.app)
+            client = httpx.AsyncClient(transport=transport, base_url="http://ml", timeout=60)
+        else:
+            client = httpx.AsyncClient(base_url=self.url or "http://localhost", timeout=60)
+        
+        try:
+            results = []
+            for target, concurrency, rate in self.scenarios():
+                results.append(await self.scenario(client, target, concurrency, rate, service_local=app_local or not TARGETS[target]))
+            return results
+        finally:
+            await client.aclose()
+            if app_local:
+                await service.shutdown_event()
+    
+    async def scenario(self, client, target: str, concurrency: int, rate: Optional[float], service_local: bool) -> Dict[str, Any]:
+        path = TARGETS[target]
+        pool = None
+        
+        if path is None:
+            pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='benchmark')
+            payloads = self.model_inputs
+            loop = asyncio.get_running_loop()
+            
+            async def call(payload):
+                try:
+                    await loop.run_in_executor(pool, model_loader.predict, payload)
+                    return True
+                except Exception:
+                    return False
+        else:
+            payloads = self.patients
+            
+            async def call(payload):
+                try:
+                    response = await client.post(path, json=payload)
+                except Exception:
+                    return False
+                return response.status_code == 200
+        
+        try:
+            if self.warmup > 0:
+                await drive(call, payloads[::-1], concurrency, self.warmup)
+            # Measured requests start cold - only repeats within the run hit the cache
+            prediction_cache.clear()
+            hits, misses = prediction_cache.hits, prediction_cache.misses
+            stages = stage_totals()
+            cpu = time.process_time()
+            
+            run = await drive(call, payloads, concurrency, self.duration, rate)
+            
+            cpu = time.process_time() - cpu
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True)
+        
+        result = {
+            "target": target,
+            "path": path,
+            "mode": "closed" if rate is None else "open",
+            "concurrency": concurrency,
+            "rate": rate,
+            **summarize(run)
+        }
+        requests = result["requests"]
+        result.update({
+            "cpu_scope": "service" if service_local else "client",
+            "cpu_ms_per_request": round(cpu * 1000 / requests, 3) if requests else None,
+            "rss_mb": rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+            "cache": None,
+            "stages_ms": None
+        })
+        if service_local:
+            result["cache"] = {"hits": prediction_cache.hits - hits, "misses": prediction_cache.misses - misses}
+            result["stages_ms"] = {
+                stage: {
+                    "count": count - stages.get(stage, [0.0, 0])[1],
+                    "per_request": round((total - stages.get(stage, [0.0, 0])[0]) * 1000 / requests, 4)
+                }
+                for stage, (total, count) in sorted(stage_totals().items())
+                if requests and count > stages.get(stage, [0.0, 0])[1]
+            }
+        
+        latency = result["latency_ms"] or {}
+        logger.info(
+            f"{target:9s} {result['mode']:6s} c={concurrency:<3d} rate={rate or '-'!s:6s} "
+            f"{result['throughput_rps']:8.1f} req/s  p50={latency.get('p50', 0):7.2f} "
+            f"p95={latency.get('p95', 0):7.2f} p99={latency.get('p99', 0):7.2f} ms  "
+            f"errors={result['errors']}"
+        )
+        return result
+
+
+def main(argv=None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the Ayutra ML service")
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4, 16], help="Closed-loop concurrency levels")
+    parser.add_argument('--rate', nargs='*', type=float, default=[], help="Open-loop request rates (req/s)")
+    parser.add_argument('--duration', type=float, default=5.0, help="Measured seconds per scenario")
+    parser.add_argument('--warmup', type=float, default=1.0, help="Unmeasured seconds before each scenario")
+    parser.add_argument('--patients', type=int, default=2000, help="Distinct synthetic patients")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--url', default=None, help="Benchmark a running server instead of the in-process app")
+    parser.add_argument('--output', '-o', type=Path, default=None, help="JSON results file (default: stdout)")
+    parser.add_argument('--profile', type=Path, default=None, help="Write a cProfile dump of the run to this file")
+    args = parser.parse_args(argv)
+    # Checked before loading models and generating patients, which take a while
+    if any(TARGETS[t] for t in args.targets) and importlib.util.find_spec('httpx') is None:
+        parser.error("the predict and dietplan targets need httpx - pip install -r requirements.txt, or pass --targets inprocess")
+    
+    if not model_loader.models_loaded:
+        initialize_models()
+    
+    generator = PatientGenerator(model_vocabularies(model_loader), ingredient_frequencies(), seed=args.seed)
+    runner = BenchmarkRunner(
+        args.targets, args.concurrency, args.rate, args.duration, args.warmup,
+        generator.patients(args.patients), url=args.url
+    )
+    
+    logger.info(f"Benchmarking {len(list(runner.scenarios()))} scenarios in pid {os.getpid()} (py-spy record --pid {os.getpid()})")
+    profiler = ThreadProfiler() if args.profile else None
+    if profiler is not None:
+        profiler.start()
+    try:
+        scenarios = asyncio.run(runner.run())
+    finally:
+        if profiler is not None:
+            stats = profiler.stop(args.profile)
+            logger.info(f"Wrote profile of {len(profiler.profiles)} threads to {args.profile}")
+            stats.sort_stats('tottime').print_stats(25)
+    
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "model_version": model_loader.model_version,
+            "model_token": model_loader.model_token,
+            "settings": {
+                "micro_batch": MICRO_BATCH_ENABLED,
+                "inference_executor": INFERENCE_EXECUTOR,
+                "inference_workers": INFERENCE_WORKERS,
+                "url": args.url
+            },
+            "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()}
+        },
+        "scenarios": scenarios
+    }
+    
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        args.output.write_text(text + "\n")
+        logger.info(f"Wrote {len(scenarios)} scenarios to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    # One line per request would dominate the client's own CPU time
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    main()
@@ -0,0 +1,318 @@
+"""
+Content-addressed prediction cache with LRU and TTL eviction, and single-flight
+sharing of predictions that are still being computed
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+try:
+    from .config import (
+        PREDICTION_CACHE_ENABLED, PREDICTION_CACHE_MAX_ENTRIES,
+        PREDICTION_CACHE_TTL_SECONDS, PREDICTION_CACHE_BACKEND, PREDICTION_CACHE_DIR,
+        SINGLE_FLIGHT_ENABLED
+    )
+except ImportError:
+    from config import (
+        PREDICTION_CACHE_ENABLED, PREDICTION_CACHE_MAX_ENTRIES,
+        PREDICTION_CACHE_TTL_SECONDS, PREDICTION_CACHE_BACKEND, PREDICTION_CACHE_DIR,
+        SINGLE_FLIGHT_ENABLED
+    )
+
+logger = logging.getLogger(__name__)
+
+
+class FileCacheBackend:
+    """
+    Shared cache stored as one JSON file per key
+    
+    Lets several uvicorn workers on one host share hits. Entries expire by
+    file modification time; the directory is pruned back to max_entries
+    when it grows past that bound.
+    """
+    
+    def __init__(self, directory: Path, ttl: float, max_entries: int):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+    
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def set(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(value, f)
+            tmp.replace(path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write shared cache entry: {e}")
+            tmp.unlink(missing_ok=True)
+            return
+        
+        self._writes += 1
+        if self._writes % 256 == 0:
+            self.prune()
+    
+    def touch(self, key: str):
+        """Restart an entry's TTL without rewriting it"""
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+    
+    def delete(self, key: str) -> bool:
+        try:
+            self._path(key).unlink()
+            return True
+        except OSError:
+            return False
+    
+    def prune(self):
+        """Drop expired entries, then the oldest ones beyond max_entries"""
+        try:
+            entries = sorted(
+                ((p.stat().st_mtime, p) for p in self.directory.glob('*.json')),
+                reverse=True
+            )
+        except OSError:
+            return
+        
+        cutoff = time.time() - self.ttl
+        for index, (mtime, path) in enumerate(entries):
+            if index >= self.max_entries or mtime < cutoff:
+                path.unlink(missing_ok=True)
+    
+    def clear(self):
+        for path in self.directory.glob('*.json'):
+            path.unlink(missing_ok=True)
+
+
+class PredictionCache:
+    """
+    In-process LRU + TTL cache of model output and safety warnings
+    
+    Keys combine the sanitized payload hash with the active model token, and
+    the whole cache is dropped as soon as a different model token is seen,
+    so a newly loaded model never serves stale predictions.
+    """
+    
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 3600.0,
+        backend: Optional[FileCacheBackend] = None,
+        enabled: bool = True
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.backend = backend
+        self.enabled = enabled
+        self.model_token: Optional[str] = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_writes = 0
+    
+    def _bind(self, model_token: str):
+        """Invalidate everything when the active model changes"""
+        if model_token != self.model_token:
+            if self.model_token is not None:
+                self.invalidations += 1
+                logger.info(f"Model changed ({self.model_token} -> {model_token}) - clearing prediction cache")
+            self._entries.clear()
+            self.model_token = model_token
+    
+    @staticmethod
+    def _key(payload_hash: str, model_token: str) -> str:
+        return f"{model_token}-{payload_hash}".replace('/', '_')
+    
+    def get(self, payload_hash: str, model_token: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for this payload and model, if fresh"""
+        if not self.enabled:
+            return None
+        
+        key = self._key(payload_hash, model_token)
+        now = time.monotonic()
+        
+        with self._lock:
+            self._bind(model_token)
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+        
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                self._store(key, model_token, value, now)
+                return value
+        
+        self.misses += 1
+        return None
+    
+    def set(self, payload_hash: str, model_token: str, value: Dict[str, Any]):
+        """
+        Cache a value for this payload and model
+        
+        Only get() rebinds the cache to a new model. A request that started
+        before a reload and finishes after it holds the old token, and its
+        write is dropped rather than clearing the new model's entries.
+        """
+        if not self.enabled:
+            return
+        
+        key = self._key(payload_hash, model_token)
+        if self._store(key, model_token, value, time.monotonic()) and self.backend is not None:
+            self.backend.set(key, value)
+    
+    def _store(self, key: str, model_token: str, value: Dict[str, Any], now: float) -> bool:
+        """Store under the bound model token; returns False when model_token is stale"""
+        with self._lock:
+            if self.model_token is None:
+                self.model_token = model_token
+            elif model_token != self.model_token:
+                self.stale_writes += 1
+                return False
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+    
+    def clear(self):
+        """Drop all cached entries, including the shared backend"""
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters"""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": "file" if self.backend is not None else "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "stale_writes": self.stale_writes,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else None
+        }
+
+
+class SingleFlight:
+    """
+    Share one in-flight computation between concurrent callers with the same key
+    
+    The first caller for a key starts the computation as its own task;
+    callers arriving before it finishes await that task instead of starting
+    another, and all of them get its result or exception. A caller that is
+    cancelled (e.g. the client disconnected) does not cancel the task for
+    the others. Only in-flight work is shared - finished results belong in
+    the prediction cache.
+    """
+    
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+    
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Await compute() - or the identical call already running for key"""
+        if not self.enabled:
+            return await compute()
+        
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        
+        return await asyncio.shield(task)
+    
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Retrieved here so an error nobody is still waiting for is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+    
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
+
+
+def _create_cache() -> PredictionCache:
+    backend = None
+    if PREDICTION_CACHE_ENABLED and PREDICTION_CACHE_BACKEND == 'file':
+        backend = FileCacheBackend(
+            PREDICTION_CACHE_DIR,
+            ttl=PREDICTION_CACHE_TTL_SECONDS,
+            max_entries=PREDICTION_CACHE_MAX_ENTRIES
+        )
+    return PredictionCache(
+        max_entries=PREDICTION_CACHE_MAX_ENTRIES,
+        ttl=PREDICTION_CACHE_TTL_SECONDS,
+        backend=backend,
+        enabled=PREDICTION_CACHE_ENABLED
+    )
+
+
+# Global prediction cache instance
+prediction_cache = _create_cache()
+
+# In-flight patient predictions (shared by /predict and /dietplan), prakriti inferences and explanations
+prediction_flights = SingleFlight(enabled=SINGLE_FLIGHT_ENABLED)
+prakriti_flights = SingleFlight(enabled=SINGLE_FLIGHT_ENABLED)
+explain_flights = SingleFlight(enabled=SINGLE_FLIGHT_ENABLED)
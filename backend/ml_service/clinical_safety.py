@@ -1,17 +1,146 @@
 """
 Clinical safety rules and validation
 """
-from typing import Dict, List, Any
+from functools import lru_cache
+from typing import Dict, List, Any, FrozenSet, Iterable, Optional, Tuple
 import logging
+import re
+from pathlib import Path
+
+try:
+    from .config import CLINICAL_RULES_PATH
+    from .rule_engine import ClinicalRuleEngine
+except ImportError:
+    from config import CLINICAL_RULES_PATH
+    from rule_engine import ClinicalRuleEngine
 
 logger = logging.getLogger(__name__)
 
+# Ingredient rules: (rule, patient flags enabling it, terms, phrases that contain a term but are safe).
+# Terms match whole words (plurals included), so "nut" never matches "nutmeg", "coconut" or "butternut".
+# The diet planner flags foods with the same rules, so both agree on what a meal contains.
+INGREDIENT_RULES = [
+    ('gluten', ('has_celiac', 'gluten_free'),
+     ('gluten', 'wheat', 'barley', 'rye', 'semolina', 'seitan', 'flour', 'bread', 'naan', 'pasta',
+      'noodles', 'spaghetti', 'lasagna', 'pizza', 'burger bun', 'croissant'),
+     ('gram flour', 'chickpea flour', 'rice flour', 'corn flour', 'almond flour', 'coconut flour',
+      'rice noodles')),
+    ('nuts', ('nut_free',),
+     ('nut', 'peanut', 'almond', 'cashew', 'walnut', 'pistachio', 'hazelnut', 'pecan', 'macadamia'), ()),
+    ('dairy', ('dairy_free',),
+     ('dairy', 'milk', 'cheese', 'cheesy', 'paneer', 'ghee', 'butter', 'cream', 'curd', 'yogurt'),
+     ('coconut milk', 'almond milk', 'soy milk', 'oat milk', 'rice milk', 'coconut cream',
+      'peanut butter', 'almond butter', 'cocoa butter')),
+    ('egg', ('vegan',), ('egg',), ()),
+]
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Bound on cached per-ingredient verdicts per matcher
+VERDICT_CACHE_SIZE = 4096
+
+
+def _stem(token: str) -> str:
+    """Fold simple English plurals so "peanuts" matches "peanut" """
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith(('oes', 'ches', 'shes', 'xes')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us')):
+        return token[:-1]
+    return token
+
+
+def _phrase(text: str) -> Tuple[str, ...]:
+    return tuple(_stem(t) for t in _TOKEN.findall(str(text).lower()))
+
+
+class IngredientMatcher:
+    """
+    Whole-word multi-phrase matcher compiled from the active rules and exclusions
+    
+    Every term and safe phrase is a token tuple in one lookup table, so an
+    ingredient is scanned once for all rules. A term hit is ignored when a safe
+    phrase for the same rule covers it ("coconut milk" is not dairy, but is
+    still checked for nuts). Verdicts are cached per ingredient string.
+    """
+    
+    def __init__(self, rules: Iterable[Tuple[str, Iterable[str], Iterable[str]]]):
+        # token tuple -> [(rule, is_safe_phrase)]
+        self.table: Dict[Tuple[str, ...], List[Tuple[str, bool]]] = {}
+        for rule, terms, safe in rules:
+            for text in terms:
+                self._add(text, rule, False)
+            for text in safe:
+                self._add(text, rule, True)
+        self.max_len = max((len(p) for p in self.table), default=0)
+        self._verdicts: Dict[str, FrozenSet[str]] = {}
+    
+    def _add(self, text: str, rule: str, safe: bool):
+        phrase = _phrase(text)
+        if phrase:
+            self.table.setdefault(phrase, []).append((rule, safe))
+    
+    def _scan(self, text: str) -> FrozenSet[str]:
+        tokens = _phrase(text)
+        hits, covered = [], set()
+        for i in range(len(tokens)):
+            for n in range(1, min(self.max_len, len(tokens) - i) + 1):
+                for rule, safe in self.table.get(tokens[i:i + n], ()):
+                    if safe:
+                        covered.update((rule, j) for j in range(i, i + n))
+                    else:
+                        hits.append((rule, i, n))
+        return frozenset(
+            rule for rule, i, n in hits
+            if not all((rule, j) in covered for j in range(i, i + n))
+        )
+    
+    def matches(self, item: Any) -> FrozenSet[str]:
+        """Rules an ingredient or shopping-list entry violates"""
+        text = item.get('item', '') if isinstance(item, dict) else str(item)
+        verdict = self._verdicts.get(text)
+        if verdict is None:
+            verdict = self._scan(text)
+            if len(self._verdicts) < VERDICT_CACHE_SIZE:
+                self._verdicts[text] = verdict
+        return verdict
+    
+    def blocks(self, item: Any) -> bool:
+        return bool(self.matches(item))
+
+
+@lru_cache(maxsize=256)
+def compile_ingredient_matcher(rules: Tuple[str, ...], exclusions: Tuple[str, ...] = ()) -> IngredientMatcher:
+    """Matcher for a set of active rule names plus user exclusions (shared across requests)"""
+    active = [(rule, terms, safe) for rule, _, terms, safe in INGREDIENT_RULES if rule in rules]
+    if exclusions:
+        active.append(('exclude', exclusions, ()))
+    return IngredientMatcher(active)
+
+
+def ingredient_matcher_for(data: Dict[str, Any]) -> Optional[IngredientMatcher]:
+    """Matcher for a patient's flags and exclude_ingredients, or None when nothing is restricted"""
+    rules = tuple(rule for rule, flags, _, _ in INGREDIENT_RULES if any(data.get(flag) for flag in flags))
+    exclusions = tuple(sorted({str(e).strip().lower() for e in data.get('exclude_ingredients') or [] if str(e).strip()}))
+    if not rules and not exclusions:
+        return None
+    return compile_ingredient_matcher(rules, exclusions)
+
 
 class ClinicalSafetyChecker:
     """Enforce clinical safety rules"""
     
-    @staticmethod
-    def check_safety(data: Dict[str, Any], model_output: Dict[str, Any] = None) -> List[str]:
+    def __init__(self, rules_path: Path = CLINICAL_RULES_PATH):
+        self.rules_path = rules_path
+        self.rule_engine: Optional[ClinicalRuleEngine] = None
+    
+    def load_rules(self) -> ClinicalRuleEngine:
+        """Compile the clinical rule file (done at startup, or on first check)"""
+        self.rule_engine = ClinicalRuleEngine.from_file(self.rules_path)
+        return self.rule_engine
+    
+    def check_safety(self, data: Dict[str, Any], model_output: Dict[str, Any] = None) -> List[str]:
         """
         Check clinical safety rules and return warnings
         
@@ -22,56 +151,12 @@ class ClinicalSafetyChecker:
         Returns:
             List of warning messages
         """
-        warnings = []
-        
-        # Rule 1: Diabetes check
-        if data.get('has_diabetes') or (data.get('fasting_blood_sugar_mg_dl') and data.get('fasting_blood_sugar_mg_dl') >= 126):
-            if not data.get('diabetic_friendly'):
-                warnings.append("Patient has diabetes or elevated blood sugar - low GI foods recommended")
-            warnings.append("low GI recommended")
-        
-        # Rule 2: Celiac/Gluten check
-        if data.get('has_celiac') or data.get('gluten_free'):
-            warnings.append("Gluten-free diet required - verify no gluten in suggested meals")
-        
-        # Rule 3: CKD check
-        if data.get('has_ckd'):
-            warnings.append("Chronic kidney disease detected - restrict potassium/phosphorus foods and verify renal diet with clinician")
-        
-        # Rule 4: Acidity/Reflux check
-        if data.get('has_acidity_reflux'):
-            warnings.append("Acidity/reflux condition - avoid spicy/acidic meals, include reflux-safe alternatives")
-        
-        # Rule 5: Hypertension check
-        if data.get('has_hypertension'):
-            if not data.get('low_sodium'):
-                warnings.append("Hypertension detected - low sodium diet recommended")
-        
-        # Rule 6: Obesity check
-        if data.get('has_obesity'):
-            warnings.append("Obesity condition - calorie-controlled diet recommended")
-        
-        # Rule 7: Thyroid check
-        if data.get('has_thyroid'):
-            warnings.append("Thyroid condition - verify iodine intake with clinician")
-        
-        # Rule 8: PCOS/PCOD check
-        if data.get('has_pcod_pcos'):
-            warnings.append("PCOS/PCOD condition - consider low glycemic index and anti-inflammatory foods")
-        
-        # Rule 9: NAFLD check
-        if data.get('has_nafld'):
-            warnings.append("NAFLD condition - avoid high fructose and processed foods")
-        
-        # Rule 10: IBS/IBD check
-        if data.get('has_ibs_ibd'):
-            warnings.append("IBS/IBD condition - consider low FODMAP options and verify with gastroenterologist")
-        
-        # Rule 11: Dyslipidemia check
-        if data.get('has_dyslipidemia'):
-            warnings.append("Dyslipidemia condition - heart-healthy diet with controlled saturated fats recommended")
-        
-        return warnings
+        return self.check_safety_batch([data])[0]
+    
+    def check_safety_batch(self, rows: List[Dict[str, Any]]) -> List[List[str]]:
+        """Warnings for many patients, evaluated in one vectorized pass"""
+        engine = self.rule_engine or self.load_rules()
+        return engine.warnings(rows)
     
     @staticmethod
     def sanitize_diet_plan(diet_plan: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
@@ -88,51 +173,14 @@ class ClinicalSafetyChecker:
         if not diet_plan:
             return diet_plan
         
-        # Remove gluten if celiac or gluten_free
-        if data.get('has_celiac') or data.get('gluten_free'):
-            if 'meals' in diet_plan:
-                for meal in diet_plan.get('meals', []):
-                    if 'ingredients' in meal:
-                        meal['ingredients'] = [
-                            ing for ing in meal['ingredients'] 
-                            if 'gluten' not in str(ing).lower() and 'wheat' not in str(ing).lower()
-                        ]
-                    if 'shopping_list' in diet_plan:
-                        diet_plan['shopping_list'] = [
-                            item for item in diet_plan['shopping_list']
-                            if 'gluten' not in str(item).lower() and 'wheat' not in str(item).lower()
-                        ]
-        
-        # Remove nuts if nut_free
-        if data.get('nut_free'):
-            if 'meals' in diet_plan:
-                for meal in diet_plan.get('meals', []):
-                    if 'ingredients' in meal:
-                        meal['ingredients'] = [
-                            ing for ing in meal['ingredients']
-                            if 'nut' not in str(ing).lower() and 'peanut' not in str(ing).lower()
-                        ]
-        
-        # Remove dairy if dairy_free
-        if data.get('dairy_free'):
-            if 'meals' in diet_plan:
-                for meal in diet_plan.get('meals', []):
-                    if 'ingredients' in meal:
-                        meal['ingredients'] = [
-                            ing for ing in meal['ingredients']
-                            if 'dairy' not in str(ing).lower() and 'milk' not in str(ing).lower() and 'cheese' not in str(ing).lower()
-                        ]
-        
-        # Add exclude_ingredients filter
-        exclude_list = data.get('exclude_ingredients', [])
-        if exclude_list:
-            if 'meals' in diet_plan:
-                for meal in diet_plan.get('meals', []):
-                    if 'ingredients' in meal:
-                        meal['ingredients'] = [
-                            ing for ing in meal['ingredients']
-                            if not any(excluded.lower() in str(ing).lower() for excluded in exclude_list)
-                        ]
+        # Remove gluten/nut/dairy ingredients and exclusions in one pass over meals and shopping list
+        matcher = ingredient_matcher_for(data)
+        if matcher is not None:
+            for meal in diet_plan.get('meals', []):
+                if 'ingredients' in meal:
+                    meal['ingredients'] = [ing for ing in meal['ingredients'] if not matcher.blocks(ing)]
+            if 'shopping_list' in diet_plan:
+                diet_plan['shopping_list'] = [item for item in diet_plan['shopping_list'] if not matcher.blocks(item)]
         
         # Add clinical notes
         if 'notes' not in diet_plan:
@@ -15,11 +15,95 @@ AYUR_MODEL_PATH = MODELS_DIR / "ayur_xgb_model.pkl"
 PRAKRITI_MODEL_PATH = MODELS_DIR / "prakriti_model.pkl"
 DATASET_XLSX_PATH = MODELS_DIR / "AYURDIET_8000_STRONG_AYURVEDA_ALL_FOODS_FIXED.xlsx"
 
+# Binary cache of the dataset workbook, keyed by content hash
+DATASET_CACHE_DIR = MODELS_DIR / "dataset_cache"
+
 # Encoders and scalers persistence
 ENCODERS_PATH = MODELS_DIR / "encoders.joblib"
 SCALERS_PATH = MODELS_DIR / "scalers.joblib"
 MAPPINGS_PATH = MODELS_DIR / "mappings.json"
 
+# Batch inference limits
+MAX_BATCH_SIZE = int(os.getenv('ML_MAX_BATCH_SIZE', '10000'))
+
+# Streaming bulk scoring (/api/model/predict/stream) - rows scored per model call
+# and the longest NDJSON/CSV line accepted
+STREAM_CHUNK_SIZE = int(os.getenv('ML_STREAM_CHUNK_SIZE', '256'))
+STREAM_MAX_LINE_BYTES = int(os.getenv('ML_STREAM_MAX_LINE_BYTES', str(1024 * 1024)))
+
+# Offline batch scoring (batch_score.py) - worker processes and rows per output part
+BATCH_SCORE_WORKERS = int(os.getenv('ML_BATCH_SCORE_WORKERS', str(os.cpu_count() or 1)))
+BATCH_SCORE_CHUNK_SIZE = int(os.getenv('ML_BATCH_SCORE_CHUNK_SIZE', '5000'))
+
+# Use the precompiled NumPy feature encoder instead of per-request pandas preprocessing
+COMPILED_ENCODER_ENABLED = os.getenv('ML_COMPILED_ENCODER', 'true').lower() in ('1', 'true', 'yes')
+
+# Server / production launcher (launcher.py)
+SERVICE_HOST = os.getenv('ML_HOST', '0.0.0.0')
+SERVICE_PORT = int(os.getenv('ML_PORT', '8000'))
+SERVICE_WORKERS = int(os.getenv('ML_WORKERS', '1'))
+WORKER_MAX_REQUESTS = int(os.getenv('ML_WORKER_MAX_REQUESTS', '0'))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv('ML_WORKER_MAX_REQUESTS_JITTER', '0'))
+WORKER_GRACEFUL_TIMEOUT = float(os.getenv('ML_WORKER_GRACEFUL_TIMEOUT', '30'))
+
+# Inference executor - "thread" or "process" pool; keeps model calls off the event loop
+INFERENCE_EXECUTOR = os.getenv('ML_INFERENCE_EXECUTOR', 'thread')
+INFERENCE_WORKERS = int(os.getenv('ML_INFERENCE_WORKERS', str(min(4, os.cpu_count() or 1))))
+INFERENCE_QUEUE_DEPTH = int(os.getenv('ML_INFERENCE_QUEUE_DEPTH', '64'))
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv('ML_INFERENCE_TIMEOUT_SECONDS', '30'))
+INFERENCE_RETRY_AFTER_SECONDS = int(os.getenv('ML_INFERENCE_RETRY_AFTER_SECONDS', '1'))
+
+# Tree-ensemble inference engine for XGBoost models - "flat" (NumPy node arrays),
+# "booster" (native inplace_predict) or "sklearn" (the pickled wrapper)
+TREE_ENGINE = os.getenv('ML_TREE_ENGINE', 'flat')
+# Also score every call with the sklearn wrapper and count disagreements
+TREE_ENGINE_PARITY = os.getenv('ML_TREE_ENGINE_PARITY', 'false').lower() in ('1', 'true', 'yes')
+TREE_ENGINE_DIR = MODELS_DIR / "native"
+
+# Packed model bundle (model_bundle.py): encoder layout, flattened trees and the
+# native booster in one memory-mapped file, loaded instead of unpickling the models
+MODEL_BUNDLE_ENABLED = os.getenv('ML_MODEL_BUNDLE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Check every section's SHA-256 when a bundle is opened
+MODEL_BUNDLE_VERIFY = os.getenv('ML_MODEL_BUNDLE_VERIFY', 'true').lower() in ('1', 'true', 'yes')
+MODEL_BUNDLE_DIR = Path(os.getenv('ML_MODEL_BUNDLE_DIR', str(MODELS_DIR / "bundles")))
+
+# Declarative clinical safety rules, compiled at startup
+CLINICAL_RULES_PATH = Path(os.getenv('ML_CLINICAL_RULES_PATH', str(Path(__file__).resolve().parent / "clinical_rules.json")))
+
+# Diet plan length generated by /api/model/dietplan
+DIET_PLAN_WEEKS = int(os.getenv('ML_DIET_PLAN_WEEKS', '4'))
+
+# Micro-batching of concurrent single-patient requests
+MICRO_BATCH_ENABLED = os.getenv('ML_MICRO_BATCH_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+MICRO_BATCH_MAX_SIZE = int(os.getenv('ML_MICRO_BATCH_MAX_SIZE', '32'))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv('ML_MICRO_BATCH_MAX_WAIT_MS', '5'))
+
+# Prediction cache keyed by sanitized payload hash + model version
+PREDICTION_CACHE_ENABLED = os.getenv('ML_PREDICTION_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv('ML_PREDICTION_CACHE_MAX_ENTRIES', '10000'))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv('ML_PREDICTION_CACHE_TTL_SECONDS', '3600'))
+# "memory" (per process) or "file" (shared by all workers on the host)
+PREDICTION_CACHE_BACKEND = os.getenv('ML_PREDICTION_CACHE_BACKEND', 'memory')
+PREDICTION_CACHE_DIR = Path(os.getenv('ML_PREDICTION_CACHE_DIR', str(MODELS_DIR / "prediction_cache")))
+# Concurrent requests for the same payload and model share one in-flight prediction
+SINGLE_FLIGHT_ENABLED = os.getenv('ML_SINGLE_FLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# What-if sessions (/api/model/whatif) - dropped after TTL seconds idle
+WHATIF_MAX_SESSIONS = int(os.getenv('ML_WHATIF_MAX_SESSIONS', '1000'))
+WHATIF_SESSION_TTL_SECONDS = float(os.getenv('ML_WHATIF_SESSION_TTL_SECONDS', '1800'))
+# "memory" (one worker) or "file" (shared by the workers on one host - the default with ML_WORKERS > 1)
+WHATIF_SESSION_BACKEND = os.getenv('ML_WHATIF_SESSION_BACKEND', 'file' if SERVICE_WORKERS > 1 else 'memory')
+WHATIF_SESSION_DIR = Path(os.getenv('ML_WHATIF_SESSION_DIR', str(MODELS_DIR / "whatif_sessions")))
+# Most variants one sweep may score
+WHATIF_MAX_VARIANTS = int(os.getenv('ML_WHATIF_MAX_VARIANTS', '200'))
+
+# Versioned model registry and hot reload
+MODEL_REGISTRY_DIR = Path(os.getenv('ML_MODEL_REGISTRY_DIR', str(MODELS_DIR / "registry")))
+# How often each worker checks the registry manifest for a new active version (0 = never)
+MODEL_WATCH_INTERVAL_SECONDS = float(os.getenv('ML_MODEL_WATCH_INTERVAL_SECONDS', '5'))
+# Shared secret for /api/model/admin/* endpoints; admin endpoints are disabled when unset
+ADMIN_TOKEN = os.getenv('ML_ADMIN_TOKEN', '')
+
 # Validate paths exist
 def validate_paths():
     """Validate that all required model files exist"""
@@ -37,8 +121,8 @@ def validate_paths():
     
     return True
 
-# Allowed input keys (exact names)
-ALLOWED_KEYS = [
+# Allowed input keys (exact names) - a frozenset, tested once per key on every request
+ALLOWED_KEYS = frozenset([
     'gender', 'age', 'height_cm', 'weight_kg', 'bmi', 'patient_continent', 
     'patient_country', 'patient_region', 'meal_frequency_per_day', 
     'water_intake_liters', 'bowel_pattern', 'bowel_movements_per_day',
@@ -52,7 +136,29 @@ ALLOWED_KEYS = [
     'daily_calories', 'vegetarian', 'vegan', 'gluten_free', 'nut_free', 
     'diabetic_friendly', 'dairy_free', 'low_sodium', 'ketogenic', 
     'exclude_ingredients'
-]
+])
+
+# Prakriti assessment - request key -> prakriti model feature, each answered as a dosha
+PRAKRITI_FEATURES = {
+    'body_frame': 'BodyFrame',
+    'skin_texture': 'SkinTexture',
+    'hair': 'Hair',
+    'eyes': 'Eyes',
+    'appetite': 'Appetite',
+    'digestion': 'Digestion',
+    'sleep': 'Sleep',
+    'stamina': 'Stamina',
+    'speech': 'Speech',
+    'mind': 'Mind',
+    'memory': 'Memory',
+    'weather': 'Weather'
+}
+
+# Dosha for each prakriti model class / answer code (0, 1, 2)
+PRAKRITI_DOSHAS = ['vata', 'pitta', 'kapha']
+
+# Doshas scoring within this margin of the top one are combined ("vata-pitta", "tridoshic")
+PRAKRITI_DUAL_MARGIN = float(os.getenv('ML_PRAKRITI_DUAL_MARGIN', '0.15'))
 
 # Required minimal fields
 REQUIRED_FIELDS = [
@@ -0,0 +1,89 @@
+"""
+Binary cache of the reference dataset workbook
+
+Parsing the xlsx through openpyxl takes seconds; the cached Parquet file
+(pyarrow) loads in milliseconds. Cache files are keyed by the workbook's content hash, so a
+replaced workbook is picked up automatically.
+
+Build ahead of deployment with:
+    python dataset_cache.py
+"""
+import hashlib
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    from .config import DATASET_XLSX_PATH, DATASET_CACHE_DIR
+except ImportError:
+    from config import DATASET_XLSX_PATH, DATASET_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def source_hash(path: Path = DATASET_XLSX_PATH) -> str:
+    """SHA-256 of the workbook contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path_for(digest: str, source: Path = DATASET_XLSX_PATH) -> Path:
+    """Cache file location for a given workbook hash"""
+    return DATASET_CACHE_DIR / f"{source.stem}.{digest[:16]}.parquet"
+
+
+def build_dataset_cache(source: Path = DATASET_XLSX_PATH, force: bool = False) -> Path:
+    """Convert the workbook into a cached frame, removing caches of older versions"""
+    import pandas as pd
+    
+    digest = source_hash(source)
+    target = cache_path_for(digest, source)
+    
+    if target.exists() and not force:
+        return target
+    
+    df = pd.read_excel(source)
+    DATASET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    
+    # Write then rename so concurrent workers never read a partial file
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    df.to_parquet(tmp, engine='pyarrow', index=False)
+    tmp.replace(target)
+    logger.info(f"Built dataset cache {target}")
+    
+    # Older versions of the workbook, and pickles written before the Parquet format
+    for stale in [*DATASET_CACHE_DIR.glob(f"{source.stem}.*.parquet"), *DATASET_CACHE_DIR.glob(f"{source.stem}.*.pkl")]:
+        if stale != target:
+            stale.unlink(missing_ok=True)
+    
+    return target
+
+
+def load_dataset_frame(source: Path = DATASET_XLSX_PATH) -> 'pd.DataFrame':
+    """Load the dataset from its cache, building the cache on first use"""
+    import pandas as pd
+    
+    try:
+        target = build_dataset_cache(source)
+        return pd.read_parquet(target, engine='pyarrow')
+    except Exception as e:
+        logger.warning(f"Dataset cache unavailable, reading workbook directly: {e}")
+        return pd.read_excel(source)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    force = '--force' in sys.argv[1:]
+    
+    start = time.perf_counter()
+    path = build_dataset_cache(force=force)
+    print(f"Dataset cache ready: {path} ({time.perf_counter() - start:.2f}s)")
@@ -0,0 +1,406 @@
+"""
+Meal-plan generation from the reference food table
+
+The food table is indexed once into compact NumPy columns - dosha effects,
+standardized nutrients and bitmasks for meal slot, season and allergens.
+Each request is then answered with vectorized masks and scores over all
+foods: hard restrictions (diet type, allergens, clinical limits) filter,
+dosha suitability, calorie fit and condition-specific nutrient penalties
+rank, and every slot of a multi-day plan is filled from the best foods.
+"""
+import logging
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    from .config import DATASET_XLSX_PATH, DIET_PLAN_WEEKS, PRAKRITI_DOSHAS
+    from .dataset_cache import load_dataset_frame
+    from .clinical_safety import INGREDIENT_RULES, compile_ingredient_matcher, ingredient_matcher_for
+except ImportError:
+    from config import DATASET_XLSX_PATH, DIET_PLAN_WEEKS, PRAKRITI_DOSHAS
+    from dataset_cache import load_dataset_frame
+    from clinical_safety import INGREDIENT_RULES, compile_ingredient_matcher, ingredient_matcher_for
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Share of the daily calorie target per meal slot
+MEAL_SLOTS = {'breakfast': 0.25, 'lunch': 0.40, 'dinner': 0.35}
+SEASONS = ('winter', 'summer', 'monsoon', 'all')
+ALLERGENS = ('gluten', 'dairy', 'egg', 'soy', 'nuts', 'shellfish', 'seafood', 'sesame')
+# Food groups that are not served as a main meal
+SIDE_GROUPS = ('beverage', 'dessert')
+NUTRIENTS = ('calories_kcal', 'protein_g', 'fat_g', 'carbs_g', 'fiber_g', 'sugar_g', 'sodium_mg', 'digestibility_score')
+# Placeholder ingredient text that carries no information
+GENERIC_INGREDIENTS = {'global ingredient base'}
+# is_veg and the allergen flags are incomplete in the food table, so foods whose
+# name words or ingredients include these terms are treated as non-veg. Allergens
+# are completed from the clinical safety checker's ingredient rules.
+MEAT_TERMS = ('chicken', 'mutton', 'lamb', 'pork', 'beef', 'duck', 'fish', 'meat', 'salmon')
+
+# diet_type -> (vegetarian only, allergen flags that must be absent)
+DIET_TYPES = {
+    'veg': (True, ('egg',)),
+    'vegetarian': (True, ('egg',)),
+    'eggetarian': (True, ()),
+    'vegan': (True, ('egg', 'dairy')),
+    'non-veg': (False, ()),
+}
+
+# Patient flag -> allergen flags that must be absent
+ALLERGEN_FLAGS = {
+    'gluten_free': ('gluten',),
+    'has_celiac': ('gluten',),
+    'nut_free': ('nuts',),
+    'dairy_free': ('dairy',),
+}
+
+# Patient flag -> per-serving upper limits on food columns
+CLINICAL_LIMITS = {
+    'has_diabetes': {'sugar_g': 10.0},
+    'diabetic_friendly': {'sugar_g': 10.0},
+    'has_hypertension': {'sodium_mg': 600.0},
+    'low_sodium': {'sodium_mg': 600.0},
+    'has_ckd': {'sodium_mg': 600.0},
+    'has_acidity_reflux': {'spice_level': 1.0},
+}
+
+# Patient flag / therapeutic goal -> weights on standardized nutrients (positive = penalize)
+NUTRIENT_PENALTIES = {
+    'has_diabetes': {'sugar_g': 1.0, 'carbs_g': 0.5, 'fiber_g': -0.5},
+    'diabetic_friendly': {'sugar_g': 1.0, 'carbs_g': 0.5, 'fiber_g': -0.5},
+    'ketogenic': {'carbs_g': 1.5, 'fat_g': -0.5},
+    'has_obesity': {'fat_g': 0.5, 'sugar_g': 0.5, 'fiber_g': -0.5},
+    'has_dyslipidemia': {'fat_g': 1.0},
+    'has_nafld': {'sugar_g': 1.0, 'fat_g': 0.5},
+    'has_ckd': {'protein_g': 0.5, 'sodium_mg': 0.5},
+    'has_hypertension': {'sodium_mg': 1.0},
+    'has_ibs_ibd': {'digestibility_score': -1.0},
+    'glycemic_control': {'sugar_g': 1.0, 'carbs_g': 0.5},
+    'weight_loss': {'fat_g': 0.5, 'sugar_g': 0.5},
+    'lipid_control': {'fat_g': 1.0},
+    'bp_control': {'sodium_mg': 1.0},
+    'renal_safe': {'protein_g': 0.5, 'sodium_mg': 0.5},
+    'liver_health': {'sugar_g': 0.5, 'fat_g': 0.5},
+    'weight_gain': {'calories_kcal': -0.5, 'protein_g': -0.5},
+}
+
+# Extra weight on a dosha reported as currently aggravated/depleted
+DOSHA_STATE_WEIGHTS = {'high': 0.5, 'normal': 0.0, 'low': -0.25}
+
+# Score terms
+DOSHA_WEIGHT = 1.0
+CALORIE_FIT_WEIGHT = 2.0
+SEASON_BONUS = 0.5
+REGION_BONUS = 0.25
+DINNER_TAG_BONUS = 0.5
+
+# Servings are rounded to half portions within this range
+MIN_SERVINGS = 0.5
+MAX_SERVINGS = 2.5
+# Each slot draws from this many best foods per plan day, so plans vary
+POOL_FACTOR = 3
+
+
+class FoodIndex:
+    """Food table as compact NumPy columns and bitmasks"""
+    
+    def __init__(self, frame: 'pd.DataFrame'):
+        import pandas as pd
+        
+        n = len(frame)
+        self.size = n
+        self.food_id = frame['food_id'].to_numpy(dtype=np.int64)
+        self.name = frame['food_name'].astype(str).to_numpy(dtype=object)
+        self.cuisine = frame['cuisine'].astype(str).to_numpy(dtype=object)
+        self.food_group = frame['food_group'].astype(str).to_numpy(dtype=object)
+        self.country_codes, self.countries = pd.factorize(frame['region_country'].astype(str).str.lower())
+        
+        self.is_veg = frame['is_veg'].to_numpy() == 1
+        self.effects = frame[[f"{dosha}_effect" for dosha in PRAKRITI_DOSHAS]].to_numpy(dtype=np.float32)
+        self.columns = {col: frame[col].to_numpy(dtype=np.float32) for col in NUTRIENTS + ('spice_level',)}
+        
+        raw = np.column_stack([frame[col].to_numpy(dtype=np.float32) for col in NUTRIENTS])
+        std = raw.std(axis=0)
+        self.nutrient_z = ((raw - raw.mean(axis=0)) / np.where(std > 0, std, 1.0)).astype(np.float32)
+        
+        self.allergen_mask = self._bitmask(frame, [f"allergen_{a}" for a in ALLERGENS], np.uint16)
+        self.season_mask = self._bitmask(frame, [f"season_{s}" for s in SEASONS], np.uint8)
+        tags = self._bitmask(frame, [f"meal_{slot}" for slot in MEAL_SLOTS], np.uint8)
+        self.dinner_tagged = (tags & self.slot_bit('dinner')) != 0
+        
+        # Few foods are tagged for dinner, so dinner also draws on lunch dishes
+        main = ~np.isin(self.food_group, SIDE_GROUPS)
+        lunch = (tags & self.slot_bit('lunch')) != 0
+        self.slot_mask = (
+            ((tags & self.slot_bit('breakfast')) != 0) * self.slot_bit('breakfast')
+            | (lunch & main) * self.slot_bit('lunch')
+            | ((lunch & main) | self.dinner_tagged) * self.slot_bit('dinner')
+        ).astype(np.uint8)
+        
+        # Ingredients per food and an inverted index from ingredient/name terms to rows
+        self.ingredients = [
+            [item.strip() for item in str(text).split(',') if item.strip()] if str(text) not in GENERIC_INGREDIENTS else []
+            for text in frame['raw_materials']
+        ]
+        postings: Dict[str, List[int]] = {}
+        for row, (name, items) in enumerate(zip(self.name, self.ingredients)):
+            for term in set(name.lower().split()) | {item.lower() for item in items}:
+                postings.setdefault(term, []).append(row)
+        self.term_rows = {term: np.asarray(rows, dtype=np.int64) for term, rows in postings.items()}
+        
+        self.is_veg &= ~self.rows_with_terms(MEAT_TERMS)
+        self.allergen_mask |= self._rule_allergens()
+    
+    def _rule_allergens(self) -> np.ndarray:
+        """Allergen bits from the safety checker's ingredient rules, matched on each food's name and ingredients"""
+        # Every rule enabled, through the same matcher the checker sanitizes plans with
+        matcher = ingredient_matcher_for({flag: True for _, flags, _, _ in INGREDIENT_RULES for flag in flags})
+        bits = {rule: self.allergen_bits([rule]) for rule, _, _, _ in INGREDIENT_RULES if rule in ALLERGENS}
+        mask = np.zeros(self.size, dtype=np.uint16)
+        for row, (name, items) in enumerate(zip(self.name, self.ingredients)):
+            for rule in matcher.matches(name).union(*(matcher.matches(item) for item in items)):
+                mask[row] |= bits.get(rule, 0)
+        return mask
+    
+    @staticmethod
+    def _bitmask(frame: 'pd.DataFrame', columns: List[str], dtype) -> np.ndarray:
+        mask = np.zeros(len(frame), dtype=dtype)
+        for bit, col in enumerate(columns):
+            mask |= (frame[col].to_numpy() == 1).astype(dtype) << dtype(bit)
+        return mask
+    
+    @staticmethod
+    def slot_bit(slot: str) -> int:
+        return 1 << list(MEAL_SLOTS).index(slot)
+    
+    @staticmethod
+    def allergen_bits(allergens) -> int:
+        return sum(1 << ALLERGENS.index(a) for a in set(allergens))
+    
+    def rows_with_terms(self, terms) -> np.ndarray:
+        """Rows whose name words or ingredients include one of the exact terms"""
+        hits = np.zeros(self.size, dtype=bool)
+        for term in terms:
+            if term in self.term_rows:
+                hits[self.term_rows[term]] = True
+        return hits
+    
+    def rows_matching(self, terms: List[str]) -> np.ndarray:
+        """Rows whose name or an ingredient matches any of the terms as whole words, like sanitize_diet_plan"""
+        matcher = compile_ingredient_matcher((), tuple(sorted({str(t).strip().lower() for t in terms if str(t).strip()})))
+        hits = np.zeros(self.size, dtype=bool)
+        for indexed, rows in self.term_rows.items():
+            if matcher.blocks(indexed):
+                hits[rows] = True
+        return hits
+
+
+class DietPlanner:
+    """Assemble calorie-targeted multi-day meal plans from the indexed food table"""
+    
+    def __init__(self):
+        self.index: Optional[FoodIndex] = None
+    
+    @property
+    def loaded(self) -> bool:
+        return self.index is not None
+    
+    def load(self, frame: Optional['pd.DataFrame'] = None) -> FoodIndex:
+        """Index the food table (the cached dataset unless a frame is given)"""
+        start = time.perf_counter()
+        if frame is None:
+            frame = load_dataset_frame(DATASET_XLSX_PATH)
+        self.index = FoodIndex(frame)
+        logger.info(f"Indexed {self.index.size} foods for diet planning in {time.perf_counter() - start:.2f}s")
+        return self.index
+    
+    def dosha_weights(self, data: Dict[str, Any], dosha_scores: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """How strongly each dosha should be pacified"""
+        if dosha_scores:
+            weights = np.array([float(dosha_scores.get(d, 0.0)) for d in PRAKRITI_DOSHAS], dtype=np.float32)
+        else:
+            prakriti = str(data.get('prakriti', '')).lower()
+            parts = PRAKRITI_DOSHAS if 'tridosh' in prakriti else prakriti.replace('_', '-').split('-')
+            weights = np.array([1.0 if d in parts else 0.0 for d in PRAKRITI_DOSHAS], dtype=np.float32)
+        
+        for i, dosha in enumerate(PRAKRITI_DOSHAS):
+            weights[i] += DOSHA_STATE_WEIGHTS.get(str(data.get(f"{dosha}_state", '')).lower(), 0.0)
+        
+        total = np.abs(weights).sum()
+        return weights / total if total > 0 else np.full(len(PRAKRITI_DOSHAS), 1.0 / len(PRAKRITI_DOSHAS), dtype=np.float32)
+    
+    def allowed_foods(self, data: Dict[str, Any]) -> np.ndarray:
+        """Foods satisfying the diet type, allergen and clinical restrictions"""
+        index = self.index
+        veg_only, avoid = DIET_TYPES.get(str(data.get('diet_type', '')).lower(), (False, ()))
+        avoid = list(avoid)
+        if data.get('vegan'):
+            veg_only = True
+            avoid += DIET_TYPES['vegan'][1]
+        elif data.get('vegetarian'):
+            veg_only = True
+        for flag, allergens in ALLERGEN_FLAGS.items():
+            if data.get(flag):
+                avoid += allergens
+        
+        allowed = (index.allergen_mask & index.allergen_bits(avoid)) == 0
+        if veg_only:
+            allowed &= index.is_veg
+        
+        for flag, limits in CLINICAL_LIMITS.items():
+            if data.get(flag):
+                for col, limit in limits.items():
+                    allowed &= index.columns[col] <= limit
+        if data.get('has_diabetes') or data.get('diabetic_friendly'):
+            allowed &= index.food_group != 'dessert'
+        
+        if data.get('exclude_ingredients'):
+            allowed &= ~index.rows_matching(data['exclude_ingredients'])
+        return allowed
+    
+    def base_scores(self, data: Dict[str, Any], dosha_scores: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Slot-independent suitability of every food for the patient"""
+        index = self.index
+        # Negative effect values pacify a dosha
+        score = -DOSHA_WEIGHT * (index.effects @ self.dosha_weights(data, dosha_scores))
+        
+        penalties = np.zeros(len(NUTRIENTS), dtype=np.float32)
+        for key in [flag for flag in NUTRIENT_PENALTIES if data.get(flag)] + [data.get('therapeutic_goal')]:
+            for col, weight in NUTRIENT_PENALTIES.get(key, {}).items():
+                penalties[NUTRIENTS.index(col)] += weight
+        if penalties.any():
+            score -= index.nutrient_z @ penalties
+        
+        season = str(data.get('season', '')).lower()
+        if season in SEASONS:
+            bits = (1 << SEASONS.index(season)) | (1 << SEASONS.index('all'))
+            score += SEASON_BONUS * ((index.season_mask & bits) != 0)
+        
+        country = str(data.get('patient_country', '')).lower()
+        if country in index.countries:
+            score += REGION_BONUS * (index.country_codes == index.countries.get_loc(country))
+        return score
+    
+    def generate(
+        self,
+        data: Dict[str, Any],
+        days: Optional[int] = None,
+        seed: Optional[str] = None,
+        dosha_scores: Optional[Dict[str, float]] = None,
+        notes: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build a diet plan for one patient
+        
+        Args:
+            data: Sanitized patient input
+            days: Plan length (default ML_DIET_PLAN_WEEKS weeks)
+            seed: Stable per-request seed (e.g. the payload hash) so equal requests get equal plans
+            dosha_scores: Inferred dosha scores, used instead of the prakriti label when given
+            notes: Notes to start the plan with (e.g. clinical warnings)
+        
+        Returns:
+            Diet plan with summary, meals, shopping list and notes
+        """
+        index = self.index or self.load()
+        days = days or DIET_PLAN_WEEKS * 7
+        notes = list(notes or [])
+        rng = np.random.default_rng(int(seed[:16], 16) if seed else None)
+        target = float(data.get('daily_calories') or 2000)
+        
+        allowed = self.allowed_foods(data)
+        score = self.base_scores(data, dosha_scores)
+        kcal = index.columns['calories_kcal']
+        used = np.zeros(index.size, dtype=bool)
+        picks: Dict[str, np.ndarray] = {}
+        servings: Dict[str, np.ndarray] = {}
+        
+        for slot, share in MEAL_SLOTS.items():
+            slot_target = target * share
+            eligible = allowed & ((index.slot_mask & index.slot_bit(slot)) != 0)
+            candidates = np.flatnonzero(eligible & ~used)
+            if candidates.size == 0:
+                candidates = np.flatnonzero(eligible)
+            if candidates.size == 0:
+                notes.append(f"No {slot} foods match the dietary restrictions - {slot} left to the clinician")
+                continue
+            
+            # Half-portion servings closest to the slot's calorie target
+            cand_kcal = kcal[candidates]
+            portions = np.where(cand_kcal > 0, np.round(slot_target / np.maximum(cand_kcal, 1.0) * 2) / 2, 1.0)
+            portions = np.clip(portions, MIN_SERVINGS, MAX_SERVINGS)
+            fit = np.abs(cand_kcal * portions - slot_target) / slot_target
+            
+            slot_score = score[candidates] - CALORIE_FIT_WEIGHT * fit
+            if slot == 'dinner':
+                slot_score += DINNER_TAG_BONUS * index.dinner_tagged[candidates]
+            
+            pool = min(candidates.size, days * POOL_FACTOR)
+            best = np.argpartition(-slot_score, pool - 1)[:pool] if pool < candidates.size else np.arange(candidates.size)
+            # Vary the order across days; foods only repeat when there are fewer than `days`
+            chosen = np.resize(rng.permutation(best)[:days], days)
+            picks[slot] = candidates[chosen]
+            servings[slot] = portions[chosen]
+            used[picks[slot]] = True
+        
+        meals = []
+        shopping = Counter()
+        daily_calories = np.zeros(days)
+        macros = {col: 0.0 for col in ('protein_g', 'carbs_g', 'fat_g', 'fiber_g')}
+        for day in range(days):
+            for slot in picks:
+                row, portion = int(picks[slot][day]), float(servings[slot][day])
+                calories = float(kcal[row]) * portion
+                daily_calories[day] += calories
+                meal = {
+                    "day": day + 1,
+                    "meal": slot,
+                    "food_id": int(index.food_id[row]),
+                    "name": index.name[row],
+                    "cuisine": index.cuisine[row],
+                    "food_group": index.food_group[row],
+                    "servings": portion,
+                    "calories": round(calories, 1),
+                    "ingredients": list(index.ingredients[row])
+                }
+                for col in macros:
+                    value = float(index.columns[col][row]) * portion
+                    meal[col] = round(value, 1)
+                    macros[col] += value
+                meals.append(meal)
+                shopping.update(index.ingredients[row])
+        
+        return {
+            "plan_summary": {
+                "total_calories": data.get('daily_calories', 2000),
+                "diet_type": data.get('diet_type', 'balanced'),
+                "duration_weeks": round(days / 7, 2),
+                "days": days,
+                "average_daily_calories": round(float(daily_calories.mean()), 1) if picks else 0.0,
+                "average_daily_macros": {col: round(total / days, 1) for col, total in macros.items()},
+                "eligible_foods": int(allowed.sum())
+            },
+            "meals": meals,
+            "shopping_list": [{"item": item, "meals": count} for item, count in shopping.most_common()],
+            "notes": notes
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        if self.index is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "foods": self.index.size,
+            "indexed_terms": len(self.index.term_rows),
+            "slot_foods": {slot: int(((self.index.slot_mask & FoodIndex.slot_bit(slot)) != 0).sum()) for slot in MEAL_SLOTS}
+        }
+
+
+# Global diet planner instance
+diet_planner = DietPlanner()
@@ -0,0 +1,158 @@
+"""
+Executor layer that keeps CPU-bound inference off the asyncio event loop
+"""
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+try:
+    from .config import (
+        INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH,
+        INFERENCE_TIMEOUT_SECONDS, INFERENCE_RETRY_AFTER_SECONDS
+    )
+    from .model_loader import initialize_models, model_loader
+except ImportError:
+    from config import (
+        INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH,
+        INFERENCE_TIMEOUT_SECONDS, INFERENCE_RETRY_AFTER_SECONDS
+    )
+    from model_loader import initialize_models, model_loader
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the inference queue is full and the request should be retried later"""
+    
+    def __init__(self, retry_after: int):
+        super().__init__("Inference capacity exhausted, retry later")
+        self.retry_after = retry_after
+
+
+class InferenceTimeoutError(RuntimeError):
+    """Raised when a single inference call exceeds the per-request timeout"""
+
+
+def _init_worker():
+    """Process pool initializer - load models once per worker process"""
+    # Forked workers inherit the parent's loaded models copy-on-write
+    if not model_loader.models_loaded:
+        initialize_models()
+
+
+def _call_model_loader(method: str, *args: Any) -> Any:
+    """Invoke a ModelLoader method inside a worker thread or process"""
+    return getattr(model_loader, method)(*args)
+
+
+class InferenceExecutor:
+    """Run model calls on a bounded thread or process pool"""
+    
+    def __init__(
+        self,
+        mode: str = 'thread',
+        max_workers: int = 4,
+        max_queue: int = 64,
+        timeout: float = 30.0,
+        retry_after: int = 1
+    ):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._pool: Optional[Executor] = None
+        self._pending = 0
+        self.rejected = 0
+        self.timed_out = 0
+    
+    @property
+    def capacity(self) -> int:
+        """Maximum number of calls running or waiting at once"""
+        return self.max_workers + self.max_queue
+    
+    def start(self):
+        """Create the worker pool"""
+        if self._pool is not None:
+            return
+        
+        if self.mode == 'process':
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='inference')
+        
+        logger.info(f"Started {self.mode} inference executor with {self.max_workers} workers, queue depth {self.max_queue}")
+    
+    def shutdown(self):
+        """Stop the worker pool"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
+    def restart(self):
+        """
+        Replace the worker pool, letting calls already running on the old one finish
+        
+        Process workers hold their own copy of the models, so this is how a
+        hot-reloaded model reaches them.
+        """
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=False)
+        self.start()
+    
+    def _release(self, _future):
+        self._pending -= 1
+    
+    async def run(self, method: str, *args: Any) -> Any:
+        """
+        Run a ModelLoader method in the pool
+        
+        Raises ExecutorSaturatedError when the queue is full and
+        InferenceTimeoutError when the call takes longer than the timeout.
+        """
+        if self._pool is None:
+            self.start()
+        
+        if self._pending >= self.capacity:
+            self.rejected += 1
+            raise ExecutorSaturatedError(self.retry_after)
+        
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, _call_model_loader, method, *args)
+        
+        # Slots are released when the work finishes, not when the caller gives up,
+        # so timed-out calls still count against capacity while they occupy a worker
+        self._pending += 1
+        future.add_done_callback(self._release)
+        
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise InferenceTimeoutError(f"Inference exceeded {self.timeout}s timeout")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Executor load snapshot for health reporting"""
+        return {
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "capacity": self.capacity,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out
+        }
+
+
+# Global executor instance
+inference_executor = InferenceExecutor(
+    mode=INFERENCE_EXECUTOR,
+    max_workers=INFERENCE_WORKERS,
+    max_queue=INFERENCE_QUEUE_DEPTH,
+    timeout=INFERENCE_TIMEOUT_SECONDS,
+    retry_after=INFERENCE_RETRY_AFTER_SECONDS
+)
@@ -0,0 +1,316 @@
+"""
+Precompiled feature encoder - turns input dicts into model-ready float32 rows
+without building per-request DataFrames
+
+FeatureSchema covers the pandas fallback: it records the model's input
+columns once, so frames are built directly in training order and dtypes.
+"""
+import logging
+import math
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+
+def _is_missing(value: Any) -> bool:
+    """Match pandas.notna() for the scalar types a request can carry"""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _plain(value: Any) -> Any:
+    """NumPy scalars as the equivalent Python value (for JSON)"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _to_float(value: Any) -> float:
+    """Scalar equivalent of pd.to_numeric(errors='coerce')"""
+    if value is None:
+        return NAN
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class FeatureSchema:
+    """
+    Model input columns in training order, each with a kind and a default
+    
+    "categorical" columns hold strings ("unknown" when absent), "numeric"
+    columns float64 (NaN when absent or unparseable). Columns are built one
+    at a time straight from the input dicts, so no per-call reindexing or
+    dtype coercion of a DataFrame is needed, and keys a client sends that
+    the model does not use are never read.
+    """
+    
+    CATEGORICAL = 'categorical'
+    NUMERIC = 'numeric'
+    
+    def __init__(self, columns: Sequence[tuple]):
+        # (name, kind, default)
+        self.columns = [(str(name), kind, default) for name, kind, default in columns]
+        self.names = [name for name, _, _ in self.columns]
+    
+    @classmethod
+    def from_columns(cls, names: Sequence[str], categorical: Sequence[str]) -> 'FeatureSchema':
+        """Columns listed in categorical default to "unknown", all others are numeric"""
+        categorical = set(categorical)
+        return cls([
+            (name, cls.CATEGORICAL, 'unknown') if name in categorical else (name, cls.NUMERIC, NAN)
+            for name in names
+        ])
+    
+    def arrays(self, rows: Sequence[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """One typed array per column, in schema order"""
+        out = {}
+        for name, kind, default in self.columns:
+            values = [row.get(name) for row in rows]
+            if kind == self.CATEGORICAL:
+                out[name] = np.array([default if _is_missing(v) else str(v) for v in values], dtype=object)
+            else:
+                out[name] = np.array([_to_float(v) for v in values], dtype=np.float64)
+                if default == default:
+                    out[name][np.isnan(out[name])] = default
+        return out
+    
+    def frame(self, rows: Sequence[Dict[str, Any]]) -> 'pd.DataFrame':
+        """DataFrame with exactly the schema's columns, order and dtypes"""
+        import pandas as pd
+        return pd.DataFrame(self.arrays(rows), columns=self.names, copy=False)
+    
+    def state(self) -> List[list]:
+        """JSON-safe form (NaN defaults as None)"""
+        return [[name, kind, None if default != default else default] for name, kind, default in self.columns]
+    
+    @classmethod
+    def from_state(cls, state: Sequence[list]) -> 'FeatureSchema':
+        return cls([(name, kind, NAN if default is None else default) for name, kind, default in state])
+
+
+class CompiledFeatureEncoder:
+    """
+    Fixed-layout encoder compiled once from fitted preprocessors
+    
+    Categories become plain dict lookups (one-hot positions or label indices)
+    and numeric scalers become mean/scale pairs, so encoding a row is a
+    single pass over the input dict writing into a float32 matrix.
+    """
+    
+    def __init__(self, n_features: int, missing_value: float = NAN):
+        self.n_features = n_features
+        self.missing_value = missing_value
+        # (key, {category: absolute column}) - unknown/missing categories leave zeros
+        self.onehot: List[tuple] = []
+        # (key, column, {category: code}) - unknown/missing categories encode as 0
+        self.label: List[tuple] = []
+        # (key, column, mean, scale) - missing/unparseable values encode as 0
+        self.scaled: List[tuple] = []
+        # (key, column) - missing/unparseable values encode as missing_value
+        self.numeric: List[tuple] = []
+    
+    @classmethod
+    def from_column_transformer(cls, transformer) -> Optional['CompiledFeatureEncoder']:
+        """Compile a fitted ColumnTransformer of OneHotEncoder/passthrough blocks"""
+        if getattr(transformer, 'sparse_output_', False):
+            # Sparse input changes how XGBoost treats zeros - keep the pandas path
+            return None
+        
+        slices = transformer.output_indices_
+        n_features = max((s.stop for s in slices.values()), default=0)
+        encoder = cls(n_features, missing_value=NAN)
+        
+        for name, step, columns in transformer.transformers_:
+            if step == 'drop' or len(columns) == 0:
+                continue
+            offset = slices[name].start
+            
+            if step == 'passthrough':
+                for i, key in enumerate(columns):
+                    encoder.numeric.append((key, offset + i))
+                continue
+            
+            if type(step).__name__ != 'OneHotEncoder':
+                logger.info(f"Cannot compile transformer '{name}' ({type(step).__name__})")
+                return None
+            if getattr(step, 'drop_idx_', None) is not None or getattr(step, '_infrequent_enabled', False):
+                logger.info(f"Cannot compile OneHotEncoder '{name}' with drop/infrequent categories")
+                return None
+            
+            position = offset
+            for key, categories in zip(columns, step.categories_):
+                encoder.onehot.append((key, {cat: position + j for j, cat in enumerate(categories)}))
+                position += len(categories)
+        
+        encoder._finalize()
+        return encoder
+    
+    @classmethod
+    def from_label_encoders(
+        cls,
+        columns: Sequence[str],
+        encoders: Dict[str, Any],
+        scalers: Dict[str, Any]
+    ) -> 'CompiledFeatureEncoder':
+        """Compile LabelEncoder/StandardScaler dicts over a fixed column order"""
+        encoder = cls(len(columns), missing_value=0.0)
+        
+        for i, key in enumerate(columns):
+            if key in encoders:
+                classes = encoders[key].classes_
+                encoder.label.append((key, i, {cls: code for code, cls in enumerate(classes)}))
+            elif key in scalers:
+                scaler = scalers[key]
+                encoder.scaled.append((key, i, float(scaler.mean_[0]), float(scaler.scale_[0])))
+            else:
+                encoder.numeric.append((key, i))
+        
+        encoder._finalize()
+        return encoder
+    
+    @classmethod
+    def from_category_codes(
+        cls,
+        columns: Sequence[str],
+        codes: Dict[Any, int]
+    ) -> 'CompiledFeatureEncoder':
+        """Compile columns that all share one category -> code mapping"""
+        encoder = cls(len(columns), missing_value=0.0)
+        for i, key in enumerate(columns):
+            encoder.label.append((key, i, {str(category): code for category, code in codes.items()}))
+        
+        encoder._finalize()
+        return encoder
+    
+    def state(self):
+        """(JSON-safe layout, scaler arrays) for saving the compiled encoder"""
+        spec = {
+            "n_features": self.n_features,
+            "missing_value": None if math.isnan(self.missing_value) else self.missing_value,
+            "onehot": [[_plain(key), [[_plain(c), column] for c, column in positions.items()]]
+                       for key, positions in self.onehot],
+            "label": [[_plain(key), column, [[_plain(c), code] for c, code in codes.items()]]
+                      for key, column, codes in self.label],
+            "scaled": [[_plain(key), column] for key, column, _, _ in self.scaled],
+            "numeric": [[_plain(key), column] for key, column in self.numeric]
+        }
+        arrays = {
+            "scaled_mean": np.array([mean for _, _, mean, _ in self.scaled], dtype=np.float64),
+            "scaled_scale": np.array([scale for _, _, _, scale in self.scaled], dtype=np.float64)
+        }
+        return spec, arrays
+    
+    @classmethod
+    def from_state(cls, spec: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'CompiledFeatureEncoder':
+        """Rebuild an encoder saved with state()"""
+        missing = spec["missing_value"]
+        encoder = cls(spec["n_features"], missing_value=NAN if missing is None else missing)
+        encoder.onehot = [(key, {c: column for c, column in pairs}) for key, pairs in spec["onehot"]]
+        encoder.label = [(key, column, {c: code for c, code in pairs}) for key, column, pairs in spec["label"]]
+        encoder.scaled = [
+            (key, column, mean, scale)
+            for (key, column), mean, scale in zip(spec["scaled"], arrays["scaled_mean"].tolist(), arrays["scaled_scale"].tolist())
+        ]
+        encoder.numeric = [(key, column) for key, column in spec["numeric"]]
+        encoder._finalize()
+        return encoder
+    
+    def _finalize(self):
+        self._template = np.zeros(self.n_features, dtype=np.float32)
+        for _, column in self.numeric:
+            self._template[column] = self.missing_value
+        
+        # Per input key: the columns it writes, for re-encoding single fields
+        self._fields: Dict[Any, List[tuple]] = {}
+        for key, positions in self.onehot:
+            self._fields.setdefault(key, []).append(('onehot', np.fromiter(positions.values(), dtype=np.intp), positions))
+        for key, column, codes in self.label:
+            self._fields.setdefault(key, []).append(('label', column, codes))
+        for key, column, mean, scale in self.scaled:
+            self._fields.setdefault(key, []).append(('scaled', column, (mean, scale)))
+        for key, column in self.numeric:
+            self._fields.setdefault(key, []).append(('numeric', column, None))
+        
+        # Column -> input key indicator, for summing per-column values back to the keys
+        self.field_keys = list(self._fields)
+        self._field_indicator = np.zeros((self.n_features, len(self.field_keys)), dtype=np.float64)
+        for f, key in enumerate(self.field_keys):
+            for _, columns, _ in self._fields[key]:
+                self._field_indicator[columns, f] = 1.0
+    
+    def encode_into(self, rows: Sequence[Dict[str, Any]], out: np.ndarray) -> np.ndarray:
+        """Encode rows into a preallocated (len(rows), n_features) float32 array"""
+        out[:len(rows)] = self._template
+        
+        for r, row in enumerate(rows):
+            x = out[r]
+            get = row.get
+            
+            for key, positions in self.onehot:
+                value = get(key)
+                category = 'unknown' if _is_missing(value) else str(value)
+                column = positions.get(category)
+                if column is not None:
+                    x[column] = 1.0
+            
+            for key, column, codes in self.label:
+                value = get(key)
+                category = 'unknown' if _is_missing(value) else str(value)
+                x[column] = codes.get(category, 0)
+            
+            for key, column, mean, scale in self.scaled:
+                value = _to_float(get(key))
+                if value == value:
+                    x[column] = (value - mean) / scale
+            
+            for key, column in self.numeric:
+                value = _to_float(get(key))
+                if value == value:
+                    x[column] = value
+        
+        return out
+    
+    def encode_fields(self, values: Dict[str, Any], x: np.ndarray) -> np.ndarray:
+        """
+        Re-encode only the given keys of an already encoded row, in place
+        
+        A key mapped to None is encoded as missing; keys the model does not
+        use are ignored. Writing each key's columns from their template
+        values gives the same row encode() builds for the updated input.
+        """
+        for key, value in values.items():
+            missing = _is_missing(value)
+            for kind, columns, spec in self._fields.get(key, ()):
+                if kind == 'onehot':
+                    x[columns] = 0.0
+                    column = spec.get('unknown' if missing else str(value))
+                    if column is not None:
+                        x[column] = 1.0
+                elif kind == 'label':
+                    x[columns] = spec.get('unknown' if missing else str(value), 0)
+                else:
+                    number = _to_float(value)
+                    if number != number:
+                        x[columns] = self._template[columns]
+                    elif kind == 'scaled':
+                        x[columns] = (number - spec[0]) / spec[1]
+                    else:
+                        x[columns] = number
+        return x
+    
+    def sum_by_field(self, values: np.ndarray) -> np.ndarray:
+        """Sum per-column values (last axis n_features) into one value per key of field_keys"""
+        return values @ self._field_indicator
+    
+    def encode(self, rows: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Encode rows into a new float32 matrix"""
+        out = np.empty((len(rows), self.n_features), dtype=np.float32)
+        return self.encode_into(rows, out)
@@ -0,0 +1,171 @@
+"""
+Hot reload of model versions without restarting the service
+
+A new version is loaded into a separate ModelLoader, warmed up with sample
+patients and only then swapped into the global loader. If loading or warmup
+fails, the running model keeps serving and the failure is recorded.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    from .model_loader import ModelLoader, model_loader
+    from .registry import ModelRegistry, model_registry, DEFAULT_VERSION
+    from .config import PRAKRITI_FEATURES, PRAKRITI_DOSHAS
+except ImportError:
+    from model_loader import ModelLoader, model_loader
+    from registry import ModelRegistry, model_registry, DEFAULT_VERSION
+    from config import PRAKRITI_FEATURES, PRAKRITI_DOSHAS
+
+logger = logging.getLogger(__name__)
+
+# Rows covering categorical, numeric and missing-value paths of the encoder
+WARMUP_ASSESSMENT = {key: dosha for key, dosha in zip(PRAKRITI_FEATURES, PRAKRITI_DOSHAS * 4)}
+WARMUP_ROWS = [
+    {"gender": "male", "age": 35, "height_cm": 175, "weight_kg": 75, "bmi": 24.5,
+     "daily_calories": 2000, "diet_type": "vegetarian", "prakriti": "vata-pitta"},
+    {"gender": "female", "age": 52, "height_cm": 160, "weight_kg": 82,
+     "daily_calories": 1600, "diet_type": "non-veg", "prakriti": "kapha",
+     "has_diabetes": True, "fasting_blood_sugar_mg_dl": 140, "season": "winter"},
+]
+
+
+class ModelReloadError(RuntimeError):
+    """Raised when a candidate model fails to load or warm up"""
+
+
+class ModelReloader:
+    """Load, warm up and atomically activate model versions"""
+    
+    def __init__(
+        self,
+        loader: ModelLoader,
+        registry: ModelRegistry,
+        warmup_rows: Optional[List[Dict[str, Any]]] = None
+    ):
+        self.loader = loader
+        self.registry = registry
+        self.warmup_rows = warmup_rows if warmup_rows is not None else WARMUP_ROWS
+        self.previous_version: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.last_reload_at: Optional[float] = None
+        self.failed_versions = set()
+        self.on_swap: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+    
+    @property
+    def active_version(self) -> Optional[str]:
+        return self.loader.registry_version
+    
+    def warm_up(self, candidate: ModelLoader):
+        """Score the warmup rows and check the output is usable"""
+        outputs = candidate.predict_batch(self.warmup_rows)
+        if len(outputs) != len(self.warmup_rows):
+            raise ModelReloadError(f"Warmup returned {len(outputs)} outputs for {len(self.warmup_rows)} rows")
+        
+        for output in outputs:
+            for value in (output.get("pred_proba") or {}).values():
+                if not math.isfinite(value):
+                    raise ModelReloadError(f"Warmup produced a non-finite probability: {value}")
+        
+        if candidate.prakriti_encoder is not None:
+            candidate.predict_prakriti(WARMUP_ASSESSMENT)
+    
+    def reload(self, version: str, persist: bool = True) -> Dict[str, Any]:
+        """
+        Load a version into a fresh loader, warm it up and swap it in
+        
+        The running model is left untouched on any failure. With persist the
+        registry manifest is updated so other workers follow.
+        """
+        with self._lock:
+            outgoing = self.active_version
+            start = time.perf_counter()
+            
+            try:
+                ayur_path, prakriti_path = self.registry.paths(version)
+                candidate = ModelLoader().initialize(ayur_path, prakriti_path, version)
+                self.warm_up(candidate)
+            except Exception as e:
+                self.failed_versions.add(version)
+                self.last_error = f"{version}: {e}"
+                logger.error(f"Model version {version} rejected, keeping {outgoing}: {e}")
+                raise ModelReloadError(f"Model version {version} failed to load or warm up: {e}") from e
+            
+            self.loader.swap_from(candidate)
+            self.previous_version = outgoing
+            self.failed_versions.discard(version)
+            self.last_error = None
+            self.last_reload_at = time.time()
+            
+            if persist:
+                self.registry.write_manifest(version, outgoing)
+            self._manifest_mtime = self.registry.manifest_mtime()
+            
+            for callback in self.on_swap:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Post-swap callback failed: {e}")
+            
+            elapsed = time.perf_counter() - start
+            logger.info(f"Activated model version {version} (previous {outgoing}) in {elapsed:.2f}s")
+            return self.status()
+    
+    def rollback(self) -> Dict[str, Any]:
+        """Reactivate the version that was active before the last swap"""
+        previous = self.previous_version
+        if previous is None:
+            previous = self.registry.read_manifest().get("previous")
+        if previous is None or previous == self.active_version:
+            raise ModelReloadError("No previous model version to roll back to")
+        return self.reload(previous)
+    
+    def check_manifest(self) -> bool:
+        """Reload when another process changed the active version; True if a swap happened"""
+        mtime = self.registry.manifest_mtime()
+        if mtime is None or mtime == self._manifest_mtime:
+            return False
+        self._manifest_mtime = mtime
+        
+        manifest = self.registry.read_manifest()
+        active = manifest.get("active") or DEFAULT_VERSION
+        if active == self.active_version or active in self.failed_versions:
+            return False
+        
+        try:
+            self.reload(active, persist=False)
+        except ModelReloadError:
+            return False
+        return True
+    
+    async def watch(self, interval: float):
+        """Poll the registry manifest until cancelled"""
+        self._manifest_mtime = self.registry.manifest_mtime()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.check_manifest)
+            except Exception as e:
+                logger.error(f"Model watcher error: {e}")
+    
+    def status(self) -> Dict[str, Any]:
+        """Active/previous versions and the outcome of the last reload"""
+        return {
+            "active_version": self.active_version,
+            "previous_version": self.previous_version,
+            "model_version": self.loader.model_version,
+            "model_token": self.loader.model_token,
+            "registered_versions": self.registry.list_versions(),
+            "last_reload_at": self.last_reload_at,
+            "last_error": self.last_error
+        }
+
+
+# Global reloader instance bound to the global model loader
+model_reloader = ModelReloader(model_loader, model_registry)
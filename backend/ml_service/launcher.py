@@ -0,0 +1,229 @@
+"""
+Production launcher - preload models once, then fork workers that share them
+
+The parent process loads the models and encoders, freezes the garbage
+collector so collections in the workers do not touch (and un-share) the
+preloaded objects, binds the listening socket and forks N uvicorn workers.
+Workers inherit the loaded models copy-on-write.
+
+Workers are recycled after --max-requests (plus jitter) and on SIGHUP,
+one at a time, so capacity never drops to zero.
+
+Usage:
+    python launcher.py --workers 4 --port 8000
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+# Allow running as a script from inside ml_service/
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from config import (
+    validate_paths, SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS,
+    WORKER_MAX_REQUESTS, WORKER_MAX_REQUESTS_JITTER, WORKER_GRACEFUL_TIMEOUT
+)
+from model_loader import initialize_models
+from diet_planner import diet_planner
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("launcher")
+
+
+class WorkerSupervisor:
+    """Fork, monitor and recycle uvicorn workers sharing preloaded models"""
+    
+    def __init__(
+        self,
+        workers: int,
+        host: str,
+        port: int,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: float = 30.0
+    ):
+        self.workers = max(1, workers)
+        self.host = host
+        self.port = port
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.children: Dict[int, float] = {}
+        self.sock = None
+        self._stopping = False
+        self._recycle_requested = False
+    
+    def preload(self):
+        """Load models in the parent and freeze them out of GC tracking"""
+        # Collections in the parent would only move objects between generations
+        gc.disable()
+        
+        start = time.perf_counter()
+        validate_paths()
+        initialize_models()
+        diet_planner.load()
+        
+        # Import the app in the parent so module-level globals are shared as well.
+        # No warm-up prediction here: starting XGBoost's OpenMP threads before
+        # fork() can deadlock the children.
+        from main import app  # noqa: F401
+        
+        gc.collect()
+        gc.freeze()
+        logger.info(f"Preloaded models in {time.perf_counter() - start:.2f}s, froze {gc.get_freeze_count()} objects")
+    
+    def bind(self):
+        """Bind the shared listening socket before forking"""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+        logger.info(f"Listening on http://{self.host}:{self.port}")
+    
+    def spawn(self) -> int:
+        """Fork one worker"""
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self.children[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+        return pid
+    
+    def _run_worker(self):
+        """Worker body - never returns"""
+        exit_code = 0
+        try:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            gc.enable()
+            
+            import uvicorn
+            from main import app
+            
+            limit = None
+            if self.max_requests > 0:
+                limit = self.max_requests + random.randint(0, max(0, self.max_requests_jitter))
+            
+            config = uvicorn.Config(
+                app,
+                host=self.host,
+                port=self.port,
+                limit_max_requests=limit,
+                timeout_graceful_shutdown=int(self.graceful_timeout),
+                log_level="info"
+            )
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} crashed: {e}", exc_info=True)
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+    
+    def _handle_recycle(self, signum, frame):
+        self._recycle_requested = True
+    
+    def recycle(self):
+        """Rolling restart - replace workers one at a time"""
+        logger.info("Recycling workers")
+        for pid in list(self.children):
+            self.spawn()
+            self._terminate(pid)
+    
+    def _terminate(self, pid: int):
+        """Ask a worker to finish in-flight requests and exit"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.children.pop(pid, None)
+            return
+        
+        deadline = time.monotonic() + self.graceful_timeout
+        while time.monotonic() < deadline:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+            if done:
+                break
+            time.sleep(0.1)
+        else:
+            logger.warning(f"Worker {pid} did not exit in {self.graceful_timeout}s - killing")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        
+        self.children.pop(pid, None)
+    
+    def run(self):
+        """Preload, fork workers and supervise until SIGTERM/SIGINT"""
+        self.preload()
+        self.bind()
+        
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_recycle)
+        
+        for _ in range(self.workers):
+            self.spawn()
+        
+        while not self._stopping:
+            if self._recycle_requested:
+                self._recycle_requested = False
+                self.recycle()
+            
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = 0, 0
+            
+            if pid and pid in self.children:
+                self.children.pop(pid)
+                if not self._stopping:
+                    # Exits after max_requests are the normal recycling path
+                    logger.info(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)} - replacing")
+                    self.spawn()
+                continue
+            
+            time.sleep(0.2)
+        
+        logger.info("Shutting down workers")
+        for pid in list(self.children):
+            self._terminate(pid)
+        self.sock.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Ayutra ML service with preloaded, forked workers")
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--workers', type=int, default=SERVICE_WORKERS)
+    parser.add_argument('--max-requests', type=int, default=WORKER_MAX_REQUESTS,
+                        help="Recycle a worker after this many requests (0 = never)")
+    parser.add_argument('--max-requests-jitter', type=int, default=WORKER_MAX_REQUESTS_JITTER,
+                        help="Random extra requests per worker so recycles are staggered")
+    parser.add_argument('--graceful-timeout', type=float, default=WORKER_GRACEFUL_TIMEOUT,
+                        help="Seconds a worker gets to finish in-flight requests")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    WorkerSupervisor(
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        graceful_timeout=args.graceful_timeout
+    ).run()
@@ -1,25 +1,61 @@
 """
 FastAPI application for ML model inference
 """
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
 from datetime import datetime
 import logging
-from typing import Dict, Any
-import hashlib
-import json
+from typing import Dict, Any, List, Optional
+import asyncio
+import hmac
+import os
+import time
 
 try:
-    from .config import validate_paths, ALLOWED_KEYS
-    from .schemas import PatientInput, PredictionResponse, ModelOutput
-    from .model_loader import initialize_models, model_loader
+    from .config import (
+        validate_paths, ALLOWED_KEYS, MICRO_BATCH_ENABLED, DATASET_XLSX_PATH,
+        ADMIN_TOKEN, MODEL_WATCH_INTERVAL_SECONDS, STREAM_CHUNK_SIZE, STREAM_MAX_LINE_BYTES
+    )
+    from .schemas import (
+        PatientInput, PredictionResponse, ModelOutput,
+        BatchPredictionRequest, BatchPredictionResponse, ModelReloadRequest,
+        PrakritiAssessment, PrakritiResponse, ExplanationResponse, WhatIfUpdate, WhatIfSweep, format_validation_errors
+    )
+    from .model_loader import initialize_models, model_loader, ExplanationUnavailableError
     from .clinical_safety import ClinicalSafetyChecker
+    from .executor import inference_executor, ExecutorSaturatedError, InferenceTimeoutError
+    from .batcher import micro_batcher, prakriti_batcher, explain_batcher
+    from .cache import prediction_cache, prediction_flights, prakriti_flights, explain_flights
+    from .hot_reload import model_reloader, ModelReloadError
+    from .metrics import metrics_registry, MetricsMiddleware, StageClock, Counter, Gauge
+    from .diet_planner import diet_planner
+    from .streaming import DuplexStreamingResponse, body_format, iter_ndjson, iter_csv
+    from .serialization import FastJSONResponse, dumps, payload_hash as hash_payload
+    from .whatif import whatif_sessions, apply_changes
 except ImportError:
-    from config import validate_paths, ALLOWED_KEYS
-    from schemas import PatientInput, PredictionResponse, ModelOutput
-    from model_loader import initialize_models, model_loader
+    from config import (
+        validate_paths, ALLOWED_KEYS, MICRO_BATCH_ENABLED, DATASET_XLSX_PATH,
+        ADMIN_TOKEN, MODEL_WATCH_INTERVAL_SECONDS, STREAM_CHUNK_SIZE, STREAM_MAX_LINE_BYTES
+    )
+    from schemas import (
+        PatientInput, PredictionResponse, ModelOutput,
+        BatchPredictionRequest, BatchPredictionResponse, ModelReloadRequest,
+        PrakritiAssessment, PrakritiResponse, ExplanationResponse, WhatIfUpdate, WhatIfSweep, format_validation_errors
+    )
+    from model_loader import initialize_models, model_loader, ExplanationUnavailableError
     from clinical_safety import ClinicalSafetyChecker
+    from executor import inference_executor, ExecutorSaturatedError, InferenceTimeoutError
+    from batcher import micro_batcher, prakriti_batcher, explain_batcher
+    from cache import prediction_cache, prediction_flights, prakriti_flights, explain_flights
+    from hot_reload import model_reloader, ModelReloadError
+    from metrics import metrics_registry, MetricsMiddleware, StageClock, Counter, Gauge
+    from diet_planner import diet_planner
+    from streaming import DuplexStreamingResponse, body_format, iter_ndjson, iter_csv
+    from serialization import FastJSONResponse, dumps, payload_hash as hash_payload
+    from whatif import whatif_sessions, apply_changes
 
 # Configure logging
 logging.basicConfig(
@@ -44,22 +80,224 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts, error types, in-flight gauges and per-stage timers
+app.add_middleware(MetricsMiddleware)
+
 # Global safety checker
 safety_checker = ClinicalSafetyChecker()
 
+# Executor, micro-batcher and cache state, copied into gauges on each /metrics scrape
+inference_queue_depth = metrics_registry.register(Gauge(
+    "ml_inference_queue_depth", "Model calls running or waiting in the inference executor"
+))
+inference_capacity = metrics_registry.register(Gauge(
+    "ml_inference_capacity", "Model calls the inference executor accepts before rejecting"
+))
+inference_rejected = metrics_registry.register(Counter(
+    "ml_inference_rejected_total", "Model calls rejected because the executor was saturated"
+))
+inference_timeouts = metrics_registry.register(Counter(
+    "ml_inference_timeouts_total", "Model calls that exceeded the inference timeout"
+))
+micro_batch_queued = metrics_registry.register(Gauge(
+    "ml_micro_batch_queued", "Rows waiting for the next micro-batch"
+))
+cache_lookups = metrics_registry.register(Counter(
+    "ml_prediction_cache_lookups_total", "Prediction cache lookups by result", labelnames=("result",)
+))
+cache_entries = metrics_registry.register(Gauge(
+    "ml_prediction_cache_entries", "Entries in the in-process prediction cache"
+))
+cache_hit_ratio = metrics_registry.register(Gauge(
+    "ml_prediction_cache_hit_ratio", "Share of prediction cache lookups served from cache"
+))
+whatif_session_count = metrics_registry.register(Gauge(
+    "ml_whatif_sessions", "Open what-if sessions in this worker"
+))
+coalesced_requests = metrics_registry.register(Counter(
+    "ml_coalesced_requests_total", "Requests that awaited an identical in-flight computation instead of starting one",
+    labelnames=("call",)
+))
+metrics_registry.register(micro_batcher.batch_size)
+metrics_registry.register(micro_batcher.wait_time)
+metrics_registry.register(prakriti_batcher.batch_size)
+metrics_registry.register(prakriti_batcher.wait_time)
+metrics_registry.register(explain_batcher.batch_size)
+metrics_registry.register(explain_batcher.wait_time)
+
+
+def collect_service_metrics():
+    executor_stats = inference_executor.stats()
+    inference_queue_depth.set(executor_stats["pending"])
+    inference_capacity.set(executor_stats["capacity"])
+    inference_rejected.set(executor_stats["rejected"])
+    inference_timeouts.set(executor_stats["timed_out"])
+    micro_batch_queued.set(micro_batcher.queued + prakriti_batcher.queued + explain_batcher.queued)
+    
+    cache_stats = prediction_cache.stats()
+    cache_lookups.set(cache_stats["hits"], "hit")
+    cache_lookups.set(cache_stats["shared_hits"], "shared_hit")
+    cache_lookups.set(cache_stats["misses"], "miss")
+    cache_entries.set(cache_stats["entries"])
+    cache_hit_ratio.set(cache_stats["hit_rate"])
+    coalesced_requests.set(prediction_flights.coalesced, "predict")
+    coalesced_requests.set(prakriti_flights.coalesced, "prakriti")
+    coalesced_requests.set(explain_flights.coalesced, "explain")
+    whatif_session_count.set(whatif_sessions.stats()["sessions"])
+
+
+metrics_registry.add_collector(collect_service_metrics)
+
+# Background task polling the model registry for a new active version
+model_watch_task: Optional[asyncio.Task] = None
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
     """Initialize models on startup"""
     try:
-        validate_paths()
-        initialize_models()
+        # Workers forked by launcher.py inherit models preloaded by the parent
+        if not model_loader.models_loaded:
+            validate_paths()
+            initialize_models()
+        if not diet_planner.loaded:
+            diet_planner.load()
+        if safety_checker.rule_engine is None:
+            safety_checker.load_rules()
+        inference_executor.start()
+        
+        # Process workers hold their own copy of the models - replace them after a swap
+        if inference_executor.mode == 'process':
+            model_reloader.on_swap.append(inference_executor.restart)
+        
+        global model_watch_task
+        if MODEL_WATCH_INTERVAL_SECONDS > 0:
+            model_watch_task = asyncio.create_task(model_reloader.watch(MODEL_WATCH_INTERVAL_SECONDS))
+        
         logger.info("ML Service started successfully")
     except Exception as e:
         logger.error(f"Failed to start ML service: {e}")
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop inference workers on shutdown"""
+    if model_watch_task is not None:
+        model_watch_task.cancel()
+    inference_executor.shutdown()
+
+
+def raise_for_executor_error(e: Exception):
+    """Map executor backpressure and timeouts onto 503/504 responses"""
+    if isinstance(e, ExecutorSaturatedError):
+        logger.warning("Inference executor saturated - rejecting request")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    if isinstance(e, InferenceTimeoutError):
+        logger.warning(f"Inference timed out: {e}")
+        raise HTTPException(status_code=504, detail=str(e))
+
+
+async def run_prediction(sanitized: Dict[str, Any]) -> Dict[str, Any]:
+    """Score one sanitized input, coalescing with concurrent requests when enabled"""
+    if MICRO_BATCH_ENABLED:
+        return await micro_batcher.submit(sanitized)
+    return await inference_executor.run('predict', sanitized)
+
+
+async def predict_with_cache(sanitized: Dict[str, Any], payload_hash: str, clock: StageClock):
+    """
+    Return (model_output, warnings), served from the prediction cache when possible
+    
+    On a miss, concurrent requests for the same payload and model - e.g. a
+    dashboard firing /predict and /dietplan together - share one prediction.
+    """
+    model_token = model_loader.model_token
+    cached = prediction_cache.get(payload_hash, model_token)
+    clock.lap('cache')
+    if cached is not None:
+        return cached["model_output"], list(cached["warnings"])
+    
+    led = False
+    
+    async def compute():
+        # Only runs for the request that started the flight
+        nonlocal led
+        led = True
+        model_output = await run_prediction(sanitized)
+        clock.lap('dispatch')
+        warnings = safety_checker.check_safety(sanitized, model_output)
+        clock.lap('safety')
+        entry = {"model_output": model_output, "warnings": warnings}
+        prediction_cache.set(payload_hash, model_token, entry)
+        return entry
+    
+    entry = await prediction_flights.run((payload_hash, model_token), compute)
+    if not led:
+        clock.lap('coalesced')
+    
+    return entry["model_output"], list(entry["warnings"])
+
+
+async def infer_prakriti(assessment: Dict[str, Any]) -> Dict[str, Any]:
+    """Infer prakriti for one assessment, served from the prediction cache when possible"""
+    # Namespaced so assessment hashes never collide with patient payload hashes
+    payload_hash = hash_payload(assessment, namespace="prakriti:")
+    model_token = model_loader.model_token
+    cached = prediction_cache.get(payload_hash, model_token)
+    if cached is not None:
+        return cached["prakriti_output"]
+    
+    async def compute():
+        if MICRO_BATCH_ENABLED:
+            prakriti_output = await prakriti_batcher.submit(assessment)
+        else:
+            prakriti_output = await inference_executor.run('predict_prakriti', assessment)
+        prediction_cache.set(payload_hash, model_token, {"prakriti_output": prakriti_output})
+        return prakriti_output
+    
+    return await prakriti_flights.run((payload_hash, model_token), compute)
+
+
+async def explain_with_cache(sanitized: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Per-field contributions for one sanitized input, served from the prediction cache when possible
+    
+    Only explain requests get here, so /predict never pays for contributions.
+    """
+    payload_hash = hash_payload(sanitized, namespace="explain:")
+    model_token = model_loader.model_token
+    cached = prediction_cache.get(payload_hash, model_token)
+    if cached is not None:
+        return cached["explanation"]
+    
+    async def compute():
+        if MICRO_BATCH_ENABLED:
+            explanation = await explain_batcher.submit(sanitized)
+        else:
+            explanation = await inference_executor.run('explain', sanitized)
+        prediction_cache.set(payload_hash, model_token, {"explanation": explanation})
+        return explanation
+    
+    return await explain_flights.run((payload_hash, model_token), compute)
+
+
+async def resolve_prakriti(data: Dict[str, Any], clock: StageClock):
+    """Fill in prakriti from the assessment when the patient did not supply it"""
+    assessment = data.pop('prakriti_assessment', None)
+    if assessment is None or data.get('prakriti'):
+        return None
+    
+    prakriti_output = await infer_prakriti(assessment)
+    data['prakriti'] = prakriti_output['prakriti']
+    clock.lap('prakriti')
+    return prakriti_output
+
+
 @app.get("/api/model/health")
 async def health_check():
     """Health check endpoint"""
@@ -67,7 +305,10 @@ async def health_check():
         return {
             "status": "healthy",
             "model_version": model_loader.model_version if model_loader.model_version else "unknown",
-            "models_loaded": model_loader.ayur_model is not None and model_loader.prakriti_model is not None,
+            "active_version": model_reloader.active_version,
+            "previous_version": model_reloader.previous_version,
+            "models_loaded": model_loader.models_loaded,
+            "inference": inference_executor.stats(),
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
     except Exception as e:
@@ -78,6 +319,74 @@ async def health_check():
         )
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text-format metrics for this worker process"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/model/stats")
+async def service_stats():
+    """Inference executor load, micro-batching histograms and cache counters"""
+    return {
+        "inference": inference_executor.stats(),
+        "micro_batching": {
+            "enabled": MICRO_BATCH_ENABLED,
+            **micro_batcher.stats()
+        },
+        "explain_batching": explain_batcher.stats(),
+        "prediction_cache": prediction_cache.stats(),
+        "single_flight": {
+            "predict": prediction_flights.stats(),
+            "prakriti": prakriti_flights.stats(),
+            "explain": explain_flights.stats()
+        },
+        "whatif": whatif_sessions.stats(),
+        "tree_engine": model_loader.tree_engine.stats() if model_loader.tree_engine else {"engine": "sklearn"},
+        "model_bundle": model_loader.bundle.stats() if model_loader.bundle else None,
+        "diet_planner": diet_planner.stats(),
+        "clinical_rules": safety_checker.rule_engine.stats() if safety_checker.rule_engine else None,
+        "worker_pid": os.getpid()
+    }
+
+
+def require_admin(token: Optional[str]):
+    """Admin endpoints are disabled unless ML_ADMIN_TOKEN is set and matched"""
+    if not ADMIN_TOKEN or not token or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin access denied")
+
+
+@app.get("/api/model/versions")
+async def model_versions():
+    """Registered model versions and the outcome of the last reload"""
+    return model_reloader.status()
+
+
+@app.post("/api/model/admin/reload")
+async def reload_model(payload: ModelReloadRequest, x_admin_token: Optional[str] = Header(None)):
+    """
+    Load, warm up and activate a registered model version
+    
+    Requests in flight finish on the old model; the old model keeps serving
+    if the new one fails to load or warm up.
+    """
+    require_admin(x_admin_token)
+    try:
+        return await asyncio.to_thread(model_reloader.reload, payload.version)
+    except ModelReloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/api/model/admin/rollback")
+async def rollback_model(x_admin_token: Optional[str] = Header(None)):
+    """Reactivate the previously active model version"""
+    require_admin(x_admin_token)
+    try:
+        return await asyncio.to_thread(model_reloader.rollback)
+    except ModelReloadError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 @app.post("/api/model/predict", response_model=PredictionResponse)
 async def predict(request: Request, payload: PatientInput):
     """
@@ -85,40 +394,47 @@ async def predict(request: Request, payload: PatientInput):
     
     Accepts only whitelisted input keys and returns model predictions
     """
+    clock = request.state.stage_clock
+    clock.lap('validate')
     try:
         # Convert Pydantic model to dict
         data = payload.model_dump(exclude_none=True)
         
+        # Infer prakriti from the assessment when it is missing
+        prakriti_output = await resolve_prakriti(data, clock)
+        
         # Sanitize - ensure only allowed keys
         sanitized = {k: v for k, v in data.items() if k in ALLOWED_KEYS}
         
         # Log request (hash payload for privacy)
-        payload_hash = hashlib.sha256(json.dumps(sanitized, sort_keys=True).encode()).hexdigest()[:16]
-        logger.info(f"Prediction request - hash: {payload_hash}, model_version: {model_loader.model_version}")
+        payload_hash = hash_payload(sanitized)
+        logger.info(f"Prediction request - hash: {payload_hash[:16]}, model_version: {model_loader.model_version}")
+        clock.lap('sanitize')
         
-        # Run prediction
-        model_output = model_loader.predict(sanitized)
+        # Run prediction off the event loop and check clinical safety (cached by payload hash)
+        model_output, warnings = await predict_with_cache(sanitized, payload_hash, clock)
         
-        # Check clinical safety
-        warnings = safety_checker.check_safety(sanitized, model_output)
-        
-        # Build response
-        response = PredictionResponse(
-            meta={
+        # Build response (PredictionResponse layout, encoded once without re-validation)
+        response = {
+            "meta": {
                 "model_version": model_loader.model_version or "unknown",
                 "generated_at": datetime.utcnow().isoformat() + "Z",
-                "dataset_path": str(model_loader.dataset) if hasattr(model_loader, 'dataset') else None
+                "dataset_path": str(DATASET_XLSX_PATH)
             },
-            patient=sanitized,
-            model_output=model_output,
-            warnings=warnings,
-            diet_plan=None  # Will be generated separately if needed
-        )
-        
-        logger.info(f"Prediction completed - hash: {payload_hash}, warnings: {len(warnings)}")
+            "patient": sanitized,
+            "model_output": model_output,
+            "warnings": warnings,
+            "prakriti_output": prakriti_output,
+            "diet_plan": None  # Will be generated separately if needed
+        }
         
-        return response
+        logger.info(f"Prediction completed - hash: {payload_hash[:16]}, warnings: {len(warnings)}")
+        clock.finish()
         
+        return FastJSONResponse(response)
+    
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
     except ValueError as e:
         # Validation errors from Pydantic
         logger.warning(f"Validation error: {e}")
@@ -128,6 +444,284 @@ async def predict(request: Request, payload: PatientInput):
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 
+@app.post("/api/model/explain", response_model=ExplanationResponse)
+async def explain(request: Request, payload: PatientInput):
+    """
+    Prediction with the reason for it
+    
+    Returns the /predict response plus each input field's TreeSHAP
+    contribution to the model's log-odds, largest first
+    """
+    clock = request.state.stage_clock
+    clock.lap('validate')
+    try:
+        data = payload.model_dump(exclude_none=True)
+        prakriti_output = await resolve_prakriti(data, clock)
+        sanitized = {k: v for k, v in data.items() if k in ALLOWED_KEYS}
+        payload_hash = hash_payload(sanitized)
+        logger.info(f"Explanation request - hash: {payload_hash[:16]}, model_version: {model_loader.model_version}")
+        clock.lap('sanitize')
+        
+        # The prediction usually comes from the cache a /predict for this patient filled
+        (model_output, warnings), explanation = await asyncio.gather(
+            predict_with_cache(sanitized, payload_hash, clock),
+            explain_with_cache(sanitized)
+        )
+        # Whatever the explanation took beyond the prediction
+        clock.lap('explain')
+        
+        response = {
+            "meta": {
+                "model_version": model_loader.model_version or "unknown",
+                "generated_at": datetime.utcnow().isoformat() + "Z",
+                "dataset_path": str(DATASET_XLSX_PATH)
+            },
+            "patient": sanitized,
+            "model_output": model_output,
+            "warnings": warnings,
+            "prakriti_output": prakriti_output,
+            "explanation": explanation
+        }
+        clock.finish()
+        return FastJSONResponse(response)
+    
+    except ExplanationUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
+    except ValueError as e:
+        logger.warning(f"Validation error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Explanation error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
+
+
+async def score_patients(rows: List[Dict[str, Any]], clock: StageClock) -> List[Dict[str, Any]]:
+    """
+    Score validated patients with one prakriti call and one model call
+    
+    Returns one result (patient, model_output, warnings and prakriti_output
+    when inferred) per row, in order.
+    """
+    # Infer missing prakriti for every row that carries an assessment, with one model call
+    prakriti_outputs = [None] * len(rows)
+    pending = [i for i, row in enumerate(rows) if 'prakriti_assessment' in row and not row.get('prakriti')]
+    if pending:
+        outputs = await inference_executor.run(
+            'predict_prakriti_batch', [rows[i]['prakriti_assessment'] for i in pending]
+        )
+        for i, prakriti_output in zip(pending, outputs):
+            rows[i]['prakriti'] = prakriti_output['prakriti']
+            prakriti_outputs[i] = prakriti_output
+    
+    rows = [{k: v for k, v in row.items() if k in ALLOWED_KEYS} for row in rows]
+    # Row validation happens here rather than before the handler
+    clock.lap('validate')
+    
+    # Run prediction once for all rows, off the event loop
+    model_outputs = await inference_executor.run('predict_batch', rows)
+    clock.lap('dispatch')
+    
+    # Clinical rules for all rows in one vectorized pass
+    batch_warnings = safety_checker.check_safety_batch(rows)
+    
+    results = []
+    for sanitized, model_output, warnings, prakriti_output in zip(rows, model_outputs, batch_warnings, prakriti_outputs):
+        result = {"patient": sanitized, "model_output": model_output, "warnings": warnings}
+        if prakriti_output is not None:
+            result["prakriti_output"] = prakriti_output
+        results.append(result)
+    clock.lap('safety')
+    return results
+
+
+@app.post("/api/model/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch(request: Request, payload: BatchPredictionRequest):
+    """
+    Batch prediction endpoint
+    
+    Validates each patient individually, then scores all valid patients
+    with a single model call. Invalid rows are reported in place.
+    """
+    clock = request.state.stage_clock
+    try:
+        results: List[Dict[str, Any]] = [None] * len(payload.patients)
+        valid_indices = []
+        valid_rows = []
+        
+        for index, raw in enumerate(payload.patients):
+            try:
+                patient = PatientInput.model_validate(raw)
+            except ValidationError as e:
+                results[index] = {"index": index, "errors": format_validation_errors(e)}
+                continue
+            
+            data = patient.model_dump(exclude_none=True)
+            valid_indices.append(index)
+            valid_rows.append(data)
+        
+        logger.info(f"Batch prediction request - rows: {len(results)}, valid: {len(valid_rows)}, model_version: {model_loader.model_version}")
+        
+        for index, result in zip(valid_indices, await score_patients(valid_rows, clock)):
+            results[index] = {"index": index, **result}
+        
+        response = {
+            "meta": {
+                "model_version": model_loader.model_version or "unknown",
+                "generated_at": datetime.utcnow().isoformat() + "Z",
+                "total": len(results),
+                "succeeded": len(valid_rows),
+                "failed": len(results) - len(valid_rows)
+            },
+            "results": results
+        }
+        
+        logger.info(f"Batch prediction completed - rows: {len(results)}")
+        clock.finish()
+        
+        return FastJSONResponse(response)
+    
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
+    except Exception as e:
+        logger.error(f"Batch prediction error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Batch prediction failed: {str(e)}")
+
+
+async def score_stream_chunk(chunk: List[Dict[str, Any]], clock: StageClock) -> List[Dict[str, Any]]:
+    """
+    Score one chunk of a stream - entries are {"index", "errors"} or {"index", "row"}
+    
+    A saturated executor is waited out rather than failing the upload; a timeout
+    or model error fails only this chunk's rows.
+    """
+    valid = [entry for entry in chunk if "row" in entry]
+    scored = {}
+    while valid:
+        try:
+            results = await score_patients([entry["row"] for entry in valid], clock)
+            scored = {entry["index"]: result for entry, result in zip(valid, results)}
+            break
+        except ExecutorSaturatedError as e:
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            logger.error(f"Stream chunk scoring failed: {e}", exc_info=not isinstance(e, InferenceTimeoutError))
+            message = str(e) if isinstance(e, InferenceTimeoutError) else f"Prediction failed: {e}"
+            scored = {entry["index"]: {"errors": [{"field": None, "message": message}]} for entry in valid}
+            break
+    
+    return [
+        {"index": entry["index"], **scored[entry["index"]]} if "row" in entry else entry
+        for entry in chunk
+    ]
+
+
+@app.post("/api/model/predict/stream")
+async def predict_stream(request: Request):
+    """
+    Streaming bulk prediction endpoint
+    
+    Reads an NDJSON (application/x-ndjson) or CSV (text/csv, header row) body
+    incrementally, scores it in chunks of ML_STREAM_CHUNK_SIZE rows and streams
+    one NDJSON result per input row back, followed by a summary line. Memory
+    stays bounded by the chunk size however large the upload is.
+    """
+    body = body_format(request.headers.get('content-type'))
+    if body is None:
+        raise HTTPException(
+            status_code=415,
+            detail="Send application/x-ndjson (one patient object per line) or text/csv with a header row"
+        )
+    parse = iter_ndjson if body == 'ndjson' else iter_csv
+    clock = request.state.stage_clock
+    
+    async def results():
+        start = time.perf_counter()
+        counts = {"total": 0, "succeeded": 0, "failed": 0, "chunks": 0}
+        chunk: List[Dict[str, Any]] = []
+        
+        async def flush():
+            lines = []
+            for result in await score_stream_chunk(chunk, clock):
+                counts["succeeded" if "model_output" in result else "failed"] += 1
+                lines.append(dumps(result))
+            counts["chunks"] += 1
+            chunk.clear()
+            return b"\n".join(lines) + b"\n"
+        
+        try:
+            async for number, record in parse(request.stream(), STREAM_MAX_LINE_BYTES):
+                index = number - 1
+                counts["total"] += 1
+                if isinstance(record, str):
+                    chunk.append({"index": index, "errors": [{"field": None, "message": record}]})
+                else:
+                    try:
+                        patient = PatientInput.model_validate(record)
+                        chunk.append({"index": index, "row": patient.model_dump(exclude_none=True)})
+                    except ValidationError as e:
+                        chunk.append({"index": index, "errors": format_validation_errors(e)})
+                
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    yield await flush()
+            if chunk:
+                yield await flush()
+        except ClientDisconnect:
+            logger.warning(f"Client disconnected during stream after {counts['total']} rows")
+            return
+        
+        elapsed = time.perf_counter() - start
+        logger.info(f"Stream prediction completed - rows: {counts['total']}, failed: {counts['failed']}, elapsed: {elapsed:.2f}s")
+        summary = {
+            "model_version": model_loader.model_version or "unknown",
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+            **counts,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(counts["total"] / elapsed, 1) if elapsed > 0 else None
+        }
+        yield dumps({"summary": summary}) + b"\n"
+    
+    logger.info(f"Stream prediction request - format: {body}, model_version: {model_loader.model_version}")
+    clock.finish()
+    return DuplexStreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.post("/api/model/prakriti", response_model=PrakritiResponse)
+async def predict_prakriti(request: Request, payload: PrakritiAssessment):
+    """
+    Prakriti inference endpoint
+    
+    Scores a prakriti assessment with the prakriti model, batched and cached
+    like ayur predictions
+    """
+    clock = request.state.stage_clock
+    clock.lap('validate')
+    try:
+        assessment = payload.model_dump()
+        prakriti_output = await infer_prakriti(assessment)
+        clock.lap('prakriti')
+        
+        response = {
+            "meta": {
+                "model_version": model_loader.model_version or "unknown",
+                "generated_at": datetime.utcnow().isoformat() + "Z"
+            },
+            "assessment": assessment,
+            "prakriti_output": prakriti_output
+        }
+        logger.info(f"Prakriti inferred - prakriti: {prakriti_output['prakriti']}")
+        clock.finish()
+        
+        return FastJSONResponse(response)
+    
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
+    except Exception as e:
+        logger.error(f"Prakriti prediction error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Prakriti prediction failed: {str(e)}")
+
+
 @app.post("/api/model/dietplan")
 async def generate_diet_plan(request: Request, payload: PatientInput):
     """
@@ -135,53 +729,55 @@ async def generate_diet_plan(request: Request, payload: PatientInput):
     
     Runs model prediction and generates complete diet plan JSON
     """
+    clock = request.state.stage_clock
+    clock.lap('validate')
     try:
-        # Convert to dict and sanitize
+        # Convert to dict, infer missing prakriti and sanitize
         data = payload.model_dump(exclude_none=True)
+        prakriti_output = await resolve_prakriti(data, clock)
         sanitized = {k: v for k, v in data.items() if k in ALLOWED_KEYS}
         
         # Log request
-        payload_hash = hashlib.sha256(json.dumps(sanitized, sort_keys=True).encode()).hexdigest()[:16]
-        logger.info(f"Diet plan generation request - hash: {payload_hash}")
-        
-        # Run prediction
-        model_output = model_loader.predict(sanitized)
+        payload_hash = hash_payload(sanitized)
+        logger.info(f"Diet plan generation request - hash: {payload_hash[:16]}")
+        clock.lap('sanitize')
         
-        # Check clinical safety
-        warnings = safety_checker.check_safety(sanitized, model_output)
+        # Run prediction off the event loop and check clinical safety (cached by payload hash)
+        model_output, warnings = await predict_with_cache(sanitized, payload_hash, clock)
         
-        # Generate diet plan (placeholder - integrate with LLM or rule-based system)
-        diet_plan = {
-            "plan_summary": {
-                "total_calories": sanitized.get('daily_calories', 2000),
-                "diet_type": sanitized.get('diet_type', 'balanced'),
-                "duration_weeks": 4
-            },
-            "meals": [],  # Will be populated by diet generation logic
-            "shopping_list": [],
-            "notes": warnings.copy()
-        }
+        # Generate diet plan from the indexed food table (same payload -> same plan)
+        diet_plan = diet_planner.generate(
+            sanitized,
+            seed=payload_hash,
+            dosha_scores=prakriti_output["dosha_scores"] if prakriti_output else None,
+            notes=warnings.copy()
+        )
         
         # Sanitize diet plan based on clinical conditions
         diet_plan = safety_checker.sanitize_diet_plan(diet_plan, sanitized)
+        clock.lap('diet_plan')
         
         # Build response
         response = {
             "meta": {
                 "model_version": model_loader.model_version or "unknown",
                 "generated_at": datetime.utcnow().isoformat() + "Z",
-                "dataset_path": str(model_loader.dataset) if hasattr(model_loader, 'dataset') else None
+                "dataset_path": str(DATASET_XLSX_PATH)
             },
             "patient": sanitized,
             "model_output": model_output,
             "warnings": warnings,
+            "prakriti_output": prakriti_output,
             "diet_plan": diet_plan
         }
         
-        logger.info(f"Diet plan generated - hash: {payload_hash}")
-        
-        return response
+        logger.info(f"Diet plan generated - hash: {payload_hash[:16]}")
+        clock.finish()
         
+        return FastJSONResponse(response)
+    
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
     except ValueError as e:
         logger.warning(f"Validation error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -190,11 +786,198 @@ async def generate_diet_plan(request: Request, payload: PatientInput):
         raise HTTPException(status_code=500, detail=f"Diet plan generation failed: {str(e)}")
 
 
+def get_whatif_session(session_id: str):
+    session = whatif_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired what-if session - create a new one")
+    return session
+
+
+async def score_whatif(
+    session,
+    changes: List[Dict[str, Any]],
+    updated: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Score variants of the session's patient, keeping its encoded row for the next call
+    
+    With `updated` (the patient after the single change) the change is kept.
+    """
+    patient = session.patient
+    row, model_token, outputs = await inference_executor.run(
+        'predict_variants', patient, changes, session.row, session.model_token, updated is not None
+    )
+    # A sweep that overlapped an update must not store the old patient's row
+    if session.patient is patient:
+        changed = updated is not None or row is not session.row or model_token != session.model_token
+        if updated is not None:
+            session.patient = updated
+        session.row, session.model_token = row, model_token
+        if changed:
+            whatif_sessions.save(session)
+    return outputs
+
+
+def whatif_response(session, model_output: Dict[str, Any], warnings: List[str], changed: List[str]) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "model_version": model_loader.model_version or "unknown",
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+            "expires_in_seconds": whatif_sessions.ttl
+        },
+        "session_id": session.session_id,
+        "patient": session.patient,
+        "changed": changed,
+        "model_output": model_output,
+        "warnings": warnings,
+        "prakriti_output": session.prakriti_output
+    }
+
+
+@app.post("/api/model/whatif")
+async def create_whatif_session(request: Request, payload: PatientInput):
+    """
+    Start a what-if session
+    
+    Validates and scores the patient once and keeps it, with its encoded
+    feature row, for cheap follow-up changes and sweeps
+    """
+    clock = request.state.stage_clock
+    clock.lap('validate')
+    try:
+        data = payload.model_dump(exclude_none=True)
+        prakriti_output = await resolve_prakriti(data, clock)
+        sanitized = {k: v for k, v in data.items() if k in ALLOWED_KEYS}
+        session = whatif_sessions.create(sanitized, prakriti_output)
+        clock.lap('sanitize')
+        
+        model_output = (await score_whatif(session, [{}]))[0]
+        clock.lap('dispatch')
+        warnings = safety_checker.check_safety(sanitized, model_output)
+        clock.lap('safety')
+        
+        logger.info(f"What-if session started - session: {session.session_id[:8]}")
+        clock.finish()
+        return FastJSONResponse(whatif_response(session, model_output, warnings, []))
+    
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
+    except ValueError as e:
+        logger.warning(f"Validation error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"What-if session error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"What-if session failed: {str(e)}")
+
+
+@app.patch("/api/model/whatif/{session_id}")
+async def update_whatif_session(request: Request, session_id: str, payload: WhatIfUpdate):
+    """
+    Change some fields of a what-if session's patient and rescore it
+    
+    The whole patient is revalidated, but only the changed fields are
+    re-encoded. The changes are kept for later calls.
+    """
+    clock = request.state.stage_clock
+    clock.lap('validate')
+    session = get_whatif_session(session_id)
+    try:
+        async with session.update_lock:
+            try:
+                updated, changed = apply_changes(session.patient, payload.changes)
+            except ValidationError as e:
+                raise HTTPException(status_code=400, detail=format_validation_errors(e))
+            clock.lap('sanitize')
+            
+            model_output = (await score_whatif(session, [changed], updated))[0]
+        clock.lap('dispatch')
+        warnings = safety_checker.check_safety(updated, model_output)
+        clock.lap('safety')
+        
+        clock.finish()
+        return FastJSONResponse(whatif_response(session, model_output, warnings, sorted(changed)))
+    
+    except HTTPException:
+        raise
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
+    except Exception as e:
+        logger.error(f"What-if update error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"What-if update failed: {str(e)}")
+
+
+@app.post("/api/model/whatif/{session_id}/sweep")
+async def sweep_whatif_session(request: Request, session_id: str, payload: WhatIfSweep):
+    """
+    Score the session's patient across the values of one field
+    
+    Every variant is validated like a full request, then all of them are
+    encoded from the session's row and scored as one matrix. Nothing is
+    kept - the session's patient is unchanged afterwards.
+    """
+    clock = request.state.stage_clock
+    clock.lap('validate')
+    session = get_whatif_session(session_id)
+    try:
+        values, variants = [], []
+        for value in payload.points():
+            try:
+                variant, changed = apply_changes(session.patient, {**payload.changes, payload.field: value})
+            except ValidationError as e:
+                errors = format_validation_errors(e)
+                raise HTTPException(status_code=400, detail=[{**error, "value": value} for error in errors])
+            values.append(variant.get(payload.field))
+            variants.append(changed)
+        clock.lap('sanitize')
+        
+        outputs = await score_whatif(session, variants)
+        clock.lap('dispatch')
+        
+        response = {
+            "meta": {
+                "model_version": model_loader.model_version or "unknown",
+                "generated_at": datetime.utcnow().isoformat() + "Z",
+                "points": len(outputs)
+            },
+            "session_id": session.session_id,
+            "field": payload.field,
+            "changes": payload.changes,
+            "points": [
+                {
+                    "value": value,
+                    "pred_label": output["pred_label"],
+                    "pred_score": output["pred_score"],
+                    "pred_proba": output["pred_proba"]
+                }
+                for value, output in zip(values, outputs)
+            ]
+        }
+        clock.finish()
+        return FastJSONResponse(response)
+    
+    except HTTPException:
+        raise
+    except (ExecutorSaturatedError, InferenceTimeoutError) as e:
+        raise_for_executor_error(e)
+    except Exception as e:
+        logger.error(f"What-if sweep error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"What-if sweep failed: {str(e)}")
+
+
+@app.delete("/api/model/whatif/{session_id}")
+async def delete_whatif_session(session_id: str):
+    """End a what-if session"""
+    if not whatif_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired what-if session")
+    return {"deleted": session_id}
+
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Custom HTTP exception handler"""
     return JSONResponse(
         status_code=exc.status_code,
+        headers=getattr(exc, "headers", None),
         content={
             "success": False,
             "error": {
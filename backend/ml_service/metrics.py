@@ -0,0 +1,340 @@
+"""
+Lightweight in-process metrics primitives with Prometheus text exposition
+
+Metrics are kept per process; with several workers each one reports its own.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Hot-path timers use the monotonic high-resolution clock
+now = time.perf_counter
+
+
+def _format_value(value: Optional[float]) -> str:
+    if value is None:
+        return "NaN"
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Metric:
+    """Labelled metric base - values are keyed by a tuple of label values"""
+    
+    type = "untyped"
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+    
+    def samples(self) -> Iterable[Tuple[str, Dict[str, str], float]]:
+        """(suffix, labels, value) triples for exposition"""
+        return ()
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    
+    type = "counter"
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+    
+    def set(self, value: float, *labelvalues: str):
+        """Mirror a count that is kept elsewhere (e.g. in a component's stats())"""
+        with self._lock:
+            self._values[labelvalues] = value
+    
+    def value(self, *labelvalues: str) -> float:
+        return self._values.get(labelvalues, 0.0)
+    
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [("", self._labels(key), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    
+    type = "gauge"
+    
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def set(self, value: Optional[float], *labelvalues: str):
+        with self._lock:
+            self._values[labelvalues] = value
+    
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = (self._values.get(labelvalues) or 0.0) + amount
+    
+    def dec(self, *labelvalues: str, amount: float = 1.0):
+        self.inc(*labelvalues, amount=-amount)
+    
+    def value(self, *labelvalues: str) -> Optional[float]:
+        return self._values.get(labelvalues)
+    
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [("", self._labels(key), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram with cumulative, Prometheus-style buckets"""
+    
+    type = "histogram"
+    
+    def __init__(self, name: str, description: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last slot is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, value: float, *labelvalues: str):
+        """Record one observation"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def _copy(self, labelvalues: Tuple[str, ...]):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                return [0] * (len(self.buckets) + 1), 0.0, 0
+            return list(series[0]), series[1], series[2]
+    
+    def snapshot(self, *labelvalues: str) -> Dict[str, Any]:
+        """Cumulative bucket counts plus sum and count"""
+        counts, total, count = self._copy(labelvalues)
+        
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = count
+        
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else None,
+            "buckets": cumulative
+        }
+    
+    def samples(self):
+        with self._lock:
+            keys = list(self._series)
+        
+        out = []
+        for key in keys:
+            labels = self._labels(key)
+            counts, total, count = self._copy(key)
+            running = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                running += bucket_count
+                out.append(("_bucket", {**labels, "le": _format_value(bound)}, running))
+            out.append(("_bucket", {**labels, "le": "+Inf"}, count))
+            out.append(("_sum", labels, total))
+            out.append(("_count", labels, count))
+        return out
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text format"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+    
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics and self._metrics[metric.name] is not metric:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def add_collector(self, collector: Callable[[], None]):
+        """Callback run before each render, e.g. to copy pool or cache stats into gauges"""
+        self._collectors.append(collector)
+    
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Request path stages; preprocess/infer/contributions are timed per model call, which may cover a whole batch
+STAGES = (
+    'validate', 'prakriti', 'sanitize', 'cache', 'dispatch', 'preprocess', 'infer', 'contributions',
+    'explain', 'safety', 'diet_plan', 'serialize'
+)
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+# Global metrics registry and the request-path metrics shared across modules
+metrics_registry = MetricsRegistry()
+
+stage_latency = metrics_registry.register(Histogram(
+    "ml_stage_duration_seconds",
+    "Time spent per request stage (preprocess/infer per model call)",
+    LATENCY_BUCKETS,
+    labelnames=("stage",)
+))
+request_latency = metrics_registry.register(Histogram(
+    "ml_request_duration_seconds", "End-to-end request latency", LATENCY_BUCKETS, labelnames=("endpoint",)
+))
+requests_total = metrics_registry.register(Counter(
+    "ml_requests_total", "Requests handled", labelnames=("endpoint", "status")
+))
+request_errors = metrics_registry.register(Counter(
+    "ml_request_errors_total", "Failed requests by error type", labelnames=("endpoint", "type")
+))
+requests_in_flight = metrics_registry.register(Gauge(
+    "ml_requests_in_flight", "Requests currently being handled", labelnames=("endpoint",)
+))
+
+ERROR_TYPES = {
+    400: "bad_request",
+    403: "forbidden",
+    404: "not_found",
+    405: "method_not_allowed",
+    409: "conflict",
+    422: "validation",
+    500: "internal",
+    501: "not_implemented",
+    503: "saturated",
+    504: "timeout",
+}
+
+
+def observe_stage(stage: str, seconds: float):
+    stage_latency.observe(seconds, stage)
+
+
+class StageClock:
+    """Attributes consecutive intervals of one request to named stages"""
+    
+    __slots__ = ('last', 'finished')
+    
+    def __init__(self):
+        self.last = now()
+        self.finished = False
+    
+    def lap(self, stage: str):
+        """Charge the time since the previous lap to this stage"""
+        current = now()
+        stage_latency.observe(current - self.last, stage)
+        self.last = current
+    
+    def finish(self):
+        """Handler returned - the time until the response starts is serialization"""
+        self.last = now()
+        self.finished = True
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests, errors, in-flight requests and latency
+    
+    Puts a StageClock in request.state.stage_clock; the validate stage covers
+    body parsing and schema validation up to the handler's first lap.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._endpoints = None
+        self._templated = None
+        self._match = None
+    
+    def _endpoint(self, scope) -> str:
+        # Only route path templates become label values, to bound cardinality
+        if self._endpoints is None:
+            # starlette is imported here so pool processes importing this module don't pay for it
+            from starlette.routing import Match
+            self._match = Match
+            routes = [route for route in getattr(scope.get('app'), 'routes', ()) if hasattr(route, 'matches')]
+            self._endpoints = {route.path for route in routes if '{' not in route.path}
+            self._templated = [route for route in routes if '{' in route.path]
+        path = scope.get('path', '')
+        if path in self._endpoints:
+            return path
+        partial = None
+        for route in self._templated:
+            match, _ = route.matches(scope)
+            if match is self._match.FULL:
+                return route.path
+            if match is self._match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or 'other'
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        endpoint = self._endpoint(scope)
+        start = now()
+        clock = StageClock()
+        scope.setdefault('state', {})['stage_clock'] = clock
+        status = 500
+        
+        async def send_with_metrics(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if clock.finished:
+                    clock.lap('serialize')
+            await send(message)
+        
+        requests_in_flight.inc(endpoint)
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            requests_in_flight.dec(endpoint)
+            request_latency.observe(now() - start, endpoint)
+            requests_total.inc(endpoint, str(status))
+            if status >= 400:
+                request_errors.inc(endpoint, ERROR_TYPES.get(status, f"http_{status}"))
@@ -0,0 +1,337 @@
+"""
+Packed model bundle - one memory-mapped file instead of the pickled models
+
+Unpickling the models imports sklearn, scipy and xgboost and copies every
+tree into each process. A bundle stores what inference actually reads:
+
+- the feature schema (column order, kinds, defaults) and the compiled
+  feature encoder (category vocabularies, scaler means/scales)
+- the ayur model's trees as FlatTreeEngine node arrays, plus the native
+  booster (UBJ) for large batches
+- the prakriti forest as FlatForestClassifier node arrays
+
+Layout: magic, 64-byte aligned raw sections, JSON manifest, manifest
+length (u64), magic. The manifest records each section's offset, dtype,
+shape and SHA-256. Arrays are np.frombuffer views of a read-only mmap, so
+loading copies nothing and worker processes on one host share the pages.
+
+Bundles are keyed by the model fingerprint and built on first load; build
+ahead of deployment with:
+    python model_bundle.py
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    from .config import MODEL_BUNDLE_DIR, MODEL_BUNDLE_VERIFY, ENCODERS_PATH, SCALERS_PATH
+    from .registry import DEFAULT_VERSION
+    from .feature_encoder import CompiledFeatureEncoder, FeatureSchema
+    from .tree_engine import (
+        BoosterEngine, DeferredEngine, FlatForestClassifier, FlatTreeEngine,
+        PARITY_TOLERANCE, _iteration_range, _probe_difference, _probe_matrix
+    )
+except ImportError:
+    from config import MODEL_BUNDLE_DIR, MODEL_BUNDLE_VERIFY, ENCODERS_PATH, SCALERS_PATH
+    from registry import DEFAULT_VERSION
+    from feature_encoder import CompiledFeatureEncoder, FeatureSchema
+    from tree_engine import (
+        BoosterEngine, DeferredEngine, FlatForestClassifier, FlatTreeEngine,
+        PARITY_TOLERANCE, _iteration_range, _probe_difference, _probe_matrix
+    )
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_MAGIC = b'AYURBNDL'
+BUNDLE_FORMAT_VERSION = 2
+# Section alignment - keeps every array aligned for any dtype
+ALIGNMENT = 64
+_LENGTH = struct.Struct('<Q')
+
+
+class BundleError(RuntimeError):
+    """Raised for a missing, truncated, stale or corrupted bundle"""
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bundle_path_for(
+    ayur_path: Path,
+    fingerprint: str,
+    directory: Path = MODEL_BUNDLE_DIR,
+    version: str = DEFAULT_VERSION
+) -> Path:
+    """Bundle location for a model pair - every registry version stores the same file name"""
+    return Path(directory) / f"{Path(ayur_path).stem}.{version}.{fingerprint}.bundle"
+
+
+def write_bundle(path: Path, manifest: Dict[str, Any], arrays: Dict[str, np.ndarray], blobs: Dict[str, bytes]) -> Path:
+    """Write sections and manifest (with offsets and checksums added) atomically"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {**manifest, "arrays": {}, "blobs": {}}
+    
+    # Write then rename so concurrent workers never map a partial file
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        
+        def section(data: bytes) -> Dict[str, Any]:
+            f.write(b'\0' * (-f.tell() % ALIGNMENT))
+            offset = f.tell()
+            f.write(data)
+            return {"offset": offset, "sha256": hashlib.sha256(data).hexdigest()}
+        
+        for name, array in arrays.items():
+            # Little-endian, C order - what np.frombuffer maps back without copying
+            array = np.ascontiguousarray(array, dtype=np.asarray(array).dtype.newbyteorder('<'))
+            manifest["arrays"][name] = {
+                **section(array.tobytes()), "dtype": array.dtype.str, "shape": list(array.shape)
+            }
+        for name, data in blobs.items():
+            manifest["blobs"][name] = {**section(bytes(data)), "length": len(data)}
+        
+        encoded = json.dumps(manifest).encode('utf-8')
+        f.write(encoded)
+        f.write(_LENGTH.pack(len(encoded)))
+        f.write(BUNDLE_MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(path)
+    return path
+
+
+class ModelBundle:
+    """A bundle file mapped read-only; arrays are zero-copy views into the map"""
+    
+    def __init__(self, path: Path, manifest: Dict[str, Any], buffer: mmap.mmap):
+        self.path = Path(path)
+        self.manifest = manifest
+        self._buffer = buffer
+        self.verified = False
+    
+    @classmethod
+    def open(cls, path: Path, verify: bool = MODEL_BUNDLE_VERIFY) -> 'ModelBundle':
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise BundleError(f"Cannot map bundle {path}: {e}")
+        
+        tail = len(BUNDLE_MAGIC) + _LENGTH.size
+        if len(buffer) < len(BUNDLE_MAGIC) + tail or buffer[:8] != BUNDLE_MAGIC or buffer[-8:] != BUNDLE_MAGIC:
+            raise BundleError(f"{path} is not a model bundle or is truncated")
+        (length,) = _LENGTH.unpack(buffer[-tail:-8])
+        try:
+            manifest = json.loads(buffer[len(buffer) - tail - length:-tail])
+        except ValueError as e:
+            raise BundleError(f"Unreadable bundle manifest in {path}: {e}")
+        if manifest.get("format") != BUNDLE_FORMAT_VERSION:
+            raise BundleError(f"Unsupported bundle format {manifest.get('format')} in {path}")
+        
+        bundle = cls(path, manifest, buffer)
+        if verify:
+            bundle.verify()
+        return bundle
+    
+    def _section(self, entry: Dict[str, Any], length: int) -> memoryview:
+        offset = entry["offset"]
+        if offset + length > len(self._buffer):
+            raise BundleError(f"Section at {offset} runs past the end of {self.path}")
+        return memoryview(self._buffer)[offset:offset + length]
+    
+    def _array_length(self, entry: Dict[str, Any]) -> int:
+        return int(np.prod(entry["shape"], dtype=np.int64)) * np.dtype(entry["dtype"]).itemsize
+    
+    def verify(self):
+        """Check every section against its manifest SHA-256"""
+        sections = [(name, entry, self._array_length(entry)) for name, entry in self.manifest["arrays"].items()]
+        sections += [(name, entry, entry["length"]) for name, entry in self.manifest["blobs"].items()]
+        for name, entry, length in sections:
+            if hashlib.sha256(self._section(entry, length)).hexdigest() != entry["sha256"]:
+                raise BundleError(f"Checksum mismatch for section '{name}' in {self.path}")
+        self.verified = True
+    
+    def array(self, name: str) -> np.ndarray:
+        """Read-only array backed by the mapped file"""
+        entry = self.manifest["arrays"][name]
+        view = self._section(entry, self._array_length(entry))
+        return np.frombuffer(view, dtype=np.dtype(entry["dtype"])).reshape(entry["shape"])
+    
+    def arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        """All arrays named '<prefix>/<name>', keyed by name"""
+        return {
+            name[len(prefix) + 1:]: self.array(name)
+            for name in self.manifest["arrays"] if name.startswith(f"{prefix}/")
+        }
+    
+    def blob(self, name: str) -> bytes:
+        entry = self.manifest["blobs"][name]
+        return bytes(self._section(entry, entry["length"]))
+    
+    def feature_schema(self) -> Optional[FeatureSchema]:
+        state = self.manifest.get("feature_schema")
+        return FeatureSchema.from_state(state) if state is not None else None
+    
+    def feature_encoder(self) -> CompiledFeatureEncoder:
+        return CompiledFeatureEncoder.from_state(self.manifest["feature_encoder"], self.arrays("feature_encoder"))
+    
+    def prakriti_model(self) -> FlatForestClassifier:
+        return FlatForestClassifier.from_state(self.manifest["prakriti"], self.arrays("prakriti"))
+    
+    def booster_engine(self) -> BoosterEngine:
+        return BoosterEngine.from_raw(self.blob("ayur/booster.ubj"), tuple(self.manifest["iteration_range"]))
+    
+    def tree_engine(self, mode: str = 'flat') -> Any:
+        """
+        Engine for the ayur model
+        
+        "flat" walks the mapped node arrays and builds the native booster only
+        when a batch larger than the flat engine's limit arrives.
+        """
+        params = self.manifest.get("tree_engine")
+        if mode == 'flat' and params is not None:
+            engine = FlatTreeEngine.from_state(params, self.arrays("ayur"))
+            engine.fallback = DeferredEngine('booster', self.booster_engine)
+            return engine
+        if mode in ('flat', 'booster'):
+            return self.booster_engine()
+        raise ValueError(f"Bundles cannot serve tree engine {mode}")
+    
+    def stale_sources(self) -> list:
+        """Encoder/scaler files that changed since the bundle was built"""
+        return [
+            name for name, (path, digest) in self.manifest.get("sources", {}).items()
+            if not Path(path).exists() or file_sha256(Path(path)) != digest
+        ]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "bytes": len(self._buffer),
+            "format": self.manifest["format"],
+            "model_fingerprint": self.manifest["model_fingerprint"],
+            "verified": self.verified,
+            "created_at": self.manifest.get("created_at")
+        }
+
+
+def pack_models(loader: Any) -> Optional[tuple]:
+    """
+    Manifest, arrays and blobs for a ModelLoader's loaded models
+    
+    None when the models cannot be served from a bundle (no compiled
+    encoder, not XGBoost, or a prakriti model that cannot be flattened).
+    """
+    estimator = loader.estimator
+    if loader.feature_encoder is None or not hasattr(estimator, 'get_booster') or not loader.has_predict_proba:
+        return None
+    prakriti = FlatForestClassifier.from_sklearn(loader.prakriti_model) if loader.prakriti_encoder else None
+    if prakriti is None:
+        return None
+    
+    # Same probe as the tree engine: the flattened forest must reproduce sklearn
+    X = np.floor(_probe_matrix(prakriti.n_features_in_) % 3)
+    X[np.isnan(X)] = 0
+    difference = float(np.max(np.abs(prakriti.predict_proba(X) - loader.prakriti_model.predict_proba(X))))
+    if difference > PARITY_TOLERANCE:
+        logger.warning(f"Flattened prakriti forest differs from sklearn by {difference:.2e} - not bundling")
+        return None
+    
+    booster = estimator.get_booster()
+    iteration_range = _iteration_range(estimator)
+    flat = FlatTreeEngine.from_booster(booster, iteration_range)
+    if flat is not None:
+        difference = _probe_difference(flat, BoosterEngine(booster, flat.objective, iteration_range), loader.feature_encoder.n_features)
+        if difference > PARITY_TOLERANCE:
+            logger.warning(f"Flat engine differs from the booster by {difference:.2e} - bundling the booster only")
+            flat = None
+    
+    encoder_spec, encoder_arrays = loader.feature_encoder.state()
+    prakriti_params, prakriti_arrays = prakriti.state()
+    arrays = {f"feature_encoder/{name}": array for name, array in encoder_arrays.items()}
+    arrays.update({f"prakriti/{name}": array for name, array in prakriti_arrays.items()})
+    tree_params = None
+    if flat is not None:
+        tree_params, tree_arrays = flat.state()
+        arrays.update({f"ayur/{name}": array for name, array in tree_arrays.items()})
+    
+    # Bare estimators are encoded with the saved LabelEncoders/StandardScalers
+    sources = {}
+    if not loader.is_pipeline:
+        sources = {
+            name: (str(path), file_sha256(path))
+            for name, path in (("encoders", ENCODERS_PATH), ("scalers", SCALERS_PATH)) if path.exists()
+        }
+    
+    manifest = {
+        "format": BUNDLE_FORMAT_VERSION,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "model_version": loader.model_version,
+        "model_fingerprint": loader.model_fingerprint,
+        "sources": sources,
+        "ayur": {
+            "is_pipeline": loader.is_pipeline,
+            "column_order": list(loader.column_order),
+            "model_meta": loader.model_meta,
+            "class_labels": loader.class_labels
+        },
+        "feature_schema": loader.feature_schema.state() if loader.feature_schema is not None else None,
+        "feature_encoder": encoder_spec,
+        "tree_engine": tree_params,
+        "iteration_range": list(iteration_range),
+        "prakriti": prakriti_params
+    }
+    return manifest, arrays, {"ayur/booster.ubj": booster.save_raw('ubj')}
+
+
+def build_model_bundle(loader: Any, ayur_path: Path, directory: Path = MODEL_BUNDLE_DIR) -> Optional[Path]:
+    """Write the bundle for a loader's models, removing older bundles of the same registry version"""
+    start = time.perf_counter()
+    packed = pack_models(loader)
+    if packed is None:
+        logger.info("Loaded models cannot be served from a bundle - keeping the pickles")
+        return None
+    
+    version = loader.registry_version or DEFAULT_VERSION
+    target = write_bundle(bundle_path_for(ayur_path, loader.model_fingerprint, directory, version), *packed)
+    logger.info(f"Built model bundle {target} ({target.stat().st_size} bytes) in {time.perf_counter() - start:.2f}s")
+    
+    # Other versions keep their bundles so a reload or rollback to them stays fast
+    prefix = f"{Path(ayur_path).stem}.{version}"
+    for stale in Path(directory).glob(f"{prefix}.*.bundle"):
+        if stale != target and stale.name.rsplit('.', 2)[0] == prefix:
+            stale.unlink(missing_ok=True)
+    return target
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from model_loader import ModelLoader
+    from registry import model_registry
+    
+    version, ayur_path, prakriti_path = model_registry.resolve()
+    loader = ModelLoader().initialize(ayur_path, prakriti_path, version, use_bundle=False)
+    path = build_model_bundle(loader, ayur_path)
+    if path is None:
+        print("Loaded models cannot be bundled")
+        sys.exit(1)
+    
+    bundle = ModelBundle.open(path, verify=True)
+    print(f"Model bundle ready: {path} ({bundle.stats()['bytes']} bytes, {len(bundle.manifest['arrays'])} arrays)")
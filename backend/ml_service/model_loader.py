@@ -1,94 +1,232 @@
 """
 Model loading and preprocessing utilities
+
+joblib, pandas, sklearn and xgboost are imported where they are first needed:
+the unpickler imports exactly the sklearn/xgboost modules a model references,
+so importing this module (and main.py) stays cheap.
 """
-import joblib
+import importlib.util
 import pickle
-import pandas as pd
+import hashlib
 import json
+import numpy as np
 from pathlib import Path
-from sklearn.preprocessing import LabelEncoder, StandardScaler, OneHotEncoder, FunctionTransformer
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-# Import all sklearn components that might be in the model
-from sklearn import base, ensemble, tree, linear_model, neural_network
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, Dict, Any, Optional, List, Tuple
 import logging
 import warnings
 import sys
+import threading
+from contextlib import contextmanager
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Import xgboost if available (optional - models may work without it)
-try:
-    import xgboost
-    XGBOOST_AVAILABLE = True
-except (ImportError, Exception) as e:
-    XGBOOST_AVAILABLE = False
-    logger.warning(f"xgboost not available: {e}. Some models may not work.")
+# xgboost is optional - models may work without it. Checked without importing it.
+XGBOOST_AVAILABLE = importlib.util.find_spec('xgboost') is not None
+if not XGBOOST_AVAILABLE:
+    logger.warning("xgboost not available. Some models may not work.")
 
 try:
     from .config import (
         AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, DATASET_XLSX_PATH,
-        ENCODERS_PATH, SCALERS_PATH, MAPPINGS_PATH
+        ENCODERS_PATH, SCALERS_PATH, MAPPINGS_PATH, COMPILED_ENCODER_ENABLED,
+        ALLOWED_KEYS, PRAKRITI_FEATURES, PRAKRITI_DOSHAS, PRAKRITI_DUAL_MARGIN, TREE_ENGINE, TREE_ENGINE_PARITY,
+        MODEL_BUNDLE_ENABLED, MODEL_BUNDLE_DIR
     )
+    from .feature_encoder import CompiledFeatureEncoder, FeatureSchema
+    from .tree_engine import build_tree_engine, native_booster
+    from .model_bundle import ModelBundle, BundleError, bundle_path_for, build_model_bundle
+    from .dataset_cache import load_dataset_frame
+    from .registry import model_registry, DEFAULT_VERSION
+    from .metrics import now, observe_stage
 except ImportError:
     from config import (
         AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, DATASET_XLSX_PATH,
-        ENCODERS_PATH, SCALERS_PATH, MAPPINGS_PATH
+        ENCODERS_PATH, SCALERS_PATH, MAPPINGS_PATH, COMPILED_ENCODER_ENABLED,
+        ALLOWED_KEYS, PRAKRITI_FEATURES, PRAKRITI_DOSHAS, PRAKRITI_DUAL_MARGIN, TREE_ENGINE, TREE_ENGINE_PARITY,
+        MODEL_BUNDLE_ENABLED, MODEL_BUNDLE_DIR
     )
+    from feature_encoder import CompiledFeatureEncoder, FeatureSchema
+    from tree_engine import build_tree_engine, native_booster
+    from model_bundle import ModelBundle, BundleError, bundle_path_for, build_model_bundle
+    from dataset_cache import load_dataset_frame
+    from registry import model_registry, DEFAULT_VERSION
+    from metrics import now, observe_stage
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class ExplanationUnavailableError(RuntimeError):
+    """The loaded model cannot be explained (no compiled encoder or native booster)"""
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers"""
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+    
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+    
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def model_fingerprint(ayur_path: Path, prakriti_path: Path) -> str:
+    """Short content hash of a model pair - part of the cache/model token"""
+    digest = hashlib.sha256(Path(ayur_path).read_bytes())
+    digest.update(Path(prakriti_path).read_bytes())
+    return digest.hexdigest()[:12]
+
+
 class ModelLoader:
     """Load and manage ML models and preprocessors"""
     
     def __init__(self):
-        self.ayur_model = None
+        self._ayur_model = None
+        self._estimator = None
+        # Set when serving from a bundle: the pickle is only read if ayur_model/estimator is used
+        self._deferred_ayur_path = None
+        self._deferred_lock = threading.Lock()
+        self.bundle = None
         self.prakriti_model = None
         self.dataset = None
         self.encoders = {}
         self.scalers = {}
         self.column_order = []
+        self.model_meta = {}
         self.model_version = None
+        self.model_fingerprint = None
+        self.has_predict_proba = False
+        self.classes = None
+        self.class_labels = None
+        self.class_keys = None
+        self.feature_schema = None
+        self.feature_encoder = None
+        self.tree_engine = None
+        # Native booster for contributions, found on the first explain call
+        self.explainer = None
+        self.is_pipeline = False
+        self.registry_version = None
+        self.prakriti_encoder = None
+        self.prakriti_doshas = None
+        self._swap_lock = ReadWriteLock()
+    
+    @property
+    def ayur_model(self) -> Any:
+        if self._ayur_model is None and self._deferred_ayur_path is not None:
+            self._load_deferred_model()
+        return self._ayur_model
+    
+    @ayur_model.setter
+    def ayur_model(self, model: Any):
+        self._ayur_model = model
+    
+    @property
+    def estimator(self) -> Any:
+        """Final estimator behind the compiled encoder"""
+        if self._estimator is None and self._deferred_ayur_path is not None:
+            self._load_deferred_model()
+        return self._estimator
+    
+    @estimator.setter
+    def estimator(self, estimator: Any):
+        self._estimator = estimator
+    
+    @property
+    def models_loaded(self) -> bool:
+        return (self._ayur_model is not None or self.bundle is not None) and self.prakriti_model is not None
+    
+    @staticmethod
+    def _read_model(path: Path, name: str) -> Any:
+        """Unpickle a model file with joblib, falling back to pickle"""
+        import joblib
         
-    def load_models(self):
+        try:
+            model = joblib.load(path)
+            logger.info(f"Loaded {name} model from {path}")
+            return model
+        except Exception as e:
+            logger.warning(f"joblib.load failed, trying pickle: {e}")
+            try:
+                with open(path, 'rb') as f:
+                    model = pickle.load(f)
+                logger.info(f"Loaded {name} model using pickle from {path}")
+                return model
+            except Exception as pickle_error:
+                logger.error(f"Both joblib and pickle failed: {pickle_error}")
+                raise RuntimeError(f"Failed to load {name} model: {pickle_error}")
+    
+    def _load_deferred_model(self):
+        """Unpickle the ayur model behind a bundle - for the pandas path and tooling, not the hot path"""
+        with self._deferred_lock:
+            if self._ayur_model is not None or self._deferred_ayur_path is None:
+                return
+            warnings.filterwarnings('ignore', category=UserWarning)
+            model = self._read_model(self._deferred_ayur_path, 'ayur')
+            if isinstance(model, dict) and 'pipeline' in model:
+                model = model['pipeline']
+            self._estimator = model.steps[-1][1] if self.is_pipeline else model
+            self._ayur_model = model
+    
+    def load_models(
+        self,
+        ayur_path: Path = AYUR_MODEL_PATH,
+        prakriti_path: Path = PRAKRITI_MODEL_PATH,
+        version: Optional[str] = None
+    ):
         """Load models from pickle files"""
         try:
             # Suppress sklearn version warnings
             warnings.filterwarnings('ignore', category=UserWarning)
             
             # Try joblib first, fallback to pickle
-            try:
-                self.ayur_model = joblib.load(AYUR_MODEL_PATH)
-                logger.info(f"Loaded ayur model from {AYUR_MODEL_PATH}")
-            except Exception as e:
-                logger.warning(f"joblib.load failed, trying pickle: {e}")
-                try:
-                    with open(AYUR_MODEL_PATH, 'rb') as f:
-                        self.ayur_model = pickle.load(f)
-                    logger.info(f"Loaded ayur model using pickle from {AYUR_MODEL_PATH}")
-                except Exception as pickle_error:
-                    logger.error(f"Both joblib and pickle failed: {pickle_error}")
-                    raise RuntimeError(f"Failed to load ayur model: {pickle_error}")
+            self.ayur_model = self._read_model(ayur_path, 'ayur')
+            self.prakriti_model = self._read_model(prakriti_path, 'prakriti')
             
-            try:
-                self.prakriti_model = joblib.load(PRAKRITI_MODEL_PATH)
-                logger.info(f"Loaded prakriti model from {PRAKRITI_MODEL_PATH}")
-            except Exception as e:
-                logger.warning(f"joblib.load failed, trying pickle: {e}")
-                try:
-                    with open(PRAKRITI_MODEL_PATH, 'rb') as f:
-                        self.prakriti_model = pickle.load(f)
-                    logger.info(f"Loaded prakriti model using pickle from {PRAKRITI_MODEL_PATH}")
-                except Exception as pickle_error:
-                    logger.error(f"Both joblib and pickle failed: {pickle_error}")
-                    raise RuntimeError(f"Failed to load prakriti model: {pickle_error}")
+            # Unwrap {'pipeline': ..., 'meta': ...} bundles saved by the training notebook
+            if isinstance(self.ayur_model, dict) and 'pipeline' in self.ayur_model:
+                self.model_meta = self.ayur_model.get('meta') or {}
+                self.ayur_model = self.ayur_model['pipeline']
+                self.column_order = list(self.model_meta.get('feature_cols', []))
+                logger.info(f"Unwrapped model bundle with {len(self.column_order)} feature columns")
             
             # Set model version
-            self.model_version = AYUR_MODEL_PATH.name
+            self.model_version = version or ayur_path.name
+            self.model_fingerprint = model_fingerprint(ayur_path, prakriti_path)
+            self._resolve_capabilities()
+            self.compile_prakriti_encoder()
             
             # Check if model is a pipeline
             if hasattr(self.ayur_model, 'steps') or hasattr(self.ayur_model, 'named_steps'):
@@ -97,15 +235,40 @@ class ModelLoader:
             else:
                 logger.info("Model is a bare estimator - will build preprocessors")
                 self.is_pipeline = False
-                
+        
         except Exception as e:
             logger.error(f"Error loading models: {e}")
             raise RuntimeError(f"Failed to load models: {e}")
     
+    def compile_prakriti_encoder(self):
+        """Map assessment answers onto the prakriti model's feature layout"""
+        self.prakriti_encoder = None
+        self.prakriti_doshas = None
+        if self.prakriti_model is None:
+            return
+        
+        # Follow the model's own feature order when it was fitted on named columns
+        by_feature = {feature: key for key, feature in PRAKRITI_FEATURES.items()}
+        names = list(getattr(self.prakriti_model, 'feature_names_in_', PRAKRITI_FEATURES.values()))
+        classes = getattr(self.prakriti_model, 'classes_', None)
+        if set(names) != set(by_feature) or classes is None:
+            logger.warning(f"Prakriti model features {names} do not match the assessment - prakriti inference disabled")
+            return
+        
+        codes = {dosha: code for code, dosha in enumerate(PRAKRITI_DOSHAS)}
+        codes.update({code: code for code in range(len(PRAKRITI_DOSHAS))})
+        self.prakriti_encoder = CompiledFeatureEncoder.from_category_codes([by_feature[name] for name in names], codes)
+        self.prakriti_doshas = [PRAKRITI_DOSHAS[int(c)] for c in classes]
+    
+    @property
+    def model_token(self) -> str:
+        """Identifies the exact loaded model - changes whenever a different model is loaded"""
+        return f"{self.model_version}@{self.model_fingerprint}"
+    
     def load_dataset(self):
         """Load reference dataset for encoder building"""
         try:
-            self.dataset = pd.read_excel(DATASET_XLSX_PATH)
+            self.dataset = load_dataset_frame(DATASET_XLSX_PATH)
             logger.info(f"Loaded dataset with {len(self.dataset)} rows from {DATASET_XLSX_PATH}")
             return self.dataset
         except Exception as e:
@@ -118,6 +281,9 @@ class ModelLoader:
             logger.info("Using pipeline - skipping encoder building")
             return
         
+        import joblib
+        from sklearn.preprocessing import LabelEncoder, StandardScaler
+        
         if self.dataset is None:
             self.load_dataset()
         
@@ -190,9 +356,13 @@ class ModelLoader:
             logger.info(f"Saved mappings to {MAPPINGS_PATH}")
         except Exception as e:
             logger.warning(f"Could not save mappings: {e}")
+        
+        self.compile_feature_encoder()
     
     def load_encoders(self):
         """Load saved encoders if they exist"""
+        import joblib
+        
         if ENCODERS_PATH.exists():
             try:
                 self.encoders = joblib.load(ENCODERS_PATH)
@@ -206,16 +376,110 @@ class ModelLoader:
                 logger.info(f"Loaded scalers from {SCALERS_PATH}")
             except Exception as e:
                 logger.warning(f"Could not load scalers: {e}")
+        
+        self.compile_feature_encoder()
+    
+    def compile_feature_schema(self):
+        """Record the model's input columns, kinds and defaults for the pandas path"""
+        self.feature_schema = None
+        names = self.column_order or list(getattr(self.ayur_model, 'feature_names_in_', []))
+        if not names:
+            logger.info("No fixed feature layout known - pandas path uses the request's columns")
+            return
+        
+        if not self.is_pipeline:
+            categorical = list(self.encoders)
+        elif 'cat_cols' in self.model_meta:
+            categorical = self.model_meta['cat_cols']
+        else:
+            steps = getattr(self.ayur_model, 'steps', [])
+            transformers = getattr(steps[0][1], 'transformers_', []) if steps else []
+            categorical = [
+                column for _, step, columns in transformers
+                if type(step).__name__ == 'OneHotEncoder' for column in columns
+            ]
+        
+        self.feature_schema = FeatureSchema.from_columns(names, categorical)
+        logger.info(f"Feature schema: {len(names)} columns, {len(set(categorical) & set(names))} categorical")
+    
+    def compile_feature_encoder(self):
+        """Compile the fitted preprocessors into a NumPy feature encoder"""
+        self.feature_encoder = None
+        self.estimator = None
+        self.tree_engine = None
+        
+        if self.ayur_model is None:
+            return
+        self.compile_feature_schema()
+        if not COMPILED_ENCODER_ENABLED:
+            return
+        
+        try:
+            if self.is_pipeline:
+                steps = getattr(self.ayur_model, 'steps', [])
+                if len(steps) != 2 or type(steps[0][1]).__name__ != 'ColumnTransformer':
+                    logger.info("Pipeline layout not supported by compiled encoder - using pandas path")
+                    return
+                encoder = CompiledFeatureEncoder.from_column_transformer(steps[0][1])
+                estimator = steps[-1][1]
+            else:
+                columns = self.column_order or list(getattr(self.ayur_model, 'feature_names_in_', []))
+                if not columns:
+                    logger.info("No fixed feature layout known - using pandas path")
+                    return
+                encoder = CompiledFeatureEncoder.from_label_encoders(columns, self.encoders, self.scalers)
+                estimator = self.ayur_model
+        except Exception as e:
+            logger.warning(f"Could not compile feature encoder: {e}")
+            return
+        
+        if encoder is not None:
+            self.feature_encoder = encoder
+            self.estimator = estimator
+            logger.info(f"Compiled feature encoder with {encoder.n_features} features")
+            self.compile_tree_engine()
     
-    def preprocess_input(self, data: Dict[str, Any]) -> pd.DataFrame:
+    def compile_tree_engine(self):
+        """Score the compiled encoder's rows with a direct tree engine instead of the sklearn wrapper"""
+        self.tree_engine = None
+        try:
+            self.tree_engine = build_tree_engine(
+                self.estimator, self.model_fingerprint, mode=TREE_ENGINE, parity=TREE_ENGINE_PARITY,
+                version=self.registry_version or DEFAULT_VERSION
+            )
+        except Exception as e:
+            logger.warning(f"Could not build tree engine, using sklearn estimator: {e}")
+    
+    def limit_threads(self, threads: int):
+        """Cap XGBoost threads per call, for pools of worker processes sharing the CPUs"""
+        engine = getattr(self.tree_engine, 'engine', self.tree_engine)
+        booster_engine = getattr(engine, 'fallback', None) or engine
+        if hasattr(booster_engine, 'set_threads'):
+            booster_engine.set_threads(threads)
+        # Set on the booster directly - get_params() fails on models pickled by older xgboost.
+        # A bundle's deferred estimator is left alone rather than unpickled here.
+        if hasattr(self._estimator, 'get_booster'):
+            self._estimator.n_jobs = threads
+            self._estimator.get_booster().set_param({'nthread': threads})
+    
+    def _input_frame(self, rows: List[Dict[str, Any]]) -> 'pd.DataFrame':
+        """Rows as a frame in the training column order and dtypes (the request's own columns without a schema)"""
+        import pandas as pd
+        
+        if self.feature_schema is not None:
+            return self.feature_schema.frame(rows)
+        return pd.DataFrame.from_records(rows)
+    
+    def preprocess_input(self, data: Dict[str, Any]) -> 'pd.DataFrame':
         """Preprocess input data for model prediction"""
+        import pandas as pd
+        
+        # Pipelines get the frame as-is and handle preprocessing themselves
+        df = self._input_frame([data])
         if self.is_pipeline:
-            # If using pipeline, convert to DataFrame and let pipeline handle preprocessing
-            df = pd.DataFrame([data])
             return df
         
         # Otherwise, manually preprocess
-        df = pd.DataFrame([data])
         
         # Encode categorical columns
         for col, encoder in self.encoders.items():
@@ -250,46 +514,398 @@ class ModelLoader:
         
         return df
     
+    def preprocess_batch(self, rows: List[Dict[str, Any]]) -> 'pd.DataFrame':
+        """Preprocess many inputs column-wise into a single model matrix"""
+        import pandas as pd
+        
+        df = self._input_frame(rows)
+        if self.is_pipeline:
+            return df
+        
+        # Encode categorical columns with one lookup table per column
+        for col, encoder in self.encoders.items():
+            if col in df.columns:
+                index = {cls: i for i, cls in enumerate(encoder.classes_)}
+                values = df[col].where(df[col].notna(), 'unknown').astype(str)
+                encoded = values.map(index)
+                unseen = int(encoded.isna().sum())
+                if unseen:
+                    logger.warning(f"{unseen} unseen value(s) for {col}, using default")
+                df[col] = encoded.fillna(0).astype(int)
+        
+        # Scale numeric columns with the fitted mean/scale in one vector operation
+        for col, scaler in self.scalers.items():
+            if col in df.columns:
+                values = pd.to_numeric(df[col], errors='coerce')
+                df[col] = ((values - scaler.mean_[0]) / scaler.scale_[0]).fillna(0)
+        
+        # Fill NaN with 0
+        df = df.fillna(0)
+        
+        return df
+    
+    def _resolve_capabilities(self):
+        """Probe the model once at load time so the hot path needs no hasattr checks"""
+        self.has_predict_proba = hasattr(self.ayur_model, 'predict_proba')
+        
+        classes = getattr(self.ayur_model, 'classes_', None)
+        if classes is not None:
+            self.classes = np.asarray(classes)
+            self.class_labels = [cls.item() if hasattr(cls, 'item') else cls for cls in self.classes]
+            self.class_keys = [str(cls) for cls in self.classes]
+        else:
+            self.classes = None
+            self.class_labels = None
+            self.class_keys = None
+        
+        logger.info(f"Model capabilities - predict_proba: {self.has_predict_proba}, classes: {self.class_keys}")
+    
+    def _build_output(self, label: Any, proba: Optional[np.ndarray]) -> Dict[str, Any]:
+        """Build the per-row output dict from a label and its probability row"""
+        if proba is None:
+            return {
+                'pred_label': str(label),
+                'pred_score': None,
+                'pred_proba': None,
+                'raw_output': {
+                    'prediction': [label]
+                }
+            }
+        
+        proba_list = proba.tolist()
+        keys = self.class_keys or [f"class_{i}" for i in range(len(proba_list))]
+        
+        return {
+            'pred_label': str(label),
+            'pred_score': max(proba_list),
+            'pred_proba': dict(zip(keys, proba_list)),
+            'raw_output': {
+                'prediction': [label],
+                'probabilities': [proba_list]
+            }
+        }
+    
+    def _predict_frame(self, X: Any, model: Any) -> List[Dict[str, Any]]:
+        """Score a preprocessed matrix with one model traversal"""
+        if not self.has_predict_proba:
+            pred = np.asarray(model.predict(X)).tolist()
+            return [self._build_output(label, None) for label in pred]
+        
+        # Labels come from the probability argmax instead of a second predict() pass
+        pred_proba = np.asarray(model.predict_proba(X), dtype=np.float64)
+        pred_idx = pred_proba.argmax(axis=1).tolist()
+        labels = self.class_labels or pred_idx
+        
+        return [
+            self._build_output(labels[idx], pred_proba[row])
+            for row, idx in enumerate(pred_idx)
+        ]
+    
+    def _encode_and_predict(self, rows: List[Dict[str, Any]], single: bool = False) -> List[Dict[str, Any]]:
+        """Encode rows and score them, timing the preprocess and infer stages"""
+        start = now()
+        if self.feature_encoder is not None:
+            X, model = self.feature_encoder.encode(rows), self.tree_engine or self.estimator
+        elif single:
+            X, model = self.preprocess_input(rows[0]), self.ayur_model
+        else:
+            X, model = self.preprocess_batch(rows), self.ayur_model
+        encoded = now()
+        
+        outputs = self._predict_frame(X, model)
+        observe_stage('preprocess', encoded - start)
+        observe_stage('infer', now() - encoded)
+        return outputs
+    
+    def _build_prakriti_output(self, proba: np.ndarray) -> Dict[str, Any]:
+        """Dominant dosha(s) and per-dosha scores for one assessment"""
+        scores = {dosha: 0.0 for dosha in PRAKRITI_DOSHAS}
+        scores.update(zip(self.prakriti_doshas, proba.tolist()))
+        ranked = sorted(PRAKRITI_DOSHAS, key=scores.get, reverse=True)
+        
+        top = scores[ranked[0]]
+        if top - scores[ranked[-1]] <= PRAKRITI_DUAL_MARGIN:
+            prakriti = 'tridoshic'
+        elif top - scores[ranked[1]] <= PRAKRITI_DUAL_MARGIN:
+            # Canonical order matches the ayur model's categories, e.g. "vata-pitta"
+            prakriti = '-'.join(d for d in PRAKRITI_DOSHAS if d in ranked[:2])
+        else:
+            prakriti = ranked[0]
+        
+        return {
+            'prakriti': prakriti,
+            'dominant_dosha': ranked[0],
+            'dosha_scores': scores
+        }
+    
+    def predict_prakriti_batch(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Infer prakriti for many assessments with a single model call"""
+        if not rows:
+            return []
+        
+        try:
+            with self._swap_lock.reading():
+                if self.prakriti_encoder is None:
+                    raise RuntimeError("Prakriti model not loaded")
+                proba = self.prakriti_model.predict_proba(self.prakriti_encoder.encode(rows))
+                return [self._build_prakriti_output(row) for row in proba]
+        except Exception as e:
+            logger.error(f"Error during prakriti prediction: {e}")
+            raise RuntimeError(f"Prakriti prediction failed: {e}")
+    
+    def predict_prakriti(self, assessment: Dict[str, Any]) -> Dict[str, Any]:
+        """Infer prakriti for one assessment"""
+        return self.predict_prakriti_batch([assessment])[0]
+    
+    def predict_batch(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run prediction on many inputs with a single model call"""
+        if not rows:
+            return []
+        
+        try:
+            with self._swap_lock.reading():
+                return self._encode_and_predict(rows)
+        except Exception as e:
+            logger.error(f"Error during batch prediction: {e}")
+            raise RuntimeError(f"Batch prediction failed: {e}")
+    
     def predict(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Run prediction on input data"""
         try:
-            # Preprocess
-            X = self.preprocess_input(data)
-            
-            # Predict
-            if hasattr(self.ayur_model, 'predict_proba'):
-                pred_proba = self.ayur_model.predict_proba(X)
-                pred = self.ayur_model.predict(X)
+            with self._swap_lock.reading():
+                return self._encode_and_predict([data], single=True)[0]
+        except Exception as e:
+            logger.error(f"Error during prediction: {e}")
+            raise RuntimeError(f"Prediction failed: {e}")
+    
+    def predict_variants(
+        self,
+        base: Dict[str, Any],
+        changes: List[Dict[str, Any]],
+        row: Optional[np.ndarray] = None,
+        row_token: Optional[str] = None,
+        commit: bool = False
+    ) -> Tuple[Optional[np.ndarray], str, List[Dict[str, Any]]]:
+        """
+        Score variants of one input that each change a few of its fields
+        
+        `row` is base as encoded by an earlier call under model `row_token`;
+        it is re-encoded when missing or when another model has been loaded
+        since. Each variant is a copy of the row with only its changed keys
+        re-encoded, and all variants are scored as one matrix.
+        
+        Returns (row, model_token, outputs). The row is base's, or with
+        commit the (single) variant's, which becomes the caller's new base.
+        It is None on the pandas path, which has no fixed layout and scores
+        the merged inputs instead.
+        """
+        try:
+            with self._swap_lock.reading():
+                encoder = self.feature_encoder
+                if encoder is None:
+                    return None, self.model_token, self._encode_and_predict([{**base, **c} for c in changes])
+                
+                start = now()
+                if row is None or row_token != self.model_token:
+                    row = encoder.encode([base])[0]
+                X = np.repeat(row[None, :], len(changes), axis=0)
+                for x, changed in zip(X, changes):
+                    encoder.encode_fields(changed, x)
+                encoded = now()
+                
+                outputs = self._predict_frame(X, self.tree_engine or self.estimator)
+                observe_stage('preprocess', encoded - start)
+                observe_stage('infer', now() - encoded)
+                return X[0] if commit else row, self.model_token, outputs
+        except Exception as e:
+            logger.error(f"Error during what-if prediction: {e}")
+            raise RuntimeError(f"What-if prediction failed: {e}")
+    
+    def explain_batch(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Per-field TreeSHAP contributions for many inputs, with one booster call
+        
+        Contributions are XGBoost's exact pred_contribs on the raw margin
+        (log-odds for binary models), summed over each input key's encoded
+        columns. Model features no request can set are reported together as
+        other_contribution, so base_value + other_contribution + the field
+        contributions equals the margin. Each explanation is for the
+        predicted class, as /predict labels it; for a binary model predicting
+        class 0 the booster's class-1 log-odds are negated.
+        """
+        if not rows:
+            return []
+        
+        try:
+            with self._swap_lock.reading():
+                encoder = self.feature_encoder
+                if encoder is None:
+                    raise ExplanationUnavailableError("Explanations need the compiled feature encoder")
+                if self.explainer is None:
+                    self.explainer = native_booster(self.tree_engine, self.estimator)
+                    if self.explainer is None:
+                        raise ExplanationUnavailableError("Explanations need an XGBoost model")
                 
-                # Get class names if available
-                if hasattr(self.ayur_model, 'classes_'):
-                    classes = self.ayur_model.classes_
-                    proba_dict = {str(cls): float(prob) for cls, prob in zip(classes, pred_proba[0])}
+                start = now()
+                X = encoder.encode(rows)
+                encoded = now()
+                contribs = self.explainer.contributions(X)
+                observe_stage('preprocess', encoded - start)
+                observe_stage('contributions', now() - encoded)
+                
+                margins = contribs.sum(axis=-1)
+                multiclass = contribs.ndim == 3
+                n_classes = margins.shape[1] if multiclass else 2
+                if multiclass:
+                    picked = margins.argmax(axis=1)
+                    contribs = contribs[np.arange(len(rows)), picked]
+                    proba = np.exp(margins - margins.max(axis=1, keepdims=True))
+                    proba = (proba / proba.sum(axis=1, keepdims=True))[np.arange(len(rows)), picked]
+                    margins = margins[np.arange(len(rows)), picked]
                 else:
-                    proba_dict = {f"class_{i}": float(prob) for i, prob in enumerate(pred_proba[0])}
+                    # Log-odds of class 0 are the negated log-odds of class 1; ties go to class 0 like argmax
+                    picked = (margins > 0).astype(np.intp)
+                    sign = np.where(picked == 1, 1.0, -1.0)
+                    contribs = contribs * sign[:, None]
+                    margins = margins * sign
+                    proba = 1.0 / (1.0 + np.exp(-margins))
                 
-                return {
-                    'pred_label': str(pred[0]) if hasattr(pred, '__iter__') else str(pred),
-                    'pred_score': float(pred_proba[0].max()) if hasattr(pred_proba[0], 'max') else None,
-                    'pred_proba': proba_dict,
-                    'raw_output': {
-                        'prediction': pred.tolist() if hasattr(pred, 'tolist') else [pred],
-                        'probabilities': pred_proba.tolist() if hasattr(pred_proba, 'tolist') else pred_proba
-                    }
-                }
-            else:
-                pred = self.ayur_model.predict(X)
-                return {
-                    'pred_label': str(pred[0]) if hasattr(pred, '__iter__') else str(pred),
-                    'pred_score': None,
-                    'pred_proba': None,
-                    'raw_output': {
-                        'prediction': pred.tolist() if hasattr(pred, 'tolist') else [pred]
-                    }
-                }
+                by_field = encoder.sum_by_field(contribs[:, :-1])
+                keys = encoder.field_keys
+                allowed = [f for f, key in enumerate(keys) if key in ALLOWED_KEYS]
+                other = by_field.sum(axis=1) - by_field[:, allowed].sum(axis=1)
+                class_keys = self.class_keys or [f"class_{i}" for i in range(n_classes)]
+                
+                explanations = []
+                for r, row in enumerate(rows):
+                    fields = sorted(allowed, key=lambda f: -abs(by_field[r, f]))
+                    explanations.append({
+                        'method': 'tree_shap',
+                        'output': 'margin' if multiclass else 'log_odds',
+                        'class': class_keys[picked[r]],
+                        'base_value': float(contribs[r, -1]),
+                        'other_contribution': float(other[r]),
+                        'margin': float(margins[r]),
+                        'probability': float(proba[r]),
+                        'contributions': [
+                            {'field': keys[f], 'value': row.get(keys[f]), 'contribution': float(by_field[r, f])}
+                            for f in fields
+                        ]
+                    })
+                return explanations
+        except ExplanationUnavailableError:
+            raise
         except Exception as e:
-            logger.error(f"Error during prediction: {e}")
-            raise RuntimeError(f"Prediction failed: {e}")
+            logger.error(f"Error during explanation: {e}")
+            raise RuntimeError(f"Explanation failed: {e}")
+    
+    def explain(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Explain the prediction for one input"""
+        return self.explain_batch([data])[0]
+    
+    
+    def load_bundle(
+        self,
+        ayur_path: Path,
+        prakriti_path: Path,
+        version: Optional[str] = None,
+        directory: Path = MODEL_BUNDLE_DIR
+    ) -> bool:
+        """
+        Serve the models from their packed bundle instead of the pickles
+        
+        Returns False (load the pickles) when there is no bundle for this
+        exact model pair yet, or it is stale or fails verification.
+        """
+        fingerprint = model_fingerprint(ayur_path, prakriti_path)
+        path = bundle_path_for(ayur_path, fingerprint, directory, self.registry_version or DEFAULT_VERSION)
+        if not path.exists():
+            return False
+        
+        start = now()
+        try:
+            bundle = ModelBundle.open(path)
+            manifest = bundle.manifest
+            if manifest["model_fingerprint"] != fingerprint:
+                raise BundleError(f"{path} was built for model {manifest['model_fingerprint']}")
+            stale = bundle.stale_sources()
+            if stale:
+                raise BundleError(f"{path} is stale - {', '.join(stale)} changed")
+            
+            ayur = manifest["ayur"]
+            self.is_pipeline = ayur["is_pipeline"]
+            self.column_order = ayur["column_order"]
+            self.model_meta = ayur["model_meta"]
+            self.has_predict_proba = True
+            self.class_labels = ayur["class_labels"]
+            self.classes = np.asarray(self.class_labels) if self.class_labels is not None else None
+            self.class_keys = [str(cls) for cls in self.class_labels] if self.class_labels is not None else None
+            self.feature_schema = bundle.feature_schema()
+            self.feature_encoder = bundle.feature_encoder()
+            self.tree_engine = bundle.tree_engine(TREE_ENGINE)
+            self.prakriti_model = bundle.prakriti_model()
+        except (BundleError, KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring model bundle: {e}")
+            return False
+        
+        self.bundle = bundle
+        self.model_version = version or ayur_path.name
+        self.model_fingerprint = fingerprint
+        self._deferred_ayur_path = ayur_path
+        self.compile_prakriti_encoder()
+        logger.info(f"Loaded models from bundle {path} in {(now() - start) * 1000:.1f} ms")
+        return True
+    
+    def save_bundle(self, ayur_path: Path) -> Optional[Path]:
+        """Pack the loaded models for the next start (best effort, like the dataset cache)"""
+        try:
+            return build_model_bundle(self, ayur_path)
+        except Exception as e:
+            logger.warning(f"Could not build model bundle: {e}")
+            return None
+    
+    def initialize(
+        self,
+        ayur_path: Path = AYUR_MODEL_PATH,
+        prakriti_path: Path = PRAKRITI_MODEL_PATH,
+        version: Optional[str] = None,
+        use_bundle: bool = MODEL_BUNDLE_ENABLED
+    ):
+        """Load models and their preprocessors"""
+        # The shipped models keep reporting their file name as the model version
+        model_version = None if version == DEFAULT_VERSION else version
+        self.registry_version = version or DEFAULT_VERSION
+        
+        # Bundles hold the compiled encoder and flattened trees - not the sklearn/parity reference
+        use_bundle = use_bundle and COMPILED_ENCODER_ENABLED and TREE_ENGINE != 'sklearn' and not TREE_ENGINE_PARITY
+        if use_bundle and self.load_bundle(ayur_path, prakriti_path, model_version):
+            return self
+        
+        self.load_models(ayur_path, prakriti_path, model_version)
+        
+        # The dataset is only needed to rebuild encoders, so it is loaded lazily by build_encoders()
+        # Try to load existing encoders first
+        self.load_encoders()
+        
+        # Build encoders if not using pipeline and encoders don't exist
+        if not self.is_pipeline and not self.encoders:
+            self.build_encoders()
+        
+        if use_bundle:
+            self.save_bundle(ayur_path)
+        return self
+    
+    def swap_from(self, other: 'ModelLoader'):
+        """
+        Atomically adopt another loader's models and preprocessors
+        
+        Waits for in-flight predictions to finish; predictions that arrive
+        during the swap wait for it and then run on the new model.
+        """
+        state = {k: v for k, v in other.__dict__.items() if k != '_swap_lock'}
+        with self._swap_lock.writing():
+            self.__dict__.update(state)
+        logger.info(f"Swapped to model {self.model_token}")
 
 
 # Global model loader instance
@@ -298,16 +914,8 @@ model_loader = ModelLoader()
 def initialize_models():
     """Initialize models at startup"""
     try:
-        model_loader.load_models()
-        model_loader.load_dataset()
-        
-        # Try to load existing encoders first
-        model_loader.load_encoders()
-        
-        # Build encoders if not using pipeline and encoders don't exist
-        if not model_loader.is_pipeline and not model_loader.encoders:
-            model_loader.build_encoders()
-        
+        version, ayur_path, prakriti_path = model_registry.resolve()
+        model_loader.initialize(ayur_path, prakriti_path, version)
         logger.info("Models initialized successfully")
         return True
     except Exception as e:
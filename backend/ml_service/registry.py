@@ -0,0 +1,189 @@
+"""
+Versioned model registry
+
+Each version lives in its own directory under MODEL_REGISTRY_DIR:
+    
+    registry/
+        registry.json          {"active": "v2", "previous": "v1", "updated_at": ...}
+        v1/ayur_xgb_model.pkl
+        v2/ayur_xgb_model.pkl
+        v2/prakriti_model.pkl  (optional - falls back to the default prakriti model)
+
+With no active version the service runs the models shipped in MODELS_DIR,
+which can also be activated explicitly as version "default".
+
+Register and activate versions with:
+    python registry.py register v2 /path/to/ayur_xgb_model.pkl [--prakriti /path/to/prakriti_model.pkl]
+    python registry.py activate v2
+    python registry.py list
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from .config import AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, MODEL_REGISTRY_DIR
+except ImportError:
+    from config import AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, MODEL_REGISTRY_DIR
+
+logger = logging.getLogger(__name__)
+
+# Reserved name for the models shipped in MODELS_DIR
+DEFAULT_VERSION = "default"
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$')
+
+
+class ModelRegistry:
+    """Directory of model versions plus a manifest naming the active one"""
+    
+    MANIFEST = "registry.json"
+    
+    def __init__(self, root: Path = MODEL_REGISTRY_DIR):
+        self.root = Path(root)
+    
+    @property
+    def manifest_path(self) -> Path:
+        return self.root / self.MANIFEST
+    
+    def version_dir(self, version: str) -> Path:
+        if version == DEFAULT_VERSION or not VERSION_PATTERN.match(version or ''):
+            raise ValueError(f"Invalid model version name: {version!r}")
+        return self.root / version
+    
+    def read_manifest(self) -> Dict[str, Any]:
+        """Current manifest, or an empty one when none has been written"""
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"active": None, "previous": None}
+    
+    def manifest_mtime(self) -> Optional[float]:
+        """Cheap change check for watchers"""
+        try:
+            return self.manifest_path.stat().st_mtime_ns
+        except OSError:
+            return None
+    
+    def write_manifest(self, active: Optional[str], previous: Optional[str]):
+        """Atomically replace the manifest"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "active": active,
+            "previous": previous,
+            "updated_at": datetime.utcnow().isoformat() + "Z"
+        }
+        tmp = self.manifest_path.with_name(f"{self.MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        tmp.replace(self.manifest_path)
+    
+    def list_versions(self) -> List[str]:
+        """Registered versions, oldest first"""
+        if not self.root.exists():
+            return []
+        versions = [
+            p for p in self.root.iterdir()
+            if p.is_dir() and not p.name.startswith('.') and (p / AYUR_MODEL_PATH.name).exists()
+        ]
+        return [p.name for p in sorted(versions, key=lambda p: p.stat().st_mtime)]
+    
+    def paths(self, version: Optional[str]) -> Tuple[Path, Path]:
+        """(ayur_path, prakriti_path) for a version"""
+        if version in (None, DEFAULT_VERSION):
+            return AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH
+        
+        directory = self.version_dir(version)
+        ayur_path = directory / AYUR_MODEL_PATH.name
+        if not ayur_path.exists():
+            raise FileNotFoundError(f"Model version '{version}' is not registered in {self.root}")
+        
+        prakriti_path = directory / PRAKRITI_MODEL_PATH.name
+        if not prakriti_path.exists():
+            prakriti_path = PRAKRITI_MODEL_PATH
+        return ayur_path, prakriti_path
+    
+    def resolve(self) -> Tuple[Optional[str], Path, Path]:
+        """(version, ayur_path, prakriti_path) of the active version"""
+        active = self.read_manifest().get("active") or DEFAULT_VERSION
+        if active != DEFAULT_VERSION:
+            try:
+                return (active, *self.paths(active))
+            except (FileNotFoundError, ValueError) as e:
+                logger.error(f"Active model version unusable, falling back to shipped models: {e}")
+        return (DEFAULT_VERSION, AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH)
+    
+    def register(self, version: str, ayur_path: Path, prakriti_path: Optional[Path] = None) -> Path:
+        """Copy model files into a new version directory"""
+        directory = self.version_dir(version)
+        if directory.exists():
+            raise FileExistsError(f"Model version '{version}' already exists")
+        
+        # Stage in a temporary directory so watchers never see a half-copied version
+        staging = self.root / f".{version}.{os.getpid()}.tmp"
+        staging.mkdir(parents=True)
+        try:
+            shutil.copy2(ayur_path, staging / AYUR_MODEL_PATH.name)
+            if prakriti_path is not None:
+                shutil.copy2(prakriti_path, staging / PRAKRITI_MODEL_PATH.name)
+            staging.rename(directory)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        
+        logger.info(f"Registered model version {version}")
+        return directory
+    
+    def activate(self, version: str):
+        """Mark a version active, remembering the one it replaces"""
+        self.paths(version)
+        current = self.read_manifest().get("active") or DEFAULT_VERSION
+        if current != version:
+            self.write_manifest(version, current)
+
+
+# Global registry instance
+model_registry = ModelRegistry()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage versioned Ayutra models")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    register = commands.add_parser('register', help="Copy model files into a new version")
+    register.add_argument('version')
+    register.add_argument('ayur_model', type=Path)
+    register.add_argument('--prakriti', type=Path, default=None)
+    register.add_argument('--activate', action='store_true')
+    
+    activate = commands.add_parser('activate', help="Make a registered version active")
+    activate.add_argument('version')
+    
+    commands.add_parser('list', help="Show registered versions")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'register':
+        model_registry.register(args.version, args.ayur_model, args.prakriti)
+        if args.activate:
+            model_registry.activate(args.version)
+    elif args.command == 'activate':
+        model_registry.activate(args.version)
+    
+    manifest = model_registry.read_manifest()
+    for version in model_registry.list_versions():
+        marker = '*' if version == manifest.get("active") else ' '
+        print(f"{marker} {version}")
+    print(f"active: {manifest.get('active') or DEFAULT_VERSION}, previous: {manifest.get('previous')}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
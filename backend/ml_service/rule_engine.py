@@ -0,0 +1,287 @@
+"""
+Declarative clinical rule engine
+
+Rules are read from JSON (see clinical_rules.json) and compiled once into a
+flat evaluation plan:
+
+- flag conditions (has_*, preferences) are bits of one uint64 per patient, and
+  each rule's all/any/none flags are uint64 masks tested with bitwise ANDs
+- every distinct threshold or categorical test is one column of a truth table
+  computed column-wise with NumPy; rules reference their columns by index
+
+All rules are then evaluated for a whole batch of patients in one pass.
+"""
+import json
+import logging
+import math
+import operator
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+try:
+    from .config import ALLOWED_KEYS, CLINICAL_RULES_PATH
+except ImportError:
+    from config import ALLOWED_KEYS, CLINICAL_RULES_PATH
+
+logger = logging.getLogger(__name__)
+
+COMPARISONS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+SCALAR_COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+# Rows evaluated per chunk, bounding the (rows x rules x conditions) intermediates
+EVAL_CHUNK_ROWS = 1024
+
+# Flags share one uint64 per patient
+MAX_FLAGS = 64
+
+# Single patients are evaluated with plain Python ints up to this many rules
+SCALAR_MAX_RULES = 100
+
+
+class RuleCompileError(ValueError):
+    """Raised when a rule file is malformed"""
+
+
+def _number(value: Any) -> float:
+    if value is None or isinstance(value, bool):
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    """Pack a (rows, <=64 flags) bool matrix into one uint64 per row"""
+    weights = np.left_shift(np.uint64(1), np.arange(bits.shape[1], dtype=np.uint64))
+    return (bits * weights).sum(axis=1, dtype=np.uint64)
+
+
+def _index_matrix(lists: List[List[int]], pad: int) -> np.ndarray:
+    """Ragged column lists as a (rules, longest) matrix padded with a constant column"""
+    width = max((len(columns) for columns in lists), default=0) or 1
+    out = np.full((len(lists), width), pad, dtype=np.int64)
+    for r, columns in enumerate(lists):
+        out[r, :len(columns)] = columns
+    return out
+
+
+class ClinicalRuleEngine:
+    """Compiled rule set evaluated for whole batches of patients"""
+    
+    def __init__(self, rules: List[Dict[str, Any]], version: Any = None):
+        self.version = version
+        self.rule_ids: List[str] = []
+        self.messages: List[str] = []
+        self._conditions: Dict[Tuple, int] = {}
+        
+        clauses = []
+        for rule in rules:
+            rule_id = rule.get('id')
+            if not rule_id or rule_id in self.rule_ids:
+                raise RuleCompileError(f"Rule id missing or duplicated: {rule_id!r}")
+            if not rule.get('warning'):
+                raise RuleCompileError(f"Rule {rule_id} has no warning")
+            when = rule.get('when') or {}
+            unknown = set(when) - {'all', 'any', 'none'}
+            if unknown or not when:
+                raise RuleCompileError(f"Rule {rule_id} needs 'all', 'any' and/or 'none' conditions, got {sorted(unknown)}")
+            
+            clauses.append({
+                part: [self._condition(rule_id, condition) for condition in when.get(part, [])]
+                for part in ('all', 'any', 'none')
+            })
+            self.rule_ids.append(rule_id)
+            self.messages.append(str(rule['warning']))
+        
+        # Condition layout: flags, then numeric thresholds, then categorical tests
+        keys = list(self._conditions)
+        self.flags = [key[1] for key in keys if key[0] == 'flag']
+        thresholds = [key for key in keys if key[0] == 'cmp']
+        self.categorical = [(key[1], key[2]) for key in keys if key[0] == 'in']
+        self.numeric_fields = sorted({key[1] for key in thresholds})
+        self.threshold_field = np.array([self.numeric_fields.index(key[1]) for key in thresholds], dtype=np.int64)
+        self.threshold_value = np.array([key[3] for key in thresholds], dtype=np.float64)
+        self.threshold_ops = {
+            op: np.array([i for i, key in enumerate(thresholds) if key[2] == op], dtype=np.int64)
+            for op in {key[2] for key in thresholds}
+        }
+        if len(self.flags) > MAX_FLAGS:
+            raise RuleCompileError(f"At most {MAX_FLAGS} distinct flags are supported, got {len(self.flags)}")
+        self.n_conditions = len(keys)
+        
+        # Truth-table columns: thresholds, categorical tests, then constant True / False for padding
+        value_keys = thresholds + [('in', f, v) for f, v in self.categorical]
+        column = {key: i for i, key in enumerate(value_keys)}
+        self.n_value_columns = len(value_keys)
+        self.true_column, self.false_column = self.n_value_columns, self.n_value_columns + 1
+        flag_bit = {flag: np.uint64(1 << i) for i, flag in enumerate(self.flags)}
+        
+        flag_masks = {part: np.zeros(len(clauses), dtype=np.uint64) for part in ('all', 'any', 'none')}
+        value_columns = {part: [] for part in ('all', 'any', 'none')}
+        for r, clause in enumerate(clauses):
+            for part, conditions in clause.items():
+                value_columns[part].append([column[key] for key in conditions if key[0] != 'flag'])
+                for key in conditions:
+                    if key[0] == 'flag':
+                        flag_masks[part][r] |= flag_bit[key[1]]
+        
+        self.all_flags, self.any_flags, self.none_flags = flag_masks['all'], flag_masks['any'], flag_masks['none']
+        self.all_columns = _index_matrix(value_columns['all'], self.true_column)
+        self.any_columns = _index_matrix(value_columns['any'], self.false_column)
+        self.none_columns = _index_matrix(value_columns['none'], self.false_column)
+        self.has_any = np.array([bool(clause['any']) for clause in clauses], dtype=bool)
+        
+        # Same plan as plain ints/tuples for single patients, where NumPy call overhead dominates
+        self._scalar_thresholds = [(key[1], SCALAR_COMPARISONS[key[2]], key[3]) for key in thresholds]
+        self._scalar_rules = [
+            (int(flag_masks['all'][r]), int(flag_masks['any'][r]), int(flag_masks['none'][r]),
+             tuple(value_columns['all'][r]), tuple(value_columns['any'][r]), tuple(value_columns['none'][r]),
+             bool(clause['any']))
+            for r, clause in enumerate(clauses)
+        ]
+        
+        self.hits = [0] * len(self.rule_ids)
+        self.evaluated = 0
+        self._lock = threading.Lock()
+    
+    def _condition(self, rule_id: str, condition: Dict[str, Any]) -> Tuple:
+        """Canonical key of one condition; equal conditions across rules share a bit"""
+        if 'flag' in condition:
+            key = ('flag', condition['flag'])
+        elif 'in' in condition:
+            values = condition['in']
+            if not isinstance(values, list) or not values:
+                raise RuleCompileError(f"Rule {rule_id}: 'in' needs a non-empty list")
+            key = ('in', condition.get('field'), frozenset(str(v).lower() for v in values))
+        else:
+            op = condition.get('op')
+            if op not in COMPARISONS:
+                raise RuleCompileError(f"Rule {rule_id}: unknown operator {op!r}")
+            value = _number(condition.get('value'))
+            if math.isnan(value):
+                raise RuleCompileError(f"Rule {rule_id}: threshold must be a number")
+            key = ('cmp', condition.get('field'), op, value)
+        
+        if key[1] not in ALLOWED_KEYS:
+            raise RuleCompileError(f"Rule {rule_id}: unknown input key {key[1]!r}")
+        self._conditions.setdefault(key, len(self._conditions))
+        return key
+    
+    @classmethod
+    def from_file(cls, path: Path = CLINICAL_RULES_PATH) -> 'ClinicalRuleEngine':
+        start = time.perf_counter()
+        with open(path, 'r') as f:
+            spec = json.load(f)
+        engine = cls(spec.get('rules', []), version=spec.get('version'))
+        logger.info(
+            f"Compiled {len(engine.rule_ids)} clinical rules ({engine.n_conditions} conditions) "
+            f"from {path} in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return engine
+    
+    def condition_bits(self, rows: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Flag word per row and the (rows, value columns + 2) truth table"""
+        n, n_thresholds = len(rows), len(self.threshold_value)
+        
+        if self.flags:
+            flags = _pack(np.array([[bool(row.get(flag)) for flag in self.flags] for row in rows], dtype=bool).reshape(n, -1))
+        else:
+            flags = np.zeros(n, dtype=np.uint64)
+        
+        table = np.zeros((n, self.n_value_columns + 2), dtype=bool)
+        table[:, self.true_column] = True
+        if n_thresholds:
+            values = np.array([[_number(row.get(f)) for f in self.numeric_fields] for row in rows], dtype=np.float64)
+            values = values.reshape(n, -1)[:, self.threshold_field]
+            present = ~np.isnan(values)
+            for op, columns in self.threshold_ops.items():
+                table[:, columns] = present[:, columns] & COMPARISONS[op](values[:, columns], self.threshold_value[columns])
+        
+        for j, (field, allowed) in enumerate(self.categorical):
+            table[:, n_thresholds + j] = [str(row.get(field, '')).lower() in allowed for row in rows]
+        return flags, table
+    
+    def _fired_one(self, row: Dict[str, Any]) -> List[int]:
+        """Indices of the rules one patient fires"""
+        flags = 0
+        for bit, flag in enumerate(self.flags):
+            if row.get(flag):
+                flags |= 1 << bit
+        
+        table = []
+        for field, compare, threshold in self._scalar_thresholds:
+            value = _number(row.get(field))
+            table.append(value == value and compare(value, threshold))
+        for field, allowed in self.categorical:
+            table.append(str(row.get(field, '')).lower() in allowed)
+        
+        return [
+            r for r, (all_f, any_f, none_f, all_c, any_c, none_c, has_any) in enumerate(self._scalar_rules)
+            if flags & all_f == all_f and not flags & none_f
+            and all(table[c] for c in all_c) and not any(table[c] for c in none_c)
+            and (not has_any or flags & any_f or any(table[c] for c in any_c))
+        ]
+    
+    def evaluate(self, rows: List[Dict[str, Any]]) -> np.ndarray:
+        """(rows, rules) bool matrix of fired rules"""
+        fired = np.zeros((len(rows), len(self.rule_ids)), dtype=bool)
+        for start in range(0, len(rows), EVAL_CHUNK_ROWS):
+            flags, table = self.condition_bits(rows[start:start + EVAL_CHUNK_ROWS])
+            flags = flags[:, None]
+            fired[start:start + EVAL_CHUNK_ROWS] = (
+                ((flags & self.all_flags) == self.all_flags)
+                & ((flags & self.none_flags) == 0)
+                & table[:, self.all_columns].all(axis=2)
+                & ~table[:, self.none_columns].any(axis=2)
+                & (~self.has_any | ((flags & self.any_flags) != 0) | table[:, self.any_columns].any(axis=2))
+            )
+        
+        counts = fired.sum(axis=0)
+        with self._lock:
+            for r in np.flatnonzero(counts):
+                self.hits[r] += int(counts[r])
+            self.evaluated += len(rows)
+        return fired
+    
+    def warnings(self, rows: List[Dict[str, Any]]) -> List[List[str]]:
+        """Warning messages per patient, in rule order"""
+        if len(rows) == 1 and len(self.rule_ids) <= SCALAR_MAX_RULES:
+            fired = self._fired_one(rows[0])
+            with self._lock:
+                for r in fired:
+                    self.hits[r] += 1
+                self.evaluated += 1
+            return [[self.messages[r] for r in fired]]
+        return [[self.messages[j] for j in np.flatnonzero(row)] for row in self.evaluate(rows)]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = {rule_id: int(count) for rule_id, count in zip(self.rule_ids, self.hits) if count}
+            evaluated = self.evaluated
+        return {
+            "version": self.version,
+            "rules": len(self.rule_ids),
+            "conditions": self.n_conditions,
+            "patients_evaluated": evaluated,
+            "hits": hits
+        }
+
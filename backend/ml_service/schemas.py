@@ -1,9 +1,46 @@
 """
 Pydantic schemas for strict input validation
 """
-from pydantic import BaseModel, Field, field_validator, model_validator
-from typing import Optional, List, Literal
-from config import ALLOWED_KEYS, REQUIRED_FIELDS
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
+from typing import Optional, List, Literal, Dict, Any, Union
+try:
+    from .config import (
+        ALLOWED_KEYS, REQUIRED_FIELDS, MAX_BATCH_SIZE, PRAKRITI_FEATURES, PRAKRITI_DOSHAS, WHATIF_MAX_VARIANTS
+    )
+except ImportError:
+    from config import (
+        ALLOWED_KEYS, REQUIRED_FIELDS, MAX_BATCH_SIZE, PRAKRITI_FEATURES, PRAKRITI_DOSHAS, WHATIF_MAX_VARIANTS
+    )
+
+
+class PrakritiAssessment(BaseModel):
+    """Prakriti questionnaire - each trait answered as vata/pitta/kapha (or 0/1/2)"""
+    
+    body_frame: Union[int, str]
+    skin_texture: Union[int, str]
+    hair: Union[int, str]
+    eyes: Union[int, str]
+    appetite: Union[int, str]
+    digestion: Union[int, str]
+    sleep: Union[int, str]
+    stamina: Union[int, str]
+    speech: Union[int, str]
+    mind: Union[int, str]
+    memory: Union[int, str]
+    weather: Union[int, str]
+    
+    class Config:
+        extra = "forbid"
+    
+    @field_validator(*PRAKRITI_FEATURES, mode='before')
+    @classmethod
+    def normalize_dosha(cls, value):
+        """Accept dosha names in any case, or their codes"""
+        if isinstance(value, str) and value.strip().lower() in PRAKRITI_DOSHAS:
+            return value.strip().lower()
+        if isinstance(value, int) and not isinstance(value, bool) and 0 <= value < len(PRAKRITI_DOSHAS):
+            return PRAKRITI_DOSHAS[value]
+        raise ValueError(f"must be one of {', '.join(PRAKRITI_DOSHAS)} or 0-{len(PRAKRITI_DOSHAS) - 1}")
 
 
 class PatientInput(BaseModel):
@@ -32,6 +69,8 @@ class PatientInput(BaseModel):
     vata_state: Optional[str] = None
     pitta_state: Optional[str] = None
     kapha_state: Optional[str] = None
+    # Answering the assessment instead of giving prakriti lets the service infer it
+    prakriti_assessment: Optional[PrakritiAssessment] = None
     
     # Digestion
     bowel_pattern: Optional[str] = None
@@ -99,6 +138,8 @@ class PatientInput(BaseModel):
         """Check required fields are present"""
         missing = []
         for field in REQUIRED_FIELDS:
+            if field == 'prakriti' and self.prakriti_assessment is not None:
+                continue
             value = getattr(self, field)
             if value is None or value == '':
                 missing.append(field)
@@ -131,6 +172,17 @@ class PatientInput(BaseModel):
         return self
 
 
+def format_validation_errors(error: ValidationError) -> List[Dict[str, str]]:
+    """Flatten a Pydantic ValidationError into JSON-safe field/message pairs"""
+    return [
+        {
+            "field": ".".join(str(part) for part in err.get("loc", ())) or None,
+            "message": err.get("msg", "Invalid input")
+        }
+        for err in error.errors()
+    ]
+
+
 class ModelOutput(BaseModel):
     """Model prediction output"""
     pred_label: Optional[str] = None
@@ -145,4 +197,97 @@ class PredictionResponse(BaseModel):
     patient: dict = Field(..., description="Sanitized patient input")
     model_output: dict = Field(..., description="Model prediction results")
     warnings: List[str] = Field(default_factory=list, description="Clinical safety warnings")
+    prakriti_output: Optional[dict] = Field(None, description="Inferred prakriti, when it was not supplied")
     diet_plan: Optional[dict] = None
+
+
+class ExplanationResponse(PredictionResponse):
+    """Prediction response with per-field contributions"""
+    explanation: dict = Field(..., description="TreeSHAP contributions of each input field to the model's log-odds")
+
+
+class BatchPredictionRequest(BaseModel):
+    """Batch input - patients are validated one by one so a bad row cannot fail the batch"""
+    patients: List[Dict[str, Any]] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class BatchPredictionResponse(BaseModel):
+    """Batch API response schema"""
+    meta: dict = Field(..., description="Model metadata and batch counts")
+    results: List[dict] = Field(..., description="Per-patient results or validation errors, in input order")
+
+
+class ModelReloadRequest(BaseModel):
+    """Admin request to load and activate a registered model version"""
+    version: str = Field(..., min_length=1, max_length=64, description="Registered version name, or 'default' for the shipped models")
+
+
+def _check_whatif_keys(changes: Dict[str, Any]) -> Dict[str, Any]:
+    unknown = sorted(set(changes) - ALLOWED_KEYS)
+    if unknown:
+        raise ValueError(f"Cannot change {', '.join(unknown)} - only patient input fields")
+    return changes
+
+
+class WhatIfUpdate(BaseModel):
+    """Fields to change in a what-if session - null clears a field"""
+    changes: Dict[str, Any] = Field(..., min_length=1)
+    
+    class Config:
+        extra = "forbid"
+    
+    @field_validator('changes')
+    @classmethod
+    def check_keys(cls, changes):
+        return _check_whatif_keys(changes)
+
+
+class WhatIfSweep(BaseModel):
+    """One field swept over listed values, or over start..stop (inclusive) in steps"""
+    field: str
+    values: Optional[List[Any]] = Field(None, min_length=1)
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    step: Optional[float] = Field(None, gt=0)
+    # Applied to every variant on top of the session's patient, without being kept
+    changes: Dict[str, Any] = Field(default_factory=dict)
+    
+    class Config:
+        extra = "forbid"
+    
+    @field_validator('changes')
+    @classmethod
+    def check_keys(cls, changes):
+        return _check_whatif_keys(changes)
+    
+    @model_validator(mode='after')
+    def check_points(self):
+        _check_whatif_keys({self.field: None})
+        if self.values is None:
+            if self.start is None or self.stop is None or self.step is None:
+                raise ValueError("Give either values or start, stop and step")
+            if self.stop < self.start:
+                raise ValueError("stop must not be below start")
+        count = self.point_count()
+        if count > WHATIF_MAX_VARIANTS:
+            raise ValueError(f"Sweep has {count} points - at most {WHATIF_MAX_VARIANTS} are allowed")
+        return self
+    
+    def point_count(self) -> int:
+        if self.values is not None:
+            return len(self.values)
+        return int((self.stop - self.start) / self.step + 1e-9) + 1
+    
+    def points(self) -> List[Any]:
+        """The swept values, in order"""
+        if self.values is not None:
+            return list(self.values)
+        # Rounded so float steps give 0.1, 0.2, ... rather than 0.30000000000000004
+        return [round(self.start + i * self.step, 9) for i in range(self.point_count())]
+
+
+class PrakritiResponse(BaseModel):
+    """Prakriti inference response schema"""
+    meta: dict = Field(..., description="Model metadata")
+    assessment: dict = Field(..., description="Normalized assessment answers")
+    prakriti_output: dict = Field(..., description="Inferred prakriti and per-dosha scores")
@@ -0,0 +1,84 @@
+"""
+JSON encoding for payload hashes and API responses
+
+Responses are built as plain dicts and encoded once. orjson is used when it
+is installed (optional - pip install orjson), the json module otherwise.
+Both write NaN and infinities as null.
+"""
+import hashlib
+import json
+import math
+from typing import Any
+
+import numpy as np
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """NumPy scalars/arrays as plain Python values"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _finite(value: Any) -> Any:
+    """Copy of a JSON-able value with NaN and infinities replaced by None, as orjson writes them"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if isinstance(value, (np.generic, np.ndarray)):
+        return _finite(_default(value))
+    return value
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, with non-finite floats as null"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    try:
+        return _stdlib_dumps(content)
+    except ValueError:
+        # Only content with a NaN or infinity pays for the copy
+        return _stdlib_dumps(_finite(content))
+
+
+def canonical_bytes(payload: Any, namespace: str = '') -> bytes:
+    """
+    Key-order independent encoding of a request payload
+    
+    Kept byte-identical to the original json.dumps(sort_keys=True) form, so
+    payload hashes - prediction cache keys and diet plan seeds - do not
+    change between releases or with the JSON backend.
+    """
+    return (namespace + json.dumps(payload, sort_keys=True)).encode()
+
+
+def payload_hash(payload: Any, namespace: str = '') -> str:
+    """SHA-256 of the canonical encoding - used for logging, caching and plan seeds"""
+    return hashlib.sha256(canonical_bytes(payload, namespace)).hexdigest()
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with dumps()
+    
+    Returned directly from endpoints, so FastAPI skips re-validating the
+    content against the route's response_model.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
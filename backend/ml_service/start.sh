@@ -35,6 +35,14 @@ if [ ! -f "../model/AYURDIET_8000_STRONG_AYURVEDA_ALL_FOODS_FIXED.xlsx" ]; then
     echo "Warning: Dataset file not found"
 fi
 
+# Convert the dataset workbook into its binary cache (no-op when up to date)
+python dataset_cache.py
+
 # Start the service
 echo "Starting FastAPI service..."
-python main.py
+if [ "${ML_WORKERS:-1}" -gt 1 ]; then
+    # Production mode: preload models once and fork workers that share them
+    python launcher.py --workers "$ML_WORKERS"
+else
+    python main.py
+fi
@@ -0,0 +1,164 @@
+"""
+Incremental parsing of NDJSON / CSV request bodies for bulk scoring
+
+Bodies are consumed chunk by chunk and yielded as records, so memory stays
+bounded by the longest line rather than the size of the upload.
+"""
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from starlette.responses import StreamingResponse
+
+# Record yielded by the parsers: (1-based record number, row dict or error message)
+Record = Tuple[int, Union[Dict[str, Any], str]]
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines', 'application/ndjson')
+CSV_TYPES = ('text/csv', 'application/csv')
+
+# CSV cells holding lists (e.g. exclude_ingredients) separate items with ";"
+CSV_LIST_FIELDS = ('exclude_ingredients',)
+CSV_LIST_SEPARATOR = ';'
+
+
+class LineTooLongError(ValueError):
+    """Raised for a line longer than the configured limit"""
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose iterator may still be reading the request body
+    
+    The stock response listens for disconnects on receive(), which would
+    swallow body chunks; a disconnect surfaces as ClientDisconnect from
+    request.stream() instead.
+    """
+    
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def body_format(content_type: Optional[str]) -> Optional[str]:
+    """'ndjson', 'csv' or None for an unsupported content type"""
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    if media_type in NDJSON_TYPES:
+        return 'ndjson'
+    if media_type in CSV_TYPES:
+        return 'csv'
+    return None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Union[str, LineTooLongError]]:
+    """
+    Split a byte stream into decoded lines
+    
+    An over-long line is yielded as a LineTooLongError (and skipped up to the
+    next newline) instead of being buffered.
+    """
+    # Each chunk is split once; only the unterminated tail is carried to the next one
+    tail = bytearray()
+    skipping = False
+    async for chunk in chunks:
+        lines = chunk.split(b'\n')
+        tail += lines[0]
+        if len(lines) > 1:
+            lines[0] = bytes(tail)
+            tail = bytearray(lines.pop())
+            for line in lines:
+                if skipping:
+                    skipping = False
+                    continue
+                yield line.rstrip(b'\r').decode('utf-8', errors='replace')
+        
+        if len(tail) > max_line_bytes:
+            if not skipping:
+                yield LineTooLongError(f"Line longer than {max_line_bytes} bytes")
+            skipping = True
+            tail = bytearray()
+    
+    if tail and not skipping:
+        yield bytes(tail).rstrip(b'\r').decode('utf-8', errors='replace')
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Record]:
+    """One JSON object per non-empty line"""
+    number = 0
+    async for line in iter_lines(chunks, max_line_bytes):
+        if isinstance(line, LineTooLongError):
+            number += 1
+            yield number, str(line)
+            continue
+        if not line.strip():
+            continue
+        
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f"Invalid JSON: {e}"
+            continue
+        yield (number, row) if isinstance(row, dict) else (number, "Each line must be a JSON object")
+
+
+def csv_row(header: List[str], values: List[Any]) -> Dict[str, Any]:
+    """
+    Map a flat record (CSV line or table row) onto a patient dict
+    
+    Empty cells and NaN are treated as missing, list fields are split on ";"
+    and dotted columns (prakriti_assessment.body_frame) become nested objects.
+    """
+    row: Dict[str, Any] = {}
+    for key, value in zip(header, values):
+        if isinstance(value, str):
+            value = value.strip()
+        if not key or value is None or value == '' or value != value:
+            continue
+        if key in CSV_LIST_FIELDS and isinstance(value, str):
+            value = [item.strip() for item in value.split(CSV_LIST_SEPARATOR) if item.strip()]
+        if '.' in key:
+            parent, child = key.split('.', 1)
+            row.setdefault(parent, {})[child] = value
+        else:
+            row[key] = value
+    return row
+
+
+async def iter_csv(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Record]:
+    """Header line followed by one record per line (quoted fields may span lines)"""
+    header: Optional[List[str]] = None
+    pending = ''
+    number = 0
+    async for line in iter_lines(chunks, max_line_bytes):
+        if isinstance(line, LineTooLongError):
+            number += 1
+            pending = ''
+            yield number, str(line)
+            continue
+        
+        pending = f"{pending}\n{line}" if pending else line
+        # An odd number of quotes means a quoted field continues on the next line
+        if pending.count('"') % 2:
+            if len(pending) > max_line_bytes:
+                number += 1
+                pending = ''
+                yield number, f"Record longer than {max_line_bytes} bytes"
+            continue
+        record, pending = pending, ''
+        if not record.strip():
+            continue
+        
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip().lstrip('﻿') for name in values]
+            continue
+        
+        number += 1
+        if len(values) > len(header):
+            yield number, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield number, csv_row(header, values)
+    
+    if pending:
+        yield number + 1, "Unterminated quoted field at end of input"
@@ -7,8 +7,57 @@ from pathlib import Path
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from ml_service.config import validate_paths
-from ml_service.model_loader import initialize_models, model_loader
+from ml_service.config import validate_paths, DATASET_XLSX_PATH
+from ml_service.model_loader import initialize_models, model_loader, ModelLoader
+from ml_service.executor import InferenceExecutor, ExecutorSaturatedError, InferenceTimeoutError
+from ml_service.batcher import MicroBatcher
+from ml_service.feature_encoder import CompiledFeatureEncoder
+from ml_service.dataset_cache import build_dataset_cache, load_dataset_frame
+from ml_service.cache import PredictionCache, FileCacheBackend
+from ml_service.registry import ModelRegistry, DEFAULT_VERSION
+from ml_service.hot_reload import ModelReloader, ModelReloadError
+from ml_service.config import AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, PRAKRITI_FEATURES, ALLOWED_KEYS
+from ml_service.schemas import PatientInput
+from ml_service.metrics import MetricsRegistry, Counter, Gauge, Histogram, stage_latency, StageClock
+from ml_service.diet_planner import diet_planner
+from ml_service.clinical_safety import ClinicalSafetyChecker, ingredient_matcher_for
+from ml_service.rule_engine import ClinicalRuleEngine, RuleCompileError, COMPARISONS
+from ml_service.model_bundle import ModelBundle, BundleError, build_model_bundle
+from ml_service.tree_engine import BoosterEngine, FlatTreeEngine, ParityCheckedEngine, export_booster, _probe_matrix
+import hashlib
+import subprocess
+import threading
+import pandas as pd
+import tempfile
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+import numpy as np
+import asyncio
+import json
+import time
+
+# Small fixed cohort reused by the batch/regression checks
+SAMPLE_PATIENTS = [
+    {"gender": "male", "age": 35, "height_cm": 175, "weight_kg": 75, "bmi": 24.5,
+     "daily_calories": 2000, "diet_type": "veg", "prakriti": "vata-pitta",
+     "sleep_hours": 7, "activity_level": "moderate"},
+    {"gender": "female", "age": 52, "height_cm": 160, "weight_kg": 82, "bmi": 32.0,
+     "daily_calories": 1600, "diet_type": "non-veg", "prakriti": "kapha",
+     "has_diabetes": True, "diabetic_friendly": True, "fasting_blood_sugar_mg_dl": 140,
+     "season": "winter", "therapeutic_goal": "glycemic_control"},
+    {"gender": "male", "age": 24, "height_cm": 182, "weight_kg": 64, "daily_calories": 2800,
+     "diet_type": "vegan", "vegan": True, "vegetarian": True, "prakriti": "pitta",
+     "stress_level": "high", "patient_country": "India", "patient_region": "South India"},
+    {"gender": "female", "age": 41, "height_cm": 165, "weight_kg": 58, "daily_calories": 1900,
+     "diet_type": "eggetarian", "prakriti": "unknown-dosha", "has_hypertension": True,
+     "systolic_bp": 150, "diastolic_bp": 95},
+]
+
+
+def ensure_models_loaded():
+    """Load models once for tests that run on their own"""
+    if not model_loader.models_loaded:
+        validate_paths()
+        initialize_models()
 
 def test_model_loading():
     """Test that models can be loaded"""
@@ -60,6 +109,1515 @@ def test_prediction():
         traceback.print_exc()
         return False
 
+def test_batch_prediction():
+    """Batch prediction must match row-by-row prediction"""
+    print("\nTesting batch prediction...")
+    ensure_models_loaded()
+    
+    batch = model_loader.predict_batch(SAMPLE_PATIENTS)
+    assert len(batch) == len(SAMPLE_PATIENTS)
+    
+    for patient, result in zip(SAMPLE_PATIENTS, batch):
+        single = model_loader.predict(patient)
+        assert result['pred_label'] == single['pred_label']
+        for cls, prob in single['pred_proba'].items():
+            assert abs(result['pred_proba'][cls] - prob) < 1e-6
+    
+    assert model_loader.predict_batch([]) == []
+    print(f"✓ Batch of {len(batch)} matches single predictions")
+
+
+def test_inference_executor():
+    """Executor must reject work beyond its queue depth and enforce timeouts"""
+    print("\nTesting inference executor...")
+    ensure_models_loaded()
+    
+    async def saturate():
+        executor = InferenceExecutor(max_workers=1, max_queue=0, timeout=30.0, retry_after=2)
+        running = asyncio.ensure_future(executor.run('predict_batch', SAMPLE_PATIENTS * 50))
+        await asyncio.sleep(0)
+        try:
+            await executor.run('predict', SAMPLE_PATIENTS[0])
+            raise AssertionError("Expected ExecutorSaturatedError")
+        except ExecutorSaturatedError as e:
+            assert e.retry_after == 2
+        result = await running
+        executor.shutdown()
+        return result, executor.stats()
+    
+    async def time_out():
+        executor = InferenceExecutor(max_workers=1, max_queue=0, timeout=0.0001)
+        try:
+            await executor.run('predict_batch', SAMPLE_PATIENTS * 500)
+            raise AssertionError("Expected InferenceTimeoutError")
+        except InferenceTimeoutError:
+            pass
+        executor.shutdown()
+    
+    result, stats = asyncio.run(saturate())
+    assert len(result) == len(SAMPLE_PATIENTS) * 50
+    assert stats['rejected'] == 1 and stats['pending'] == 0
+    asyncio.run(time_out())
+    print(f"✓ Backpressure and timeouts enforced: {stats}")
+
+
+def test_micro_batcher():
+    """Concurrent submissions must coalesce into one batch and fan results back out"""
+    print("\nTesting micro-batcher...")
+    ensure_models_loaded()
+    
+    async def burst():
+        executor = InferenceExecutor(max_workers=1)
+        batcher = MicroBatcher(executor, max_batch_size=64, max_wait_ms=20)
+        outputs = await asyncio.gather(*(batcher.submit(p) for p in SAMPLE_PATIENTS))
+        # A full batch is dispatched immediately without waiting for the window
+        batcher.max_batch_size = 2
+        outputs += await asyncio.gather(*(batcher.submit(p) for p in SAMPLE_PATIENTS[:2]))
+        executor.shutdown()
+        return outputs, batcher.stats()
+    
+    outputs, stats = asyncio.run(burst())
+    for patient, output in zip(SAMPLE_PATIENTS + SAMPLE_PATIENTS[:2], outputs):
+        assert output['pred_label'] == model_loader.predict(patient)['pred_label']
+    
+    assert stats['batch_size']['count'] == 2
+    assert stats['batch_size']['sum'] == len(SAMPLE_PATIENTS) + 2
+    assert stats['wait_seconds']['count'] == len(SAMPLE_PATIENTS) + 2
+    print(f"✓ {len(outputs)} requests served by {stats['batch_size']['count']} batches")
+
+
+def legacy_predict(data):
+    """Reference copy of the original predict(): predict_proba() followed by predict()"""
+    model = model_loader.ayur_model
+    X = model_loader.preprocess_input(data)
+    pred_proba = model.predict_proba(X)
+    pred = model.predict(X)
+    proba_dict = {str(cls): float(prob) for cls, prob in zip(model.classes_, pred_proba[0])}
+    return {
+        'pred_label': str(pred[0]),
+        'pred_score': float(pred_proba[0].max()),
+        'pred_proba': proba_dict,
+        'raw_output': {
+            'prediction': pred.tolist(),
+            'probabilities': pred_proba.tolist()
+        }
+    }
+
+
+def test_single_pass_regression():
+    """Single-traversal predict() must reproduce the original labels and probabilities exactly"""
+    print("\nTesting single-pass prediction against the original path...")
+    ensure_models_loaded()
+    
+    calls = {'predict': 0, 'predict_proba': 0}
+    model = model_loader.estimator or model_loader.ayur_model
+    original_predict, original_proba = model.predict, model.predict_proba
+    # Exact comparison is against the sklearn path; tree engines are covered by test_tree_engine_parity
+    tree_engine, model_loader.tree_engine = model_loader.tree_engine, None
+    
+    def counting(name, fn):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+    
+    try:
+        for patient in SAMPLE_PATIENTS:
+            expected = legacy_predict(patient)
+            model.predict = counting('predict', original_predict)
+            model.predict_proba = counting('predict_proba', original_proba)
+            try:
+                actual = model_loader.predict(patient)
+            finally:
+                del model.predict, model.predict_proba
+            assert actual == expected, f"{actual} != {expected}"
+    finally:
+        model_loader.tree_engine = tree_engine
+    
+    assert calls == {'predict': 0, 'predict_proba': len(SAMPLE_PATIENTS)}
+    print(f"✓ {len(SAMPLE_PATIENTS)} predictions identical with one model traversal each")
+
+
+def test_feature_encoder_parity():
+    """Compiled encoder must produce bit-identical features to the pandas path"""
+    print("\nTesting compiled feature encoder parity...")
+    ensure_models_loaded()
+    assert model_loader.feature_encoder is not None
+    
+    # Pipeline path: ColumnTransformer output as the model sees it (float32)
+    transformer = model_loader.ayur_model.steps[0][1]
+    rows = SAMPLE_PATIENTS + [{}, {"age": "41", "stress_level": "moderate", "has_ckd": True}]
+    expected = np.asarray(transformer.transform(model_loader.preprocess_batch(rows)), dtype=np.float32)
+    actual = model_loader.feature_encoder.encode(rows)
+    assert actual.dtype == np.float32 and actual.shape == expected.shape
+    assert np.array_equal(actual.view(np.uint32), expected.view(np.uint32))
+    
+    # Label-encoder path: LabelEncoder/StandardScaler fitted on the sample cohort
+    columns = ['gender', 'age', 'height_cm', 'weight_kg', 'daily_calories', 'diet_type', 'prakriti']
+    encoders = {col: LabelEncoder().fit([str(p[col]) for p in SAMPLE_PATIENTS[:3]]) for col in ('gender', 'diet_type', 'prakriti')}
+    scalers = {col: StandardScaler().fit([[p[col]] for p in SAMPLE_PATIENTS]) for col in ('age', 'height_cm', 'weight_kg')}
+    
+    legacy = ModelLoader()
+    legacy.is_pipeline = False
+    legacy.encoders, legacy.scalers = encoders, scalers
+    compiled = CompiledFeatureEncoder.from_label_encoders(columns, encoders, scalers)
+    for patient in SAMPLE_PATIENTS:
+        row = {col: patient[col] for col in columns}
+        expected = legacy.preprocess_input(row)[columns].to_numpy(dtype=np.float32)
+        assert np.array_equal(compiled.encode([row]).view(np.uint32), expected.view(np.uint32))
+    
+    print(f"✓ {len(rows)} pipeline rows and {len(SAMPLE_PATIENTS)} label-encoded rows bit-identical")
+
+
+def legacy_align_frame(rows):
+    """Reference copy of the original pipeline path: frame from the request, then reindex and coerce"""
+    df = pd.DataFrame.from_records(rows).reindex(columns=model_loader.column_order)
+    for col in model_loader.model_meta.get('cat_cols', []):
+        df[col] = df[col].where(df[col].notna(), 'unknown').astype(str)
+    num_cols = model_loader.model_meta.get('num_cols', [])
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce').astype(float)
+    return df
+
+
+def test_feature_schema():
+    """Schema-built frames follow the training layout whatever keys and order the request has"""
+    print("\nTesting feature schema...")
+    ensure_models_loaded()
+    schema = model_loader.feature_schema
+    assert schema is not None and schema.names == model_loader.model_meta['feature_cols']
+    
+    rows = SAMPLE_PATIENTS + [{}, {"age": "41", "stress_level": "moderate", "has_ckd": True}]
+    frame = schema.frame(rows)
+    pd.testing.assert_frame_equal(frame, legacy_align_frame(rows))
+    
+    # Key order and keys the model does not use make no difference
+    shuffled = [dict(reversed(list({**row, "not_a_feature": 1}.items()))) for row in rows]
+    pd.testing.assert_frame_equal(schema.frame(shuffled), frame)
+    
+    # The pandas path scores like the compiled encoder
+    expected = model_loader.estimator.predict_proba(model_loader.feature_encoder.encode(rows))
+    assert np.abs(model_loader.ayur_model.predict_proba(frame) - expected).max() < 1e-6
+    
+    # Bare estimators: encoded columns come out in the recorded order, not the request's
+    columns = ['gender', 'age', 'height_cm', 'weight_kg', 'daily_calories', 'diet_type', 'prakriti']
+    legacy = ModelLoader()
+    legacy.is_pipeline, legacy.column_order = False, columns
+    legacy.encoders = {col: LabelEncoder().fit([str(p[col]) for p in SAMPLE_PATIENTS]) for col in ('gender', 'diet_type', 'prakriti')}
+    legacy.scalers = {col: StandardScaler().fit([[p[col]] for p in SAMPLE_PATIENTS]) for col in ('age', 'height_cm')}
+    legacy.compile_feature_schema()
+    compiled = CompiledFeatureEncoder.from_label_encoders(columns, legacy.encoders, legacy.scalers)
+    for patient in SAMPLE_PATIENTS:
+        row = dict(reversed([(col, patient[col]) for col in columns]))
+        X = legacy.preprocess_input(row)
+        assert list(X.columns) == columns
+        assert np.array_equal(X.to_numpy(dtype=np.float32), compiled.encode([row]))
+    
+    print(f"✓ {len(schema.names)} columns in training order for {len(rows)} rows")
+
+
+def benchmark_feature_schema(iterations=200):
+    """Pandas path frame construction: reindex + coerce (old) vs schema (new)"""
+    print("\nBenchmarking feature schema...")
+    ensure_models_loaded()
+    for n in (1, 100):
+        rows = (SAMPLE_PATIENTS * 25)[:n]
+        for name, build in (("reindex", legacy_align_frame), ("schema", model_loader.feature_schema.frame)):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                build(rows)
+            print(f"  {n:3d} rows  {name:8s} {(time.perf_counter() - start) / iterations * 1000:7.2f} ms")
+
+
+def benchmark_feature_encoder(iterations=200):
+    """Per-row preprocessing cost: pandas path vs compiled encoder"""
+    print("\nBenchmarking feature encoding...")
+    ensure_models_loaded()
+    transformer = model_loader.ayur_model.steps[0][1]
+    patient = SAMPLE_PATIENTS[1]
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        transformer.transform(model_loader.preprocess_input(patient))
+    pandas_us = (time.perf_counter() - start) / iterations * 1e6
+    
+    start = time.perf_counter()
+    for _ in range(iterations):
+        model_loader.feature_encoder.encode([patient])
+    compiled_us = (time.perf_counter() - start) / iterations * 1e6
+    
+    print(f"  pandas + ColumnTransformer: {pandas_us:9.1f} us/row")
+    print(f"  compiled encoder:           {compiled_us:9.1f} us/row")
+    print(f"  speedup:                    {pandas_us / compiled_us:9.1f}x")
+
+
+def test_tree_engine_parity():
+    """Flat and native booster engines must match the sklearn estimator within 1e-5"""
+    print("\nTesting tree engine parity...")
+    ensure_models_loaded()
+    estimator = model_loader.estimator
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        booster = BoosterEngine.load(export_booster(estimator, model_loader.model_fingerprint, Path(tmp)))
+    flat = FlatTreeEngine.from_booster(booster.booster)
+    assert flat is not None
+    flat.fallback = booster
+    
+    encoded = model_loader.feature_encoder.encode(SAMPLE_PATIENTS)
+    probe = _probe_matrix(estimator.n_features_in_, rows=48)
+    for X in (encoded, encoded[:1], probe[:flat.max_rows], probe):
+        expected = estimator.predict_proba(X)
+        assert np.abs(flat.predict_proba(X) - expected).max() < 1e-5
+        assert np.abs(booster.predict_proba(X) - expected).max() < 1e-5
+    
+    # The walk itself (no fallback) also agrees on a batch above max_rows
+    margin = flat.margin(probe)[:, 0]
+    expected_margin = estimator.get_booster().inplace_predict(probe, predict_type='margin')
+    assert np.abs(margin - expected_margin).max() < 1e-4
+    
+    checked = ParityCheckedEngine(flat, estimator)
+    checked.predict_proba(encoded)
+    assert checked.checked == len(SAMPLE_PATIENTS) and checked.mismatches == 0
+    
+    # A flat engine failing the load-time probe leaves the booster, not sklearn
+    from ml_service import tree_engine
+    probe_difference = tree_engine._probe_difference
+    tree_engine._probe_difference = lambda *args: 1.0
+    try:
+        engine = tree_engine.build_tree_engine(estimator, model_loader.model_fingerprint)
+    finally:
+        tree_engine._probe_difference = probe_difference
+    assert isinstance(engine, BoosterEngine)
+    assert np.abs(engine.predict_proba(encoded) - estimator.predict_proba(encoded)).max() < 1e-5
+    
+    print(f"✓ {flat.stats()['trees']} trees / {flat.stats()['nodes']} nodes, "
+          f"max difference {checked.max_difference:.1e}")
+
+
+def benchmark_tree_engine(iterations=500):
+    """Single-row scoring: sklearn wrapper vs native booster vs flat engine"""
+    print("\nBenchmarking tree engines...")
+    ensure_models_loaded()
+    estimator = model_loader.estimator
+    X = model_loader.feature_encoder.encode(SAMPLE_PATIENTS[:1])
+    with tempfile.TemporaryDirectory() as tmp:
+        booster = BoosterEngine.load(export_booster(estimator, model_loader.model_fingerprint, Path(tmp)))
+    flat = FlatTreeEngine.from_booster(booster.booster)
+    
+    for name, model in (("sklearn", estimator), ("booster", booster), ("flat", flat)):
+        model.predict_proba(X)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            model.predict_proba(X)
+        print(f"  {name:8s} {(time.perf_counter() - start) / iterations * 1e6:9.1f} us/row")
+
+
+def test_model_bundle():
+    """Bundle-loaded models must score exactly like the pickles, and tampering must be detected"""
+    print("\nTesting model bundle...")
+    reference = ModelLoader().initialize(use_bundle=False)
+    patients = SAMPLE_PATIENTS * 10
+    doshas = ("vata", "pitta", "kapha")
+    prakriti_rows = [{"body_frame": a, "skin_texture": b, "digestion": b} for a in doshas for b in doshas]
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = build_model_bundle(reference, AYUR_MODEL_PATH, Path(tmp))
+        loader = ModelLoader()
+        assert loader.load_bundle(AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, directory=Path(tmp))
+        assert loader.models_loaded and loader.model_token == reference.model_token
+        
+        # Node arrays are read-only views of the mapped file, not copies
+        for array in (loader.tree_engine.feature, loader.tree_engine.value, loader.prakriti_model.threshold):
+            assert not array.flags.writeable and not array.flags.owndata
+        
+        # Small batches walk the flat arrays, large ones build the deferred booster
+        for rows in (patients[:4], patients):
+            for got, expected in zip(loader.predict_batch(rows), reference.predict_batch(rows)):
+                assert got['pred_label'] == expected['pred_label']
+                assert abs(got['pred_score'] - expected['pred_score']) < 1e-9
+        assert loader.predict_prakriti_batch(prakriti_rows) == reference.predict_prakriti_batch(prakriti_rows)
+        assert loader._ayur_model is None
+        
+        # Flip one byte inside the first tree array
+        bundle = ModelBundle.open(path)
+        offset = bundle.manifest["arrays"]["ayur/feature"]["offset"]
+        data = bytearray(path.read_bytes())
+        data[offset] ^= 0xFF
+        tampered = Path(tmp) / "tampered.bundle"
+        tampered.write_bytes(bytes(data))
+        try:
+            ModelBundle.open(tampered)
+            assert False, "checksum mismatch not detected"
+        except BundleError:
+            pass
+        
+        tampered.write_bytes(path.read_bytes()[:-4])
+        try:
+            ModelBundle.open(tampered)
+            assert False, "truncated bundle not detected"
+        except BundleError:
+            pass
+        
+        # A corrupted bundle is ignored in favour of the pickles
+        path.write_bytes(bytes(data))
+        assert not ModelLoader().load_bundle(AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, directory=Path(tmp))
+        
+        # Every registry version stores the same file name - rebuilding one must not delete another's
+        reference.registry_version = "v1.2"
+        other = build_model_bundle(reference, AYUR_MODEL_PATH, Path(tmp))
+        assert other != path and path.exists()
+        reference.registry_version = DEFAULT_VERSION
+        reference.model_fingerprint = "0" * 16
+        rebuilt = build_model_bundle(reference, AYUR_MODEL_PATH, Path(tmp))
+        assert rebuilt.exists() and other.exists() and not path.exists()
+        
+        boosters = [
+            export_booster(reference.estimator, fingerprint, Path(tmp), version=version)
+            for version, fingerprint in (("v1", "a"), ("v1.2", "a"), ("v1", "b"))
+        ]
+        assert not boosters[0].exists() and boosters[1].exists() and boosters[2].exists()
+    
+    print(f"✓ {bundle.stats()['bytes']} byte bundle matches the pickled models; corruption detected")
+
+
+def benchmark_model_load():
+    """Model load: unpickling vs the memory-mapped bundle"""
+    print("\nBenchmarking model load...")
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        reference = ModelLoader().initialize(use_bundle=False)
+        pickle_s = time.perf_counter() - start
+        build_model_bundle(reference, AYUR_MODEL_PATH, Path(tmp))
+        
+        start = time.perf_counter()
+        ModelLoader().load_bundle(AYUR_MODEL_PATH, PRAKRITI_MODEL_PATH, directory=Path(tmp))
+        bundle_s = time.perf_counter() - start
+    
+    print(f"  pickles (warm imports): {pickle_s * 1000:8.1f} ms")
+    print(f"  bundle:                 {bundle_s * 1000:8.1f} ms")
+
+
+def test_dataset_cache():
+    """Cached dataset must match the workbook and load faster"""
+    print("\nTesting dataset cache...")
+    
+    start = time.perf_counter()
+    workbook = pd.read_excel(DATASET_XLSX_PATH)
+    workbook_s = time.perf_counter() - start
+    
+    path = build_dataset_cache()
+    start = time.perf_counter()
+    cached = load_dataset_frame()
+    cached_s = time.perf_counter() - start
+    
+    # load_dataset_frame falls back to the workbook, so check the file itself too
+    assert path.suffix == '.parquet'
+    pd.testing.assert_frame_equal(pd.read_parquet(path), workbook)
+    pd.testing.assert_frame_equal(cached, workbook)
+    print(f"✓ Dataset load: workbook {workbook_s * 1000:.0f} ms -> cache {cached_s * 1000:.0f} ms")
+
+
+def benchmark_startup():
+    """Cold model initialization: eager workbook load (old) vs lazy dataset (new)"""
+    print("\nBenchmarking startup...")
+    
+    start = time.perf_counter()
+    loader = ModelLoader()
+    loader.load_models()
+    loader.load_encoders()
+    lazy_s = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    pd.read_excel(DATASET_XLSX_PATH)
+    eager_s = lazy_s + (time.perf_counter() - start)
+    
+    print(f"  before (models + read_excel): {eager_s:6.2f} s")
+    print(f"  after  (models, lazy dataset): {lazy_s:6.2f} s")
+
+
+# Heavy modules that only model unpickling and the dataset load may import
+LAZY_MODULES = ('pandas', 'sklearn', 'xgboost', 'scipy', 'joblib')
+
+# Cold-start budgets, seconds in a fresh interpreter
+STARTUP_IMPORT_BUDGET_S = 3.0
+STARTUP_TOTAL_BUDGET_S = 8.0
+
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import ml_service.main
+imported = time.perf_counter()
+eager = sorted(name for name in {lazy} if name in sys.modules)
+from ml_service.model_loader import initialize_models
+from ml_service.diet_planner import diet_planner
+initialize_models()
+loaded = time.perf_counter()
+diet_planner.load()
+done = time.perf_counter()
+print(json.dumps({{"import": imported - start, "models": loaded - imported, "planner": done - loaded, "eager": eager}}))
+"""
+
+
+def cold_startup() -> dict:
+    """Import main.py, then load the models and diet planner, in a fresh interpreter"""
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", STARTUP_PROBE.format(lazy=LAZY_MODULES)],
+        cwd=Path(__file__).resolve().parent.parent, capture_output=True, text=True, timeout=300, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def importtime_report(module: str = "ml_service.main", top: int = 12) -> dict:
+    """python -X importtime summary: self time per top-level package, in seconds"""
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).resolve().parent.parent, capture_output=True, text=True, timeout=300, check=True
+    )
+    packages = {}
+    total = 0.0
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or not parts[0].split(":")[1].strip().isdigit():
+            continue
+        package = parts[2].strip().split(".")[0]
+        packages[package] = packages.get(package, 0.0) + int(parts[0].split(":")[1]) / 1e6
+        if parts[2].startswith(" ") and not parts[2].startswith("  "):
+            total += int(parts[1]) / 1e6
+    
+    print(f"  import {module}: {total:.2f} s")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"    {package:<24} {seconds * 1000:8.1f} ms")
+    return packages
+
+
+def test_startup_budget():
+    """Importing main must not pull in model libraries, and cold start must stay within budget"""
+    print("\nTesting startup budget...")
+    result = cold_startup()
+    total = result["import"] + result["models"] + result["planner"]
+    
+    assert not result["eager"], f"Imported eagerly by main.py: {result['eager']}"
+    assert result["import"] < STARTUP_IMPORT_BUDGET_S, f"import main took {result['import']:.2f}s"
+    assert total < STARTUP_TOTAL_BUDGET_S, f"Cold start took {total:.2f}s"
+    
+    print(f"✓ Cold start {total:.2f}s (import {result['import']:.2f}s, models {result['models']:.2f}s, "
+          f"planner {result['planner']:.2f}s)")
+
+
+def benchmark_import_time():
+    """Where cold-start import time goes"""
+    print("\nBenchmarking import time...")
+    importtime_report("ml_service.main")
+    result = cold_startup()
+    print(f"  cold start: import {result['import']:.2f} s, models {result['models']:.2f} s, planner {result['planner']:.2f} s")
+
+
+def test_prediction_cache():
+    """Cache must evict LRU entries, expire by TTL, invalidate on model change and share via file backend"""
+    print("\nTesting prediction cache...")
+    value = {"model_output": {"pred_label": "1"}, "warnings": ["low GI recommended"]}
+    
+    cache = PredictionCache(max_entries=2, ttl=60)
+    cache.set("a", "v1", value)
+    cache.set("b", "v1", value)
+    assert cache.get("a", "v1") == value  # "a" is now most recently used
+    cache.set("c", "v1", value)
+    assert cache.get("b", "v1") is None and cache.get("a", "v1") == value
+    assert cache.evictions == 1
+    
+    # A different model token drops every entry
+    assert cache.get("a", "v2") is None
+    assert cache.stats()["entries"] == 0 and cache.invalidations == 1
+    
+    # A request that finishes after a reload cannot clear or rebind the new model's cache
+    cache.set("a", "v2", value)
+    cache.set("b", "v1", value)
+    assert cache.get("a", "v2") == value and cache.stats()["entries"] == 1
+    assert cache.model_token == "v2" and cache.stale_writes == 1 and cache.invalidations == 1
+    
+    expiring = PredictionCache(ttl=0)
+    expiring.set("a", "v1", value)
+    assert expiring.get("a", "v1") is None and expiring.expirations == 1
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        worker_1 = PredictionCache(backend=FileCacheBackend(tmp, ttl=60, max_entries=10))
+        worker_2 = PredictionCache(backend=FileCacheBackend(tmp, ttl=60, max_entries=10))
+        worker_1.set("a", "v1", value)
+        assert worker_2.get("a", "v1") == value and worker_2.shared_hits == 1
+        assert worker_2.get("a", "v1") == value and worker_2.hits == 1
+    
+    print(f"✓ Cache counters: {cache.stats()}")
+
+
+def test_single_flight():
+    """Concurrent identical requests must share one computation, across /predict and /dietplan"""
+    print("\nTesting single-flight coalescing...")
+    import httpx
+    from ml_service import main
+    from ml_service.cache import SingleFlight, prediction_cache, prediction_flights
+    ensure_models_loaded()
+    
+    async def flights():
+        flight = SingleFlight()
+        calls = []
+        
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            if value == "boom":
+                raise ValueError(value)
+            return value
+        
+        results = await asyncio.gather(*(flight.run("a", lambda: compute("a")) for _ in range(3)),
+                                       flight.run("b", lambda: compute("b")))
+        assert results == ["a", "a", "a", "b"] and calls == ["a", "b"]
+        assert flight.coalesced == 2 and flight.in_flight == 0
+        
+        # Errors reach every waiter; a cancelled leader does not cancel the followers
+        errors = await asyncio.gather(*(flight.run("x", lambda: compute("boom")) for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in errors)
+        leader = asyncio.ensure_future(flight.run("c", lambda: compute("c")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.run("c", lambda: compute("c")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "c" and calls.count("c") == 1
+        
+        disabled = SingleFlight(enabled=False)
+        await asyncio.gather(*(disabled.run("a", lambda: compute("d")) for _ in range(2)))
+        assert calls.count("d") == 2 and disabled.coalesced == 0
+    
+    asyncio.run(flights())
+    
+    async def dashboard():
+        dispatched = []
+        run_prediction = main.run_prediction
+        
+        async def counting(sanitized):
+            dispatched.append(sanitized)
+            return await run_prediction(sanitized)
+        
+        await main.startup_event()
+        main.run_prediction = counting
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://ml") as client:
+                prediction_cache.clear()
+                coalesced = prediction_flights.coalesced
+                patient = SAMPLE_PATIENTS[1]
+                responses = await asyncio.gather(
+                    *(client.post("/api/model/predict", json=patient) for _ in range(3)),
+                    *(client.post("/api/model/dietplan", json=patient) for _ in range(2))
+                )
+                metrics_text = (await client.get("/metrics")).text
+        finally:
+            main.run_prediction = run_prediction
+            await main.shutdown_event()
+        return responses, dispatched, prediction_flights.coalesced - coalesced, metrics_text
+    
+    responses, dispatched, coalesced, metrics_text = asyncio.run(dashboard())
+    assert all(r.status_code == 200 for r in responses)
+    assert len(dispatched) == 1 and coalesced == 4
+    outputs = [r.json()["model_output"] for r in responses]
+    assert all(output == outputs[0] for output in outputs)
+    assert all(r.json()["diet_plan"] for r in responses[3:])
+    assert 'ml_coalesced_requests_total{call="predict"}' in metrics_text
+    
+    print(f"✓ {len(responses)} concurrent dashboard requests ran 1 prediction ({coalesced} coalesced)")
+
+
+
+def test_hot_reload():
+    """A good version must swap in under load; a broken one must leave the active model serving"""
+    print("\nTesting hot reload...")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        registry = ModelRegistry(Path(tmp))
+        registry.register("v2", AYUR_MODEL_PATH)
+        broken = Path(tmp) / "broken.pkl"
+        broken.write_bytes(b"not a model")
+        registry.register("broken", broken)
+        
+        loader = ModelLoader().initialize()
+        reloader = ModelReloader(loader, registry)
+        assert reloader.active_version == DEFAULT_VERSION
+        
+        # Predictions keep succeeding while the swap happens
+        errors = []
+        stop = threading.Event()
+        
+        def hammer():
+            while not stop.is_set():
+                try:
+                    assert len(loader.predict_batch(SAMPLE_PATIENTS)) == len(SAMPLE_PATIENTS)
+                except Exception as e:
+                    errors.append(e)
+        
+        threads = [threading.Thread(target=hammer) for _ in range(2)]
+        for t in threads:
+            t.start()
+        status = reloader.reload("v2")
+        stop.set()
+        for t in threads:
+            t.join()
+        
+        assert not errors, errors
+        assert status["active_version"] == "v2" and status["previous_version"] == DEFAULT_VERSION
+        assert loader.model_version == "v2"
+        assert registry.read_manifest()["active"] == "v2"
+        
+        token = loader.model_token
+        try:
+            reloader.reload("broken")
+            assert False, "broken model should be rejected"
+        except ModelReloadError:
+            pass
+        assert loader.model_token == token and reloader.last_error
+        assert registry.read_manifest()["active"] == "v2"
+        
+        reloader.rollback()
+        assert reloader.active_version == DEFAULT_VERSION and reloader.previous_version == "v2"
+        
+        # Another worker activating a version is picked up by the manifest check
+        follower = ModelReloader(ModelLoader().initialize(), registry)
+        follower._manifest_mtime = None
+        registry.write_manifest("v2", DEFAULT_VERSION)
+        assert follower.check_manifest() and follower.active_version == "v2"
+    
+    print(f"✓ Reload status: active={reloader.active_version}, previous={reloader.previous_version}")
+
+
+
+def test_metrics_exposition():
+    """Registry must render Prometheus text with cumulative buckets, labels and collectors"""
+    print("\nTesting metrics exposition...")
+    registry = MetricsRegistry()
+    requests = registry.register(Counter("test_requests_total", "Requests", labelnames=("endpoint", "status")))
+    in_flight = registry.register(Gauge("test_in_flight", "In flight"))
+    latency = registry.register(Histogram("test_latency_seconds", "Latency", (0.01, 0.1), labelnames=("stage",)))
+    registry.add_collector(lambda: in_flight.set(3))
+    
+    requests.inc("/predict", "200")
+    requests.inc("/predict", "200")
+    for value in (0.005, 0.05, 5.0):
+        latency.observe(value, "infer")
+    
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{endpoint="/predict",status="200"} 2.0' in text
+    assert "test_in_flight 3.0" in text
+    assert 'test_latency_seconds_bucket{stage="infer",le="0.01"} 1' in text
+    assert 'test_latency_seconds_bucket{stage="infer",le="0.1"} 2' in text
+    assert 'test_latency_seconds_bucket{stage="infer",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{stage="infer"} 3' in text
+    
+    # Inference stages are timed inside the model loader
+    ensure_models_loaded()
+    before = stage_latency.snapshot("infer")["count"]
+    model_loader.predict_batch(SAMPLE_PATIENTS)
+    assert stage_latency.snapshot("infer")["count"] == before + 1
+    
+    clock = StageClock()
+    clock.lap("validate")
+    clock.finish()
+    assert clock.finished
+    
+    print("✓ Metrics rendered in Prometheus text format")
+
+
+
+def test_prakriti_inference():
+    """Assessments must batch through the prakriti model and feed a valid ayur prakriti category"""
+    print("\nTesting prakriti inference...")
+    ensure_models_loaded()
+    
+    assessments = [
+        {key: dosha for key in PRAKRITI_FEATURES}
+        for dosha in ('vata', 'pitta', 'kapha')
+    ]
+    outputs = model_loader.predict_prakriti_batch(assessments)
+    assert [o['prakriti'] for o in outputs] == ['vata', 'pitta', 'kapha']
+    assert outputs == [model_loader.predict_prakriti(a) for a in assessments]
+    
+    # Numeric answer codes encode the same as dosha names
+    assert model_loader.predict_prakriti({key: 1 for key in PRAKRITI_FEATURES})['prakriti'] == 'pitta'
+    
+    categories = set()
+    for name, step, columns in model_loader.ayur_model.steps[0][1].transformers_:
+        if 'prakriti' in list(columns):
+            categories = set(step.categories_[list(columns).index('prakriti')])
+    mixed = {key: ('vata', 'pitta', 'kapha')[i % 3] for i, key in enumerate(PRAKRITI_FEATURES)}
+    assert model_loader.predict_prakriti(mixed)['prakriti'] in categories
+    
+    # An assessment stands in for the required prakriti field
+    patient = {k: v for k, v in SAMPLE_PATIENTS[0].items() if k != 'prakriti'}
+    PatientInput(**patient, prakriti_assessment={key: "Vata" for key in PRAKRITI_FEATURES})
+    try:
+        PatientInput(**patient)
+        assert False, "prakriti or an assessment must be required"
+    except ValueError:
+        pass
+    
+    print(f"✓ Prakriti outputs: {[o['prakriti'] for o in outputs]}")
+
+
+def test_diet_planner():
+    """Plans must respect restrictions, hit the calorie target and build a 4-week plan in under 20 ms"""
+    print("\nTesting diet planner...")
+    if not diet_planner.loaded:
+        diet_planner.load()
+    index = diet_planner.index
+    position = {food_id: row for row, food_id in enumerate(index.food_id)}
+    
+    patient = {**SAMPLE_PATIENTS[2], "gluten_free": True, "exclude_ingredients": ["Tofu"]}
+    plan = diet_planner.generate(patient, days=28, seed="0" * 64)
+    rows = [position[meal["food_id"]] for meal in plan["meals"]]
+    assert len(plan["meals"]) == 28 * 3
+    assert index.is_veg[rows].all()
+    assert not (index.allergen_mask[rows] & index.allergen_bits(["egg", "dairy", "gluten"])).any()
+    assert not any("tofu" in meal["name"].lower() for meal in plan["meals"])
+    # The planner and the safety checker share the ingredient rules, so the checker finds nothing to remove
+    matcher = ingredient_matcher_for(patient)
+    assert not any(matcher.blocks(meal["name"]) or any(map(matcher.blocks, meal["ingredients"])) for meal in plan["meals"])
+    average = plan["plan_summary"]["average_daily_calories"]
+    assert abs(average - patient["daily_calories"]) / patient["daily_calories"] < 0.1, average
+    
+    # Deterministic per seed, varied across days
+    assert diet_planner.generate(patient, days=28, seed="0" * 64) == plan
+    lunches = [meal["food_id"] for meal in plan["meals"] if meal["meal"] == "lunch"]
+    assert len(set(lunches)) == len(lunches)
+    
+    # Clinical limits apply per serving
+    diabetic = diet_planner.generate(SAMPLE_PATIENTS[1], days=7, seed="1" * 64)
+    rows = [position[meal["food_id"]] for meal in diabetic["meals"]]
+    assert (index.columns["sugar_g"][rows] <= 10).all()
+    
+    timings = []
+    for patient in SAMPLE_PATIENTS * 5:
+        start = time.perf_counter()
+        diet_planner.generate(patient, days=28, seed="2" * 64)
+        timings.append(time.perf_counter() - start)
+    median_ms = float(np.median(timings)) * 1000
+    assert median_ms < 20, f"4-week plan took {median_ms:.1f} ms"
+    
+    print(f"✓ 4-week plan in {median_ms:.1f} ms (median), {average:.0f} kcal/day average")
+
+
+def test_ingredient_matcher():
+    """Allergen/exclusion filtering must match whole words and filter meals and shopping list in one pass"""
+    print("\nTesting ingredient matcher...")
+    patient = {"nut_free": True, "dairy_free": True, "gluten_free": True, "exclude_ingredients": ["Rice", " "]}
+    matcher = ingredient_matcher_for(patient)
+    
+    expected = {
+        "nutmeg": set(), "coconut": set(), "butternut squash": set(), "buckwheat": set(),
+        "Peanuts": {"nuts"}, "almond milk": {"nuts"}, "coconut milk": set(),
+        "peanut butter": {"nuts"}, "cheese": {"dairy"}, "whole wheat flour": {"gluten"},
+        "rice flour": {"exclude"}, "licorice": set(), "brown rice": {"exclude"}
+    }
+    for ingredient, rules in expected.items():
+        assert set(matcher.matches(ingredient)) == rules, (ingredient, matcher.matches(ingredient))
+    assert ingredient_matcher_for({"exclude_ingredients": []}) is None
+    assert ingredient_matcher_for(dict(patient)) is matcher
+    
+    plan = {
+        "meals": [{"ingredients": ["rice", "nutmeg", "paneer", "coconut milk"]}, {"name": "no ingredients"}],
+        "shopping_list": [{"item": "rice", "meals": 2}, {"item": "nutmeg", "meals": 1}, "Cashews"],
+        "notes": []
+    }
+    plan = ClinicalSafetyChecker.sanitize_diet_plan(plan, patient)
+    assert plan["meals"][0]["ingredients"] == ["nutmeg", "coconut milk"]
+    assert plan["shopping_list"] == [{"item": "nutmeg", "meals": 1}]
+    
+    # Full 4-week plan
+    if not diet_planner.loaded:
+        diet_planner.load()
+    plan = diet_planner.generate({**SAMPLE_PATIENTS[0], "exclude_ingredients": ["oil", "salt"]}, days=28, seed="3" * 64)
+    start = time.perf_counter()
+    plan = ClinicalSafetyChecker.sanitize_diet_plan(plan, {**patient, "exclude_ingredients": ["oil", "salt"]})
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    assert not any(matcher.blocks(ing) for meal in plan["meals"] for ing in meal["ingredients"])
+    
+    print(f"✓ Sanitized {len(plan['meals'])} meals in {elapsed_us:.0f} us")
+
+
+def test_streaming_endpoint():
+    """NDJSON and CSV uploads must stream one ordered result per row, inline errors and a summary"""
+    print("\nTesting streaming endpoint...")
+    from fastapi.testclient import TestClient
+    from ml_service import main
+    from ml_service.streaming import iter_csv, iter_lines, iter_ndjson
+    
+    async def collect(parse, payload, chunk_bytes=7, max_line_bytes=1024):
+        async def chunks():
+            for i in range(0, len(payload), chunk_bytes):
+                yield payload[i:i + chunk_bytes]
+        return [record async for record in parse(chunks(), max_line_bytes)]
+    
+    # Lines split across body chunks, CRLF endings, quoted newlines and over-long lines
+    records = asyncio.run(collect(iter_ndjson, b'{"age": 1}\r\n\n[1]\n{bad\n' + b'{"x": "' + b'y' * 2000 + b'"}\n{"age": 2}'))
+    assert [n for n, _ in records] == [1, 2, 3, 4, 5]
+    assert records[0][1] == {"age": 1} and records[4][1] == {"age": 2}
+    assert all(isinstance(r, str) for _, r in records[1:4])
+    # One large chunk of many short lines is split in linear time (quadratic took ~20 s here)
+    payload = b'{"age": 1}\r\n' * 200000 + b'{"age": 2}'
+    start = time.perf_counter()
+    lines = asyncio.run(collect(iter_lines, payload, chunk_bytes=len(payload)))
+    assert len(lines) == 200001 and lines[-1] == '{"age": 2}' and time.perf_counter() - start < 2.0
+    records = asyncio.run(collect(iter_csv, '\ufeffage,exclude_ingredients,prakriti_assessment.body_frame,notes\n30,peanut; milk,thin,"two\nlines"\n,,,\n'.encode()))
+    assert records == [(1, {"age": "30", "exclude_ingredients": ["peanut", "milk"],
+                            "prakriti_assessment": {"body_frame": "thin"}, "notes": "two\nlines"}), (2, {})]
+    
+    ensure_models_loaded()
+    chunk_size = main.STREAM_CHUNK_SIZE
+    main.STREAM_CHUNK_SIZE = 3
+    try:
+        with TestClient(main.app) as client:
+            rows = SAMPLE_PATIENTS + [{"age": "old"}] + SAMPLE_PATIENTS
+            body = "\n".join(json.dumps(row) for row in rows[:5]) + "\nnot json\n" + "\n".join(json.dumps(row) for row in rows[5:])
+            response = client.post("/api/model/predict/stream", content=body, headers={"content-type": "application/x-ndjson"})
+            assert response.status_code == 200
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            results, summary = lines[:-1], lines[-1]["summary"]
+            assert [r["index"] for r in results] == list(range(10))
+            assert [i for i, r in enumerate(results) if "errors" in r] == [4, 5]
+            assert summary["total"] == 10 and summary["succeeded"] == 8 and summary["failed"] == 2
+            assert summary["chunks"] == 4
+            
+            # Same rows as the batch endpoint
+            batch = client.post("/api/model/predict/batch", json={"patients": SAMPLE_PATIENTS}).json()["results"]
+            for streamed, expected in zip(results[:4], batch):
+                assert streamed["patient"] == expected["patient"]
+                assert streamed["model_output"]["pred_label"] == expected["model_output"]["pred_label"]
+                assert streamed["warnings"] == expected["warnings"]
+            
+            columns = ["gender", "age", "height_cm", "weight_kg", "daily_calories", "diet_type", "prakriti", "has_diabetes", "diabetic_friendly"]
+            csv_body = ",".join(columns) + "\n" + "\n".join(
+                ",".join(str(row.get(c, "")) for c in columns) for row in SAMPLE_PATIENTS
+            ) + "\nmale,abc,1,1,1,veg,vata,\n"
+            response = client.post("/api/model/predict/stream", content=csv_body, headers={"content-type": "text/csv"})
+            lines = [json.loads(line) for line in response.text.splitlines()]
+            assert [("model_output" in r) for r in lines[:-1]] == [True] * 4 + [False]
+            assert lines[1]["patient"]["has_diabetes"] is True
+            assert lines[-1]["summary"]["succeeded"] == 4
+            
+            assert client.post("/api/model/predict/stream", content="{}", headers={"content-type": "application/json"}).status_code == 415
+    finally:
+        main.STREAM_CHUNK_SIZE = chunk_size
+    
+    print(f"✓ Streamed {summary['total']} NDJSON rows in {summary['chunks']} chunks, CSV rows scored")
+
+
+def test_lean_request_path():
+    """Responses are encoded once, still match their schemas, and payload hashes are unchanged"""
+    print("\nTesting lean request path...")
+    from fastapi.testclient import TestClient
+    from ml_service import main
+    from ml_service.schemas import PredictionResponse, BatchPredictionResponse, PrakritiResponse
+    from ml_service.serialization import dumps, payload_hash
+    
+    assert isinstance(ALLOWED_KEYS, frozenset)
+    # Same hash as the original json.dumps(sort_keys=True) form - cache keys and plan seeds survive upgrades
+    patient = dict(reversed(list(SAMPLE_PATIENTS[1].items())))
+    assert payload_hash(patient) == hashlib.sha256(json.dumps(SAMPLE_PATIENTS[1], sort_keys=True).encode()).hexdigest()
+    assert json.loads(dumps({"a": np.float64(0.25), "b": np.arange(3), "c": [np.int64(2)], "d": "é"})) == {"a": 0.25, "b": [0, 1, 2], "c": [2], "d": "é"}
+    # Non-finite scores encode as null with or without orjson
+    from ml_service import serialization
+    scores = {"pred_score": float("nan"), "proba": np.array([np.inf, 0.5]), "margin": np.float32("-inf"), "n": (1, -np.inf)}
+    encoded = [dumps(scores)]
+    backend = serialization.orjson
+    serialization.orjson = None
+    try:
+        encoded.append(dumps(scores))
+    finally:
+        serialization.orjson = backend
+    assert [json.loads(body) for body in encoded] == [{"pred_score": None, "proba": [None, 0.5], "margin": None, "n": [1, None]}] * 2
+    
+    ensure_models_loaded()
+    with TestClient(main.app) as client:
+        body = client.post("/api/model/predict", json=SAMPLE_PATIENTS[1]).json()
+        assert PredictionResponse.model_validate(body).model_dump() == body
+        assert list(body) == list(PredictionResponse.model_fields)
+        
+        body = client.post("/api/model/predict/batch", json={"patients": SAMPLE_PATIENTS + [{"age": 1}]}).json()
+        assert BatchPredictionResponse.model_validate(body).model_dump() == body
+        assert body["meta"]["failed"] == 1 and "errors" in body["results"][-1]
+        
+        assessment = {key: "vata" for key in PRAKRITI_FEATURES}
+        body = client.post("/api/model/prakriti", json=assessment).json()
+        assert PrakritiResponse.model_validate(body).model_dump() == body
+        
+        response = client.post("/api/model/dietplan", json=SAMPLE_PATIENTS[0])
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["diet_plan"]
+    
+    print("✓ Responses match their schemas; payload hashes unchanged")
+
+
+async def request_rate(client, path, payloads, seconds=1.0):
+    """Requests per second for one in-process client cycling through payloads"""
+    for payload in payloads:
+        await client.post(path, json=payload)
+    count, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        response = await client.post(path, json=payloads[count % len(payloads)])
+        assert response.status_code == 200, response.text
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def benchmark_request_path(iterations=2000):
+    """Per-request overhead (original vs lean) and requests/second through the ASGI app"""
+    print("\nBenchmarking request path...")
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+    from ml_service import main
+    from ml_service.schemas import PredictionResponse
+    from ml_service.serialization import dumps, payload_hash
+    
+    ensure_models_loaded()
+    data = PatientInput.model_validate(SAMPLE_PATIENTS[1]).model_dump(exclude_none=True)
+    model_output = model_loader.predict(data)
+    allowed_list = sorted(ALLOWED_KEYS)
+    meta = {"model_version": model_loader.model_version, "generated_at": "2024-01-01T00:00:00Z"}
+    
+    def original():
+        sanitized = {k: v for k, v in data.items() if k in allowed_list}
+        hashlib.sha256(json.dumps(sanitized, sort_keys=True).encode()).hexdigest()
+        # Built as a model, then re-validated and encoded by FastAPI's response_model handling
+        response = PredictionResponse(meta=meta, patient=sanitized, model_output=model_output, warnings=[], diet_plan=None)
+        content = jsonable_encoder(PredictionResponse.model_validate(response.model_dump()))
+        json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    
+    def lean():
+        sanitized = {k: v for k, v in data.items() if k in ALLOWED_KEYS}
+        payload_hash(sanitized)
+        dumps({"meta": meta, "patient": sanitized, "model_output": model_output,
+               "warnings": [], "prakriti_output": None, "diet_plan": None})
+    
+    for name, fn in (("original", original), ("lean", lean)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        print(f"  {name:8s} sanitize+hash+encode {(time.perf_counter() - start) / iterations * 1e6:8.1f} us/request")
+    
+    async def run():
+        await main.startup_event()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://ml") as client:
+                for path, payloads in (("/api/model/predict", SAMPLE_PATIENTS), ("/api/model/dietplan", SAMPLE_PATIENTS),
+                                       ("/api/model/predict/batch", [{"patients": SAMPLE_PATIENTS * 25}])):
+                    print(f"  {path:26s} {await request_rate(client, path, payloads):8.0f} req/s (in-process, repeated payloads)")
+        finally:
+            await main.shutdown_event()
+    
+    asyncio.run(run())
+
+
+def test_batch_score_cli():
+    """Offline scoring must match predict_batch, write one part per chunk and resume after a kill"""
+    print("\nTesting offline batch scoring...")
+    from ml_service.batch_score import (
+        BatchScoringJob, CheckpointMismatchError, frame_records, parquet_available, result_frame, score_records
+    )
+    ensure_models_loaded()
+    
+    patients = SAMPLE_PATIENTS * 3
+    frame = pd.DataFrame(patients)
+    frame["exclude_ingredients"] = "peanut; milk"
+    frame.loc[len(frame)] = {"gender": "male", "age": "abc"}
+    sanitized = [PatientInput(**p, exclude_ingredients=["peanut", "milk"]).model_dump(exclude_none=True) for p in patients]
+    expected = model_loader.predict_batch([{k: v for k, v in row.items() if k in ALLOWED_KEYS} for row in sanitized])
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "cohort.csv"
+        frame.to_csv(source, index=False)
+        output = Path(tmp) / "scores"
+        
+        def scored():
+            return pd.concat([pd.read_csv(path, dtype={"pred_label": str}) for path in sorted(output.glob("part-*.csv"))], ignore_index=True)
+        
+        summary = BatchScoringJob(source, output, workers=2, chunk_size=5, fmt="csv").run()
+        assert summary["chunks"] == 3 and summary["skipped_chunks"] == 0
+        assert summary["rows"] == 13 and summary["succeeded"] == 12 and summary["failed"] == 1
+        result = scored()
+        assert list(result["row"]) == list(range(13))
+        assert list(result["status"]) == ["ok"] * 12 + ["error"]
+        for (_, row), output_row in zip(result.iloc[:12].iterrows(), expected):
+            assert str(row["pred_label"]) == output_row["pred_label"]
+            assert abs(row["pred_score"] - output_row["pred_score"]) < 1e-6
+        assert json.loads(result["warnings"][1]) == ClinicalSafetyChecker().check_safety(SAMPLE_PATIENTS[1])
+        assert "age" in result["errors"][12]
+        
+        # A job killed after its first parts resumes with only the missing chunk
+        (output / "part-000001.csv").unlink()
+        summary = BatchScoringJob(source, output, workers=1, chunk_size=5, fmt="csv").run()
+        assert summary["skipped_chunks"] == 2 and summary["rows"] == 13
+        pd.testing.assert_frame_equal(scored(), result)
+        
+        try:
+            BatchScoringJob(source, output, workers=1, chunk_size=4, fmt="csv").run()
+            assert False, "a checkpoint from another chunk size must not be resumed"
+        except CheckpointMismatchError:
+            pass
+        
+        # An all-error chunk and an error-free chunk must write parts with one schema
+        mixed = pd.DataFrame([{"gender": "male", "age": "abc"}] * 4 + SAMPLE_PATIENTS)
+        source = Path(tmp) / "mixed.csv"
+        mixed.to_csv(source, index=False)
+        frames = [result_frame(0, score_records(records)) for records in (frame_records(mixed.iloc[:4]), frame_records(mixed.iloc[4:]))]
+        assert list(frames[0].dtypes) == list(frames[1].dtypes)
+        if parquet_available():
+            output = Path(tmp) / "parquet"
+            BatchScoringJob(source, output, workers=1, chunk_size=4, fmt="parquet").run()
+            parts = pd.read_parquet(output).sort_values("row", ignore_index=True)
+            assert list(parts["status"]) == ["error"] * 4 + ["ok"] * 4
+            assert parts["pred_score"].dtype == "float64" and parts["errors"][4:].isna().all()
+    
+    print(f"✓ Scored {summary['rows']} rows in {summary['chunks']} parts and resumed a partial job")
+
+
+def test_benchmark_suite():
+    """Synthetic patients must validate, and a tiny benchmark run must write complete JSON and a profile"""
+    print("\nTesting benchmark suite...")
+    import pstats
+    from ml_service import benchmark
+    ensure_models_loaded()
+    
+    vocabularies = benchmark.model_vocabularies(model_loader)
+    assert set(vocabularies) <= ALLOWED_KEYS and 'therapeutic_goal' in vocabularies
+    ingredients = benchmark.ingredient_frequencies()
+    patients = benchmark.PatientGenerator(vocabularies, ingredients, seed=3).patients(300)
+    assert patients == benchmark.PatientGenerator(vocabularies, ingredients, seed=3).patients(300)
+    for patient in patients:
+        PatientInput.model_validate(patient)
+        for key, values in vocabularies.items():
+            assert key not in patient or patient[key] in values
+    assert any('prakriti_assessment' in p for p in patients)
+    assert any(p.get('exclude_ingredients') for p in patients)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        output, profile = Path(tmp) / "bench.json", Path(tmp) / "bench.prof"
+        benchmark.main([
+            '--targets', 'inprocess', 'predict', '--concurrency', '2', '--rate', '25',
+            '--duration', '0.3', '--warmup', '0', '--patients', '40',
+            '--output', str(output), '--profile', str(profile)
+        ])
+        report = json.loads(output.read_text())
+        assert report["meta"]["model_token"] == model_loader.model_token
+        assert [(s["target"], s["mode"]) for s in report["scenarios"]] == [
+            ("inprocess", "closed"), ("inprocess", "open"), ("predict", "closed"), ("predict", "open")
+        ]
+        for scenario in report["scenarios"]:
+            latency = scenario["latency_ms"]
+            assert scenario["requests"] > 0 and scenario["errors"] == 0, scenario
+            assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+            assert scenario["cpu_ms_per_request"] > 0 and scenario["cpu_scope"] == "service"
+            assert scenario["stages_ms"]["infer"]["count"] > 0
+        assert "validate" in report["scenarios"][2]["stages_ms"]
+        
+        # Inference runs on pool threads - their frames must be in the merged profile
+        functions = {name for _, _, name in pstats.Stats(str(profile)).stats}
+        assert '_encode_and_predict' in functions
+        
+        # Without httpx the HTTP targets stop before any work; the in-process target still runs
+        find_spec = benchmark.importlib.util.find_spec
+        benchmark.importlib.util.find_spec = lambda name, *args: None if name == 'httpx' else find_spec(name, *args)
+        try:
+            try:
+                benchmark.main(['--targets', 'predict', '--output', str(output)])
+                assert False, "HTTP targets must require httpx"
+            except SystemExit as e:
+                assert e.code == 2
+            benchmark.main(['--targets', 'inprocess', '--concurrency', '1', '--duration', '0.1',
+                            '--warmup', '0', '--patients', '10', '--output', str(output)])
+        finally:
+            benchmark.importlib.util.find_spec = find_spec
+        assert [s["target"] for s in json.loads(output.read_text())["scenarios"]] == ["inprocess"]
+    
+    print(f"✓ {len(patients)} synthetic patients validated, {len(report['scenarios'])} scenarios reported")
+
+
+def sanitized_patient(patient):
+    """What the endpoints pass to the model for this input"""
+    return {k: v for k, v in PatientInput.model_validate(patient).model_dump(exclude_none=True).items() if k in ALLOWED_KEYS}
+
+
+def test_whatif_sessions():
+    """Delta re-encoding and sweeps must score exactly like full requests; sessions expire and evict"""
+    print("\nTesting what-if sessions...")
+    import httpx
+    from ml_service import main
+    from ml_service.whatif import WhatIfSessionStore, apply_changes
+    ensure_models_loaded()
+    encoder = model_loader.feature_encoder
+    
+    # Re-encoding only the changed fields gives the row a full encode builds
+    base = sanitized_patient(SAMPLE_PATIENTS[1])
+    deltas = [
+        {"daily_calories": 2400, "sleep_hours": 5.5}, {"season": "summer", "gender": "male"},
+        {"season": None, "stress_level": "7"}, {"prakriti": "unknown-dosha"}, {"has_ckd": True, "age": "61"}
+    ]
+    variants = [apply_changes(base, delta) for delta in deltas]
+    for updated, changed in variants:
+        x = encoder.encode([base])[0]
+        encoder.encode_fields(changed, x)
+        assert np.array_equal(x, encoder.encode([updated])[0], equal_nan=True), changed
+    assert variants[2][1]["season"] is None and variants[4][1]["age"] == 61.0
+    
+    row, token, outputs = model_loader.predict_variants(base, [changed for _, changed in variants])
+    assert outputs == model_loader.predict_batch([updated for updated, _ in variants])
+    assert token == model_loader.model_token and np.array_equal(row, encoder.encode([base])[0], equal_nan=True)
+    # A row from another model is rebuilt; commit returns the variant's row
+    stale = np.zeros_like(row)
+    committed, _, reused = model_loader.predict_variants(base, [variants[0][1]], stale, "other-model", True)
+    assert reused == outputs[:1] and np.array_equal(committed, encoder.encode([variants[0][0]])[0], equal_nan=True)
+    
+    async def clinician():
+        await main.startup_event()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://ml") as client:
+                created = (await client.post("/api/model/whatif", json=SAMPLE_PATIENTS[1])).json()
+                session = f"/api/model/whatif/{created['session_id']}"
+                updated = await client.patch(session, json={"changes": {"sleep_hours": 5, "stress_level": "8"}})
+                sweep = await client.post(f"{session}/sweep", json={
+                    "field": "daily_calories", "start": 1400, "stop": 2600, "step": 100, "changes": {"season": "summer"}
+                })
+                invalid = await client.post(f"{session}/sweep", json={"field": "vegan", "values": [False, True]})
+                too_many = await client.post(f"{session}/sweep", json={"field": "age", "start": 0, "stop": 1e9, "step": 1})
+                deleted = await client.delete(session)
+                gone = await client.patch(session, json={"changes": {"age": 40}})
+                metrics_text = (await client.get("/metrics")).text
+        finally:
+            await main.shutdown_event()
+        return created, updated, sweep, invalid, too_many, deleted, gone, metrics_text
+    
+    created, updated, sweep, invalid, too_many, deleted, gone, metrics_text = asyncio.run(clinician())
+    assert created["model_output"] == model_loader.predict(base) and created["patient"] == base
+    assert updated.status_code == 200 and updated.json()["changed"] == ["sleep_hours", "stress_level"]
+    patient = {**base, "sleep_hours": 5.0, "stress_level": "8"}
+    assert updated.json()["patient"] == patient and updated.json()["model_output"] == model_loader.predict(patient)
+    
+    # The sweep starts from the updated patient and leaves it unchanged
+    points = sweep.json()["points"]
+    assert [p["value"] for p in points] == [1400.0 + 100 * i for i in range(13)]
+    expected = model_loader.predict_batch([{**patient, "season": "summer", "daily_calories": p["value"]} for p in points])
+    for point, output in zip(points, expected):
+        assert point["pred_label"] == output["pred_label"] and point["pred_proba"] == output["pred_proba"]
+    assert invalid.status_code == 400 and invalid.json()["error"]["message"][0]["value"] is True
+    assert too_many.status_code == 422
+    assert deleted.status_code == 200 and gone.status_code == 404
+    # Parametrized routes are labelled with their path template
+    assert 'ml_requests_total{endpoint="/api/model/whatif/{session_id}/sweep",status="200"}' in metrics_text
+    assert 'ml_request_errors_total{endpoint="/api/model/whatif/{session_id}",type="not_found"}' in metrics_text
+    
+    store = WhatIfSessionStore(max_sessions=2, ttl=60)
+    first = store.create(base)
+    store.create(base)
+    store.get(first.session_id)  # most recently used
+    store.create(base)
+    assert store.get(first.session_id) is first and store.evictions == 1 and store.stats()["sessions"] == 2
+    expiring = WhatIfSessionStore(ttl=0)
+    assert expiring.get(expiring.create(base).session_id) is None and expiring.expirations == 1
+    
+    # Two workers sharing a file backend each serve the other's sessions
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = FileCacheBackend(Path(tmp), ttl=60, max_entries=10)
+        worker_a, worker_b = WhatIfSessionStore(ttl=60, backend=shared), WhatIfSessionStore(ttl=60, backend=shared)
+        session = worker_a.create(base, {"prakriti": "vata"})
+        session.row, session.model_token = encoder.encode([base])[0], model_loader.model_token
+        worker_a.save(session)
+        loaded = worker_b.get(session.session_id)
+        assert loaded.patient == base and loaded.prakriti_output == {"prakriti": "vata"}
+        assert loaded.row.dtype == session.row.dtype and np.array_equal(loaded.row, session.row, equal_nan=True)
+        assert worker_b.get(session.session_id) is loaded and worker_b.shared_loads == 1
+        
+        loaded.patient = patient
+        worker_b.save(loaded)
+        assert worker_a.get(session.session_id).patient == patient
+        assert worker_b.delete(session.session_id)
+        assert worker_a.get(session.session_id) is None and not worker_a.delete(session.session_id)
+    
+    print(f"✓ {len(deltas)} deltas and a {len(points)}-point sweep match full predictions")
+
+
+def benchmark_whatif(points=25, rounds=20):
+    """A slider tweak and a sweep through a what-if session vs resending full /predict requests"""
+    print("\nBenchmarking what-if sessions...")
+    import httpx
+    from ml_service import main
+    ensure_models_loaded()
+    patient = SAMPLE_PATIENTS[1]
+    calories = [1400 + 50 * i for i in range(points)]
+    
+    async def run():
+        await main.startup_event()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://ml") as client:
+                session = f"/api/model/whatif/{(await client.post('/api/model/whatif', json=patient)).json()['session_id']}"
+                timings = {}
+                
+                start = time.perf_counter()
+                for i in range(rounds):
+                    # Distinct values so the prediction cache cannot answer
+                    response = await client.post("/api/model/predict", json={**patient, "sleep_hours": 4 + i * 0.01})
+                    assert response.status_code == 200
+                timings["tweak, full /predict"] = (time.perf_counter() - start) / rounds
+                start = time.perf_counter()
+                for i in range(rounds):
+                    response = await client.patch(session, json={"changes": {"sleep_hours": 4 + i * 0.01}})
+                    assert response.status_code == 200
+                timings["tweak, session PATCH"] = (time.perf_counter() - start) / rounds
+                
+                start = time.perf_counter()
+                for i in range(rounds):
+                    await asyncio.gather(*(client.post("/api/model/predict", json={**patient, "daily_calories": c + i * 0.01})
+                                           for c in calories))
+                timings[f"{points}-point sweep, parallel /predict"] = (time.perf_counter() - start) / rounds
+                start = time.perf_counter()
+                for i in range(rounds):
+                    response = await client.post(f"{session}/sweep", json={"field": "daily_calories", "values": [c + i * 0.01 for c in calories]})
+                    assert response.status_code == 200
+                timings[f"{points}-point sweep, session"] = (time.perf_counter() - start) / rounds
+                return timings
+        finally:
+            await main.shutdown_event()
+    
+    for name, seconds in asyncio.run(run()).items():
+        print(f"  {name:34s} {seconds * 1000:8.2f} ms")
+
+
+def test_explain():
+    """Contributions must add up to the model's margin, map to input fields, and be batched and cached"""
+    print("\nTesting explanations...")
+    import httpx
+    from ml_service import main
+    from ml_service.cache import prediction_cache, explain_flights
+    ensure_models_loaded()
+    
+    # The sample patients are all predicted class 1; this synthetic one is class 0
+    negative = {
+        "gender": "female", "age": 31, "height_cm": 159.3, "weight_kg": 88.7, "bmi": 34.9,
+        "patient_continent": "Asia", "patient_country": "Japan", "meal_frequency_per_day": "4",
+        "water_intake_liters": 1.1, "diet_type": "vegan", "snacking_habit": "moderate",
+        "outside_food_freq_per_week": "1", "sugar_intake_level": "low", "prakriti": "pitta",
+        "vata_state": "high", "pitta_state": "normal", "kapha_state": "normal", "bowel_pattern": "regular",
+        "bowel_movements_per_day": 2, "sleep_hours": 6.2, "stress_level": "6", "physical_activity_minutes": 26,
+        "activity_level": "sedentary", "season": "summer", "therapeutic_goal": "glycemic_control",
+        "daily_calories": 2100, "has_diabetes": True, "has_hypertension": True, "has_obesity": True,
+        "has_thyroid": True, "fasting_blood_sugar_mg_dl": 117, "systolic_bp": 125, "diastolic_bp": 83,
+        "waist_circumference_cm": 93.1, "vegetarian": True, "vegan": True, "diabetic_friendly": True, "dairy_free": True
+    }
+    rows = [sanitized_patient(p) for p in SAMPLE_PATIENTS + [negative]]
+    explanations = model_loader.explain_batch(rows)
+    outputs = model_loader.predict_batch(rows)
+    assert [e["class"] for e in explanations] == [o["pred_label"] for o in outputs] and outputs[-1]["pred_label"] == "0"
+    for row, explanation, output in zip(rows, explanations, outputs):
+        contributions = [c["contribution"] for c in explanation["contributions"]]
+        total = explanation["base_value"] + explanation["other_contribution"] + sum(contributions)
+        assert abs(total - explanation["margin"]) < 1e-4
+        assert abs(explanation["probability"] - output["pred_proba"][explanation["class"]]) < 1e-5
+        assert {c["field"] for c in explanation["contributions"]} <= ALLOWED_KEYS
+        assert all(c["value"] == row.get(c["field"]) for c in explanation["contributions"])
+        assert [abs(c) for c in contributions] == sorted((abs(c) for c in contributions), reverse=True)
+    assert model_loader.explain(rows[0]) == explanations[0]
+    
+    async def clinic():
+        batches = []
+        explain_batch = model_loader.explain_batch
+        
+        def counting(batch):
+            batches.append(len(batch))
+            return explain_batch(batch)
+        
+        await main.startup_event()
+        model_loader.explain_batch = counting
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://ml") as client:
+                prediction_cache.clear()
+                coalesced = explain_flights.coalesced
+                responses = await asyncio.gather(
+                    *(client.post("/api/model/explain", json=SAMPLE_PATIENTS[0]) for _ in range(3)),
+                    client.post("/api/model/explain", json=SAMPLE_PATIENTS[1])
+                )
+                first = list(batches)
+                # Served from the cache; /predict never computes contributions
+                repeat = await client.post("/api/model/explain", json=SAMPLE_PATIENTS[1])
+                await client.post("/api/model/predict", json={**SAMPLE_PATIENTS[1], "sleep_hours": 5})
+        finally:
+            del model_loader.explain_batch
+            await main.shutdown_event()
+        return responses, repeat, first, batches, explain_flights.coalesced - coalesced
+    
+    responses, repeat, first, batches, coalesced = asyncio.run(clinic())
+    assert all(r.status_code == 200 for r in responses) and repeat.status_code == 200
+    assert coalesced == 2 and sum(first) == 2 and batches == first
+    if main.MICRO_BATCH_ENABLED:
+        assert first == [2]
+    body = repeat.json()
+    assert body["explanation"] == explanations[1]
+    assert body["model_output"]["pred_proba"] == model_loader.predict(rows[1])["pred_proba"]
+    print(f"✓ Contributions sum to the margin for {len(rows)} patients; {len(first)} batch(es) for 4 concurrent requests")
+
+
+def legacy_check_safety(data):
+    """Reference copy of the original if-chain check_safety()"""
+    warnings = []
+    if data.get('has_diabetes') or (data.get('fasting_blood_sugar_mg_dl') and data.get('fasting_blood_sugar_mg_dl') >= 126):
+        if not data.get('diabetic_friendly'):
+            warnings.append("Patient has diabetes or elevated blood sugar - low GI foods recommended")
+        warnings.append("low GI recommended")
+    if data.get('has_celiac') or data.get('gluten_free'):
+        warnings.append("Gluten-free diet required - verify no gluten in suggested meals")
+    if data.get('has_ckd'):
+        warnings.append("Chronic kidney disease detected - restrict potassium/phosphorus foods and verify renal diet with clinician")
+    if data.get('has_acidity_reflux'):
+        warnings.append("Acidity/reflux condition - avoid spicy/acidic meals, include reflux-safe alternatives")
+    if data.get('has_hypertension'):
+        if not data.get('low_sodium'):
+            warnings.append("Hypertension detected - low sodium diet recommended")
+    if data.get('has_obesity'):
+        warnings.append("Obesity condition - calorie-controlled diet recommended")
+    if data.get('has_thyroid'):
+        warnings.append("Thyroid condition - verify iodine intake with clinician")
+    if data.get('has_pcod_pcos'):
+        warnings.append("PCOS/PCOD condition - consider low glycemic index and anti-inflammatory foods")
+    if data.get('has_nafld'):
+        warnings.append("NAFLD condition - avoid high fructose and processed foods")
+    if data.get('has_ibs_ibd'):
+        warnings.append("IBS/IBD condition - consider low FODMAP options and verify with gastroenterologist")
+    if data.get('has_dyslipidemia'):
+        warnings.append("Dyslipidemia condition - heart-healthy diet with controlled saturated fats recommended")
+    return warnings
+
+
+RULE_FLAGS = [
+    'has_diabetes', 'has_hypertension', 'has_obesity', 'has_dyslipidemia', 'has_acidity_reflux', 'has_ckd',
+    'has_celiac', 'has_ibs_ibd', 'has_nafld', 'has_thyroid', 'has_pcod_pcos', 'diabetic_friendly',
+    'low_sodium', 'gluten_free', 'vegan', 'ketogenic'
+]
+RULE_THRESHOLDS = {
+    'fasting_blood_sugar_mg_dl': (70, 250), 'systolic_bp': (90, 190), 'diastolic_bp': (60, 120),
+    'age': (18, 90), 'bmi': (16, 45), 'waist_circumference_cm': (60, 130)
+}
+
+
+def random_patients(rng, n):
+    """Patients with random condition flags, lab values (some missing) and goals"""
+    patients = []
+    for _ in range(n):
+        patient = {flag: bool(rng.random() < 0.2) for flag in RULE_FLAGS}
+        for field, (low, high) in RULE_THRESHOLDS.items():
+            if rng.random() < 0.8:
+                patient[field] = float(rng.uniform(low, high))
+        patient['therapeutic_goal'] = str(rng.choice(['weight_loss', 'renal_safe', 'bp_control', 'general_health']))
+        patients.append(patient)
+    return patients
+
+
+def random_rules(rng, n):
+    """Synthetic rule set mixing flag, threshold and categorical conditions"""
+    def condition():
+        kind = rng.random()
+        if kind < 0.5:
+            return {"flag": str(rng.choice(RULE_FLAGS))}
+        if kind < 0.9:
+            field = str(rng.choice(list(RULE_THRESHOLDS)))
+            low, high = RULE_THRESHOLDS[field]
+            return {"field": field, "op": str(rng.choice(list(COMPARISONS))), "value": round(float(rng.uniform(low, high)))}
+        return {"field": "therapeutic_goal", "in": ["Weight_Loss", "renal_safe"]}
+    
+    rules = []
+    for i in range(n):
+        when = {part: [condition() for _ in range(rng.integers(0, 3))] for part in ('all', 'any', 'none')}
+        when["all"].append(condition())
+        rules.append({"id": f"rule_{i}", "when": when, "warning": f"warning {i}"})
+    return rules
+
+
+def reference_rule(rule, patient):
+    """Straightforward interpretation of one declarative rule"""
+    def holds(c):
+        if 'flag' in c:
+            return bool(patient.get(c['flag']))
+        value = patient.get(c['field'])
+        if 'in' in c:
+            return str(value).lower() in {v.lower() for v in c['in']}
+        return value is not None and bool(COMPARISONS[c['op']](value, c['value']))
+    when = rule['when']
+    return (all(holds(c) for c in when.get('all', []))
+            and (not when.get('any') or any(holds(c) for c in when['any']))
+            and not any(holds(c) for c in when.get('none', [])))
+
+
+def test_clinical_rule_engine():
+    """Compiled rules must reproduce the original checks and a reference interpreter on 500+ rules"""
+    print("\nTesting clinical rule engine...")
+    rng = np.random.default_rng(7)
+    checker = ClinicalSafetyChecker()
+    
+    patients = SAMPLE_PATIENTS + random_patients(rng, 300) + [{}, {"fasting_blood_sugar_mg_dl": 126}]
+    batch = checker.check_safety_batch(patients)
+    for patient, warnings in zip(patients, batch):
+        assert warnings == legacy_check_safety(patient), patient
+        assert checker.check_safety(patient) == warnings
+    
+    stats = checker.rule_engine.stats()
+    assert stats["patients_evaluated"] == 2 * len(patients)
+    assert stats["hits"]["diabetes_low_gi"] == 2 * sum('low GI recommended' in w for w in batch)
+    
+    rules = random_rules(rng, 600)
+    engine = ClinicalRuleEngine(rules)
+    fired = engine.evaluate(patients)
+    expected = np.array([[reference_rule(rule, p) for rule in rules] for p in patients])
+    assert np.array_equal(fired, expected)
+    for patient, row in zip(patients[:50], expected):
+        assert engine._fired_one(patient) == list(np.flatnonzero(row))
+    assert fired.any() and not fired.all()
+    
+    for bad in (
+        [{"id": "x", "when": {"all": [{"flag": "has_scurvy"}]}, "warning": "w"}],
+        [{"id": "x", "when": {"all": [{"field": "age", "op": "~", "value": 1}]}, "warning": "w"}],
+        [{"id": "x", "when": {"all": [{"flag": "has_ckd"}]}}],
+    ):
+        try:
+            ClinicalRuleEngine(bad)
+            assert False, f"{bad} should not compile"
+        except RuleCompileError:
+            pass
+    
+    print(f"✓ {len(patients)} patients match the original checks; 600 synthetic rules match the reference")
+
+
+def benchmark_clinical_rules(n_rules=600, n_patients=1000):
+    """Rule evaluation cost: compiled engine vs interpreting the rules per patient"""
+    print("\nBenchmarking clinical rules...")
+    rng = np.random.default_rng(11)
+    rules = random_rules(rng, n_rules)
+    patients = random_patients(rng, n_patients)
+    
+    start = time.perf_counter()
+    engine = ClinicalRuleEngine(rules)
+    compile_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    engine.warnings(patients)
+    batch_us = (time.perf_counter() - start) / n_patients * 1e6
+    
+    start = time.perf_counter()
+    for patient in patients[:100]:
+        engine.warnings([patient])
+    single_us = (time.perf_counter() - start) / 100 * 1e6
+    
+    start = time.perf_counter()
+    for patient in patients[:100]:
+        [rule['warning'] for rule in rules if reference_rule(rule, patient)]
+    interpreted_us = (time.perf_counter() - start) / 100 * 1e6
+    
+    print(f"  {n_rules} rules, {engine.n_conditions} conditions, compiled in {compile_ms:.1f} ms")
+    print(f"  interpreted:        {interpreted_us:9.1f} us/patient")
+    print(f"  compiled, single:   {single_us:9.1f} us/patient")
+    print(f"  compiled, batch:    {batch_us:9.1f} us/patient")
+
+
 if __name__ == "__main__":
     print("=" * 50)
     print("Ayutra - Model Testing")
@@ -67,6 +1625,39 @@ if __name__ == "__main__":
     
     if test_model_loading():
         test_prediction()
+        test_batch_prediction()
+        test_single_pass_regression()
+        test_feature_encoder_parity()
+        benchmark_feature_encoder()
+        test_feature_schema()
+        benchmark_feature_schema()
+        test_tree_engine_parity()
+        benchmark_tree_engine()
+        test_model_bundle()
+        benchmark_model_load()
+        test_dataset_cache()
+        benchmark_startup()
+        test_startup_budget()
+        benchmark_import_time()
+        test_inference_executor()
+        test_prediction_cache()
+        test_single_flight()
+        test_micro_batcher()
+        test_hot_reload()
+        test_metrics_exposition()
+        test_prakriti_inference()
+        test_diet_planner()
+        test_ingredient_matcher()
+        test_clinical_rule_engine()
+        benchmark_clinical_rules()
+        test_streaming_endpoint()
+        test_lean_request_path()
+        benchmark_request_path()
+        test_batch_score_cli()
+        test_benchmark_suite()
+        test_whatif_sessions()
+        benchmark_whatif()
+        test_explain()
     
     print("\n" + "=" * 50)
     print("Testing complete")
@@ -0,0 +1,560 @@
+"""
+Direct tree-ensemble inference engines for the XGBoost model
+
+The sklearn wrapper validates inputs and builds a DMatrix on every call. For
+one or a few rows that overhead dominates, so the fitted booster is exported
+to XGBoost's native UBJ format and evaluated either
+
+- "flat":    as flattened NumPy node arrays walked level by level for all trees at once
+- "booster": with Booster.inplace_predict on the exported native model
+
+The sklearn wrapper stays available as the reference ("sklearn") and, in
+parity mode, every call is also scored with it and compared.
+
+Export ahead of deployment with:
+    python tree_engine.py
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+try:
+    from .config import TREE_ENGINE_DIR
+    from .registry import DEFAULT_VERSION
+except ImportError:
+    from config import TREE_ENGINE_DIR
+    from registry import DEFAULT_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Largest absolute probability difference accepted between an engine and sklearn
+PARITY_TOLERANCE = 1e-5
+
+# Above this many rows the native booster's threaded traversal beats the NumPy walk
+FLAT_ENGINE_MAX_ROWS = 16
+
+
+def _sigmoid(margin: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-margin))
+
+
+def _softmax(margin: np.ndarray) -> np.ndarray:
+    shifted = np.exp(margin - margin.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+def _base_score(learner_param: Dict[str, Any]) -> float:
+    # Stored as "5E-1" in older models and "[5E-1]" in newer ones
+    return float(str(learner_param.get('base_score', '0.5')).strip('[]').split(',')[0])
+
+
+def export_booster(
+    estimator: Any,
+    fingerprint: str,
+    directory: Path = TREE_ENGINE_DIR,
+    version: str = DEFAULT_VERSION
+) -> Path:
+    """Save the estimator's booster as native UBJ, keyed by registry version and model fingerprint"""
+    prefix = f"ayur_booster.{version}"
+    target = Path(directory) / f"{prefix}.{fingerprint}.ubj"
+    if target.exists():
+        return target
+    
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename so concurrent workers never read a partial file
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp.ubj")
+    estimator.get_booster().save_model(str(tmp))
+    tmp.replace(target)
+    logger.info(f"Exported native booster to {target}")
+    
+    # Only this version's older exports - rollback needs the other versions' boosters
+    for stale in target.parent.glob(f"{prefix}.*.ubj"):
+        if stale != target and stale.name.rsplit('.', 2)[0] == prefix:
+            stale.unlink(missing_ok=True)
+    
+    return target
+
+
+class BoosterEngine:
+    """Score with Booster.inplace_predict on a native booster, bypassing the sklearn wrapper"""
+    
+    name = 'booster'
+    
+    def __init__(self, booster: Any, objective: str, iteration_range=(0, 0)):
+        self.booster = booster
+        self.objective = objective
+        self.iteration_range = iteration_range
+    
+    @classmethod
+    def load(cls, path: Path, iteration_range=(0, 0)) -> 'BoosterEngine':
+        import xgboost
+        booster = xgboost.Booster()
+        booster.load_model(str(path))
+        objective = json.loads(booster.save_config())['learner']['objective']['name']
+        return cls(booster, objective, iteration_range)
+    
+    @classmethod
+    def from_raw(cls, raw: bytes, iteration_range=(0, 0)) -> 'BoosterEngine':
+        """Load from an in-memory native model (Booster.save_raw('ubj'))"""
+        import xgboost
+        booster = xgboost.Booster()
+        booster.load_model(bytearray(raw))
+        objective = json.loads(booster.save_config())['learner']['objective']['name']
+        return cls(booster, objective, iteration_range)
+    
+    def set_threads(self, threads: int) -> None:
+        self.booster.set_param({'nthread': threads})
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        out = self.booster.inplace_predict(X, iteration_range=self.iteration_range, validate_features=False)
+        out = np.asarray(out, dtype=np.float64)
+        if out.ndim == 1:
+            return np.column_stack((1.0 - out, out))
+        return out
+    
+    def contributions(self, X: np.ndarray) -> np.ndarray:
+        """
+        TreeSHAP contributions of each column to the raw margin
+        
+        Shape (rows, columns + 1), or (rows, classes, columns + 1) for
+        multiclass; the last entry is the bias (expected margin), so each row
+        sums to the margin.
+        """
+        import xgboost
+        matrix = xgboost.DMatrix(X, missing=np.nan)
+        return np.asarray(
+            self.booster.predict(matrix, pred_contribs=True, iteration_range=self.iteration_range, validate_features=False),
+            dtype=np.float64
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"engine": self.name, "objective": self.objective}
+
+
+class DeferredEngine:
+    """
+    Engine built on first use
+    
+    Model bundles keep the native booster only as the large-batch fallback,
+    so xgboost is not imported until a batch actually needs it.
+    """
+    
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._engine = None
+        self._threads = None
+        self._lock = threading.Lock()
+    
+    @property
+    def engine(self) -> Any:
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = self._factory()
+                    if self._threads is not None:
+                        engine.set_threads(self._threads)
+                    self._engine = engine
+        return self._engine
+    
+    def set_threads(self, threads: int) -> None:
+        self._threads = threads
+        if self._engine is not None:
+            self._engine.set_threads(threads)
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.engine.predict_proba(X)
+    
+    def stats(self) -> Dict[str, Any]:
+        return self._engine.stats() if self._engine is not None else {"engine": self.name, "loaded": False}
+
+
+class FlatTreeEngine:
+    """
+    Tree ensemble flattened into NumPy arrays
+    
+    All trees' nodes share one index space. Leaves point to themselves, so
+    max_depth rounds of "gather feature, compare, pick child" move every
+    (row, tree) cursor to its leaf without per-tree Python loops. Batches
+    larger than max_rows go to the fallback engine when one is set.
+    """
+    
+    name = 'flat'
+    
+    # Node arrays saved in model bundles (see model_bundle.py)
+    ARRAYS = ('tree_group', 'roots', 'feature', 'threshold', 'default_left', 'children', 'value')
+    
+    def __init__(self, objective: str, base_margin: float, n_groups: int, tree_group: np.ndarray,
+                 roots: np.ndarray, feature: np.ndarray, threshold: np.ndarray, default_left: np.ndarray,
+                 children: np.ndarray, value: np.ndarray, max_depth: int):
+        self.objective = objective
+        self.base_margin = base_margin
+        self.n_groups = n_groups
+        self.tree_group = tree_group
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        # children[2 * node + go_right]; leaves point to themselves
+        self.children = children
+        self.value = value
+        self.max_depth = max_depth
+        self.fallback = None
+        self.max_rows = FLAT_ENGINE_MAX_ROWS
+    
+    @classmethod
+    def from_booster(cls, booster: Any, iteration_range=(0, 0)) -> Optional['FlatTreeEngine']:
+        """Flatten a booster; None when the model uses features this engine does not support"""
+        model = json.loads(booster.save_raw('json'))
+        learner = model['learner']
+        objective = learner['objective']['name']
+        if objective not in ('binary:logistic', 'multi:softprob', 'multi:softmax'):
+            logger.info(f"Flat tree engine does not support objective {objective}")
+            return None
+        
+        booster_model = learner['gradient_booster']
+        if booster_model.get('name') != 'gbtree':
+            logger.info(f"Flat tree engine does not support booster {booster_model.get('name')}")
+            return None
+        
+        n_groups = max(1, int(learner['learner_model_param'].get('num_class', '0')))
+        trees = booster_model['model']['trees']
+        tree_info = booster_model['model']['tree_info']
+        if iteration_range[1]:
+            indptr = booster_model['model'].get('iteration_indptr')
+            per_iteration = n_groups * int(booster_model['model']['gbtree_model_param'].get('num_parallel_tree', '1'))
+            n_trees = indptr[iteration_range[1]] if indptr else iteration_range[1] * per_iteration
+            trees, tree_info = trees[:n_trees], tree_info[:n_trees]
+        if any(any(tree.get('split_type', [])) for tree in trees):
+            logger.info("Flat tree engine does not support categorical splits")
+            return None
+        
+        base_score = _base_score(learner['learner_model_param'])
+        base_margin = float(np.log(base_score / (1.0 - base_score))) if objective == 'binary:logistic' else base_score
+        
+        sizes = [len(tree['left_children']) for tree in trees]
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+        total = int(sum(sizes))
+        
+        feature = np.zeros(total, dtype=np.int64)
+        threshold = np.zeros(total, dtype=np.float32)
+        default_left = np.zeros(total, dtype=bool)
+        left = np.arange(total, dtype=np.int64)
+        right = np.arange(total, dtype=np.int64)
+        value = np.zeros(total, dtype=np.float64)
+        max_depth = 0
+        
+        for offset, tree in zip(offsets, trees):
+            lc = np.asarray(tree['left_children'], dtype=np.int64)
+            rc = np.asarray(tree['right_children'], dtype=np.int64)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            nodes = slice(offset, offset + len(lc))
+            internal = lc >= 0
+            
+            feature[nodes] = np.where(internal, tree['split_indices'], 0)
+            threshold[nodes] = conditions
+            default_left[nodes] = np.asarray(tree['default_left'], dtype=bool)
+            left[nodes] = np.where(internal, lc + offset, left[nodes])
+            right[nodes] = np.where(internal, rc + offset, right[nodes])
+            # Leaf values are stored in split_conditions
+            value[nodes] = np.where(internal, 0.0, conditions)
+            
+            depth = np.zeros(len(lc), dtype=np.int64)
+            for node in range(len(lc)):
+                if lc[node] >= 0:
+                    depth[lc[node]] = depth[rc[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+        
+        return cls(
+            objective, base_margin, n_groups, np.asarray(tree_info, dtype=np.int64),
+            offsets, feature, threshold, default_left, np.stack((left, right), axis=1).ravel(), value, max_depth
+        )
+    
+    def state(self):
+        """(JSON-safe parameters, node arrays) for saving the engine"""
+        params = {
+            "objective": self.objective,
+            "base_margin": self.base_margin,
+            "n_groups": self.n_groups,
+            "max_depth": self.max_depth
+        }
+        return params, {name: getattr(self, name) for name in self.ARRAYS}
+    
+    @classmethod
+    def from_state(cls, params: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'FlatTreeEngine':
+        """Rebuild from state(); arrays are used as given (e.g. read-only memory maps)"""
+        return cls(
+            params["objective"], params["base_margin"], params["n_groups"],
+            *(arrays[name] for name in cls.ARRAYS), params["max_depth"]
+        )
+    
+    def margin(self, X: np.ndarray) -> np.ndarray:
+        """Raw margin per row and output group"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        values = X.ravel()
+        row_offset = (np.arange(n_rows) * n_features)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        has_missing = bool(np.isnan(values).any())
+        
+        for _ in range(self.max_depth):
+            x = values.take(row_offset + self.feature.take(node))
+            # NaN compares False, so missing values go right unless the node defaults left
+            go_right = x >= self.threshold.take(node)
+            if has_missing:
+                go_right |= np.isnan(x) & ~self.default_left.take(node)
+            node = self.children.take(2 * node + go_right)
+        
+        leaves = self.value.take(node)
+        if self.n_groups == 1:
+            return leaves.sum(axis=1, keepdims=True) + self.base_margin
+        
+        margin = np.full((n_rows, self.n_groups), self.base_margin)
+        for group in range(self.n_groups):
+            margin[:, group] += leaves[:, self.tree_group == group].sum(axis=1)
+        return margin
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        if self.fallback is not None and len(X) > self.max_rows:
+            return self.fallback.predict_proba(X)
+        
+        margin = self.margin(X)
+        if self.n_groups == 1:
+            positive = _sigmoid(margin[:, 0])
+            return np.column_stack((1.0 - positive, positive))
+        return _softmax(margin)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": self.name,
+            "objective": self.objective,
+            "trees": len(self.roots),
+            "nodes": len(self.feature),
+            "max_depth": self.max_depth,
+            "max_rows": self.max_rows,
+            "fallback": self.fallback.name if self.fallback is not None else None
+        }
+
+
+class FlatForestClassifier:
+    """
+    sklearn RandomForestClassifier flattened into NumPy arrays
+    
+    Walked like FlatTreeEngine, with sklearn's split rule (x <= threshold
+    goes left). Leaf class counts are stored normalized, so the probability
+    is the mean of the trees' leaf rows - as RandomForestClassifier computes it.
+    """
+    
+    ARRAYS = ('roots', 'feature', 'threshold', 'children', 'value')
+    
+    def __init__(self, classes: Any, feature_names: Any, roots: np.ndarray, feature: np.ndarray,
+                 threshold: np.ndarray, children: np.ndarray, value: np.ndarray, max_depth: int):
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(self.feature_names_in_)
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.max_depth = max_depth
+    
+    @classmethod
+    def from_sklearn(cls, forest: Any) -> Optional['FlatForestClassifier']:
+        """Flatten a fitted single-output forest; None for anything else"""
+        trees = [getattr(estimator, 'tree_', None) for estimator in getattr(forest, 'estimators_', [])]
+        names = getattr(forest, 'feature_names_in_', None)
+        if not trees or any(tree is None or tree.n_outputs != 1 for tree in trees) or names is None:
+            return None
+        
+        sizes = [tree.node_count for tree in trees]
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+        feature, threshold, children, value = [], [], [], []
+        for offset, tree in zip(offsets, trees):
+            nodes = np.arange(tree.node_count, dtype=np.int64) + offset
+            internal = tree.children_left >= 0
+            feature.append(np.where(internal, tree.feature, 0))
+            threshold.append(tree.threshold)
+            children.append(np.stack((
+                np.where(internal, tree.children_left + offset, nodes),
+                np.where(internal, tree.children_right + offset, nodes)
+            ), axis=1).ravel())
+            counts = tree.value[:, 0, :]
+            value.append(counts / np.maximum(counts.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny))
+        
+        return cls(
+            forest.classes_, names, offsets, np.concatenate(feature).astype(np.int64),
+            np.concatenate(threshold).astype(np.float64), np.concatenate(children),
+            np.concatenate(value), max(int(tree.max_depth) for tree in trees)
+        )
+    
+    def state(self):
+        """(JSON-safe parameters, node arrays) for saving the forest"""
+        params = {
+            "classes": [c.item() if hasattr(c, 'item') else c for c in self.classes_],
+            "feature_names": [str(name) for name in self.feature_names_in_],
+            "max_depth": self.max_depth
+        }
+        return params, {name: getattr(self, name) for name in self.ARRAYS}
+    
+    @classmethod
+    def from_state(cls, params: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> 'FlatForestClassifier':
+        return cls(
+            params["classes"], params["feature_names"],
+            *(arrays[name] for name in cls.ARRAYS), params["max_depth"]
+        )
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        values = X.ravel()
+        row_offset = (np.arange(n_rows) * n_features)[:, None]
+        node = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        
+        for _ in range(self.max_depth):
+            go_right = values.take(row_offset + self.feature.take(node)) > self.threshold.take(node)
+            node = self.children.take(2 * node + go_right)
+        
+        return self.value[node].mean(axis=1)
+
+
+class ParityCheckedEngine:
+    """Serve an engine's output while comparing every call against the sklearn estimator"""
+    
+    def __init__(self, engine: Any, reference: Any, tolerance: float = PARITY_TOLERANCE):
+        self.engine = engine
+        self.reference = reference
+        self.tolerance = tolerance
+        self.name = f"{engine.name}+parity"
+        self.checked = 0
+        self.mismatches = 0
+        self.max_difference = 0.0
+    
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        out = self.engine.predict_proba(X)
+        difference = float(np.max(np.abs(out - np.asarray(self.reference.predict_proba(X), dtype=np.float64))))
+        self.checked += len(X)
+        self.max_difference = max(self.max_difference, difference)
+        if difference > self.tolerance:
+            self.mismatches += 1
+            logger.warning(f"{self.engine.name} engine differs from sklearn by {difference:.2e}")
+        return out
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.engine.stats(),
+            "engine": self.name,
+            "parity_rows_checked": self.checked,
+            "parity_mismatches": self.mismatches,
+            "parity_max_difference": self.max_difference
+        }
+
+
+def _iteration_range(estimator: Any):
+    # Match XGBClassifier.predict_proba, which stops at best_iteration after early stopping
+    best = getattr(estimator, 'best_iteration', None) if hasattr(estimator, 'best_score') else None
+    return (0, best + 1) if best is not None else (0, 0)
+
+
+def native_booster(engine: Any, estimator: Any = None) -> Optional[BoosterEngine]:
+    """
+    The native booster behind a tree engine, else the estimator's own
+    
+    For calls only the booster implements (e.g. contributions). A bundle's
+    deferred booster is built here on first use.
+    """
+    # Unwrap parity checking, then the flat engine's fallback and its deferral
+    engine = getattr(engine, 'engine', engine)
+    engine = getattr(engine, 'fallback', None) or engine
+    engine = getattr(engine, 'engine', engine)
+    if isinstance(engine, BoosterEngine):
+        return engine
+    if hasattr(estimator, 'get_booster'):
+        booster = estimator.get_booster()
+        objective = json.loads(booster.save_config())['learner']['objective']['name']
+        return BoosterEngine(booster, objective, _iteration_range(estimator))
+    return None
+
+
+def _probe_matrix(n_features: int, rows: int = FLAT_ENGINE_MAX_ROWS) -> np.ndarray:
+    """Deterministic mix of one-hot-like, numeric and missing values"""
+    rng = np.random.default_rng(0)
+    X = rng.integers(0, 2, size=(rows, n_features)).astype(np.float32)
+    X[rows // 2:] *= rng.uniform(0, 300, size=(rows - rows // 2, n_features)).astype(np.float32)
+    X[rng.random((rows, n_features)) < 0.1] = np.nan
+    return X
+
+
+def _probe_difference(flat: FlatTreeEngine, booster: BoosterEngine, n_features: int) -> float:
+    """Largest probability difference between the flat walk and the booster on a probe batch"""
+    X = _probe_matrix(n_features)
+    # Single-threaded, so no OpenMP pool exists if the launcher forks workers after loading
+    booster.booster.set_param({'nthread': 1})
+    try:
+        expected = booster.predict_proba(X)
+    finally:
+        booster.booster.set_param({'nthread': 0})
+    return float(np.max(np.abs(flat.predict_proba(X) - expected)))
+
+
+def build_tree_engine(
+    estimator: Any,
+    fingerprint: str,
+    mode: str = 'flat',
+    parity: bool = False,
+    version: str = DEFAULT_VERSION
+) -> Optional[Any]:
+    """
+    Build the configured engine for an XGBoost estimator
+    
+    Returns None (use the sklearn estimator) when the mode is "sklearn" or the
+    estimator is not XGBoost. A flat engine that disagrees with the booster on
+    a probe batch is dropped in favour of the booster.
+    """
+    if mode == 'sklearn' or not hasattr(estimator, 'get_booster'):
+        return None
+    if mode not in ('flat', 'booster'):
+        raise ValueError(f"Unknown tree engine: {mode}")
+    
+    start = time.perf_counter()
+    path = export_booster(estimator, fingerprint, version=version)
+    iteration_range = _iteration_range(estimator)
+    engine = BoosterEngine.load(path, iteration_range)
+    
+    difference = 0.0
+    if mode == 'flat':
+        flat = FlatTreeEngine.from_booster(engine.booster, iteration_range)
+        if flat is None:
+            logger.info("Falling back to the native booster engine")
+        else:
+            difference = _probe_difference(flat, engine, int(estimator.n_features_in_))
+            if difference > PARITY_TOLERANCE:
+                # The booster is the probe's reference, so it is still far faster than sklearn
+                logger.warning(f"Flat engine differs from the booster by {difference:.2e} - using the native booster")
+            else:
+                flat.fallback = engine
+                engine = flat
+    
+    logger.info(f"Built {engine.name} tree engine in {time.perf_counter() - start:.2f}s (probe difference {difference:.1e})")
+    return ParityCheckedEngine(engine, estimator) if parity else engine
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from model_loader import model_loader, initialize_models
+    
+    initialize_models()
+    if model_loader.estimator is None or not hasattr(model_loader.estimator, 'get_booster'):
+        print("Loaded model is not an XGBoost estimator - nothing to export")
+        sys.exit(1)
+    
+    path = export_booster(model_loader.estimator, model_loader.model_fingerprint, version=model_loader.registry_version)
+    print(f"Native booster ready: {path}")
@@ -0,0 +1,205 @@
+"""
+Server-side what-if sessions for slider-driven UIs
+
+A session holds one validated patient and its encoded feature row. A change
+to a few fields is validated against the whole patient but re-encodes only
+those fields' columns, and a sweep over one field is scored as a single
+matrix (ModelLoader.predict_variants). Sessions expire after a period without
+use. With a file backend every worker on the host sees every session, so the
+forked workers of the launcher can serve any call.
+"""
+import asyncio
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .config import (
+        ALLOWED_KEYS, WHATIF_MAX_SESSIONS, WHATIF_SESSION_TTL_SECONDS, WHATIF_SESSION_BACKEND, WHATIF_SESSION_DIR
+    )
+    from .cache import FileCacheBackend
+    from .schemas import PatientInput
+except ImportError:
+    from config import (
+        ALLOWED_KEYS, WHATIF_MAX_SESSIONS, WHATIF_SESSION_TTL_SECONDS, WHATIF_SESSION_BACKEND, WHATIF_SESSION_DIR
+    )
+    from cache import FileCacheBackend
+    from schemas import PatientInput
+
+
+def apply_changes(patient: Dict[str, Any], changes: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Validate a sanitized patient with some fields changed
+    
+    Returns (updated patient, changed fields) - the changed fields map to
+    their validated new values, or None when the change cleared them.
+    Raises pydantic.ValidationError like PatientInput.
+    """
+    data = PatientInput.model_validate({**patient, **changes}).model_dump(exclude_none=True)
+    updated = {k: v for k, v in data.items() if k in ALLOWED_KEYS}
+    changed = {
+        key: updated.get(key)
+        for key in patient.keys() | updated.keys()
+        if patient.get(key) != updated.get(key)
+    }
+    return updated, changed
+
+
+class WhatIfSession:
+    """One patient being explored, with its encoded row once it has been scored"""
+    
+    __slots__ = (
+        'session_id', 'patient', 'prakriti_output', 'row', 'model_token', 'revision', 'expires_at', 'update_lock'
+    )
+    
+    def __init__(self, session_id: str, patient: Dict[str, Any], prakriti_output: Optional[Dict[str, Any]] = None):
+        self.session_id = session_id
+        self.patient = patient
+        self.prakriti_output = prakriti_output
+        # Encoded under model_token - rebuilt by the loader after a model swap
+        self.row: Optional[np.ndarray] = None
+        self.model_token: Optional[str] = None
+        # Changes with every save, so other workers notice their copy is out of date
+        self.revision: Optional[str] = None
+        self.expires_at = 0.0
+        # Changes are applied one at a time, each to the patient the previous one left
+        self.update_lock = asyncio.Lock()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "patient": self.patient,
+            "prakriti_output": self.prakriti_output,
+            "row": self.row.tolist() if self.row is not None else None,
+            "row_dtype": str(self.row.dtype) if self.row is not None else None,
+            "model_token": self.model_token,
+            "revision": self.revision
+        }
+    
+    @classmethod
+    def from_dict(cls, session_id: str, data: Dict[str, Any]) -> "WhatIfSession":
+        session = cls(session_id, data["patient"], data.get("prakriti_output"))
+        if data.get("row") is not None:
+            session.row = np.asarray(data["row"], dtype=data["row_dtype"])
+            session.model_token = data.get("model_token")
+        session.revision = data.get("revision")
+        return session
+
+
+class WhatIfSessionStore:
+    """
+    LRU-bounded what-if sessions, each expiring ttl seconds after its last use
+    
+    With a backend, each session's patient and encoded row are also written
+    there on every change. A worker that does not hold a session, or holds
+    an older revision of it, loads it from the backend, so any worker can
+    serve any call. Changes from different workers are last-writer-wins.
+    """
+    
+    def __init__(self, max_sessions: int = 1000, ttl: float = 1800.0, backend: Optional[FileCacheBackend] = None):
+        self.max_sessions = max(1, max_sessions)
+        self.ttl = ttl
+        self.backend = backend
+        self._sessions: "OrderedDict[str, WhatIfSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_loads = 0
+    
+    def _insert(self, session: WhatIfSession):
+        session.expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+    
+    def create(self, patient: Dict[str, Any], prakriti_output: Optional[Dict[str, Any]] = None) -> WhatIfSession:
+        session = WhatIfSession(secrets.token_urlsafe(16), patient, prakriti_output)
+        self._insert(session)
+        with self._lock:
+            self.created += 1
+        self.save(session)
+        return session
+    
+    def save(self, session: WhatIfSession):
+        """Publish a session's current patient and row to the other workers"""
+        if self.backend is not None:
+            session.revision = secrets.token_hex(8)
+            self.backend.set(session.session_id, session.to_dict())
+    
+    def _get_local(self, session_id: str) -> Optional[WhatIfSession]:
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if session.expires_at <= now:
+                del self._sessions[session_id]
+                self.expirations += 1
+                return None
+            session.expires_at = now + self.ttl
+            self._sessions.move_to_end(session_id)
+            return session
+    
+    def get(self, session_id: str) -> Optional[WhatIfSession]:
+        """Return a live session and extend its lifetime"""
+        session = self._get_local(session_id)
+        if self.backend is None:
+            return session
+        
+        shared = self.backend.get(session_id)
+        if shared is None:
+            # Expired, or deleted through another worker
+            with self._lock:
+                self._sessions.pop(session_id, None)
+            return None
+        if session is not None and session.revision == shared.get("revision"):
+            self.backend.touch(session_id)
+            return session
+        
+        session = WhatIfSession.from_dict(session_id, shared)
+        self._insert(session)
+        self.backend.touch(session_id)
+        with self._lock:
+            self.shared_loads += 1
+        return session
+    
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+        if self.backend is not None:
+            deleted = self.backend.delete(session_id) or deleted
+        return deleted
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "file" if self.backend is not None else "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "created": self.created,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared_loads": self.shared_loads
+        }
+
+
+def _create_store() -> WhatIfSessionStore:
+    backend = None
+    if WHATIF_SESSION_BACKEND == 'file':
+        backend = FileCacheBackend(
+            WHATIF_SESSION_DIR,
+            ttl=WHATIF_SESSION_TTL_SECONDS,
+            max_entries=WHATIF_MAX_SESSIONS
+        )
+    return WhatIfSessionStore(WHATIF_MAX_SESSIONS, WHATIF_SESSION_TTL_SECONDS, backend)
+
+
+# Global what-if session store
+whatif_sessions = _create_store()
@@ -83,6 +83,108 @@ router.post('/predict', async (req, res) => {
   }
 });
 
+/**
+ * Streaming bulk prediction endpoint
+ * Pipes an NDJSON or CSV upload to the Python ML service and streams the
+ * NDJSON results back unbuffered (express.json() leaves these bodies unread)
+ */
+router.post('/predict/stream', async (req, res) => {
+  try {
+    const response = await axios.post(
+      `${ML_SERVICE_URL}/api/model/predict/stream`,
+      req,
+      {
+        headers: {
+          'Content-Type': req.headers['content-type'] || 'application/x-ndjson'
+        },
+        responseType: 'stream',
+        maxBodyLength: Infinity,
+        validateStatus: () => true,
+        timeout: 0 // bulk uploads run as long as the upload does
+      }
+    );
+
+    res.status(response.status);
+    res.setHeader('Content-Type', response.headers['content-type'] || 'application/x-ndjson');
+    response.data.pipe(res);
+    // Stop the upstream scoring when the client goes away
+    res.on('close', () => response.data.destroy());
+  } catch (error) {
+    if (res.headersSent) {
+      res.end();
+    } else if (error.request) {
+      res.status(503).json({
+        success: false,
+        error: {
+          message: 'ML service unavailable',
+          code: 'ML_SERVICE_UNAVAILABLE',
+          status: 503
+        }
+      });
+    } else {
+      res.status(500).json({
+        success: false,
+        error: {
+          message: 'Internal server error',
+          code: 'INTERNAL_ERROR',
+          status: 500,
+          details: error.message
+        }
+      });
+    }
+  }
+});
+
+/**
+ * Prakriti inference endpoint
+ * Proxies to Python ML service
+ */
+router.post('/prakriti', async (req, res) => {
+  try {
+    const response = await axios.post(
+      `${ML_SERVICE_URL}/api/model/prakriti`,
+      req.body,
+      {
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        timeout: 30000 // 30 second timeout
+      }
+    );
+    
+    res.json({
+      success: true,
+      data: response.data
+    });
+  } catch (error) {
+    if (error.response) {
+      res.status(error.response.status).json({
+        success: false,
+        error: error.response.data
+      });
+    } else if (error.request) {
+      res.status(503).json({
+        success: false,
+        error: {
+          message: 'ML service unavailable',
+          code: 'ML_SERVICE_UNAVAILABLE',
+          status: 503
+        }
+      });
+    } else {
+      res.status(500).json({
+        success: false,
+        error: {
+          message: 'Internal server error',
+          code: 'INTERNAL_ERROR',
+          status: 500,
+          details: error.message
+        }
+      });
+    }
+  }
+});
+
 /**
  * Diet plan generation endpoint
  * Proxies to Python ML service
@@ -84,7 +84,9 @@ const startServer = async () => {
       console.log(`🤖 Model endpoints: http://localhost:${PORT}/api/model`);
       console.log(`   - Health: GET /api/model/health`);
       console.log(`   - Predict: POST /api/model/predict`);
+      console.log(`   - Predict (stream): POST /api/model/predict/stream`);
       console.log(`   - Diet Plan: POST /api/model/dietplan`);
+      console.log(`   - Prakriti: POST /api/model/prakriti`);
       console.log(`👤 Patient endpoints: http://localhost:${PORT}/api/patients`);
       console.log(`   - Add: POST /api/patients`);
       console.log(`   - Get All: GET /api/patients`);